@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import numpy as np
+from settings import *
+
+
+class AssetCache:
+    # bump when the layout of any cached group changes
+    VERSION = 4
+    ALIGNMENT = 16
+
+    def __init__(self, wad_paths, cache_dir=CACHE_DIR, enabled=USE_ASSET_CACHE):
+        self.enabled = enabled
+        self.key = self.get_key(wad_paths) if enabled else None
+        self.path = os.path.join(cache_dir, self.key) if enabled else None
+
+    def get_key(self, wad_paths):
+        # content hash of the whole WAD stack, so any change invalidates the cache
+        sha = hashlib.sha1(f'version {self.VERSION}'.encode())
+        for wad_path in wad_paths:
+            with open(wad_path, 'rb') as wad_file:
+                while chunk := wad_file.read(1 << 20):
+                    sha.update(chunk)
+        return sha.hexdigest()
+
+    def get_paths(self, group):
+        base = os.path.join(self.path, group)
+        return base + '.npy', base + '.json'
+
+    def has(self, group):
+        # the index is written last, its presence means the whole group is saved
+        return self.enabled and os.path.exists(self.get_paths(group)[1])
+
+    def load(self, group):
+        # -> {name: read-only array mapped from the cache file} or None
+        if not self.enabled:
+            return None
+        blob_path, index_path = self.get_paths(group)
+        if not os.path.exists(index_path):
+            return None
+
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+        blob = np.load(blob_path, mmap_mode='r')
+
+        arrays = {}
+        for name, (offset, num_bytes, descr, shape) in index.items():
+            dtype = np.lib.format.descr_to_dtype(descr)
+            arrays[name] = np.asarray(blob[offset: offset + num_bytes]).view(dtype).reshape(shape)
+        return arrays
+
+    def save(self, group, arrays):
+        # all arrays of a group go into one flat uint8 .npy plus a json index
+        if not self.enabled:
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        blob_path, index_path = self.get_paths(group)
+
+        index, offset = {}, 0
+        for name, array in arrays.items():
+            descr = np.lib.format.dtype_to_descr(array.dtype)
+            index[name] = offset, array.nbytes, descr, array.shape
+            offset += -(-array.nbytes // self.ALIGNMENT) * self.ALIGNMENT
+
+        blob = np.lib.format.open_memmap(blob_path + '.tmp', mode='w+',
+                                         dtype=np.uint8, shape=(offset,))
+        for name, array in arrays.items():
+            start, num_bytes = index[name][:2]
+            blob[start: start + num_bytes] = np.ascontiguousarray(array).view(np.uint8).ravel()
+        blob.flush()
+        del blob
+        os.replace(blob_path + '.tmp', blob_path)
+
+        # the index is written last, a group without one is not cached
+        with open(index_path + '.tmp', 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(index_path + '.tmp', index_path)
@@ -1,190 +1,371 @@
 from settings import *
-from data_types import PatchHeader
+from concurrent.futures import ProcessPoolExecutor
+import threading
+import struct
+import zlib
 import pygame as pg
+import numpy as np
+from wad_reader import WADReader
+
+
+def decode_patch(lump):
+    # raw patch lump -> palette indices and alpha mask, both (width, height)
+    width, height = struct.unpack_from('<HH', lump, 0)
+    column_offsets = struct.unpack_from(f'<{width}I', lump, 8)
+
+    lump_array = np.frombuffer(lump, dtype=np.uint8)
+    indices = np.zeros((width, height), dtype=np.uint8)
+    mask = np.zeros((width, height), dtype=np.bool_)
+
+    for ix, offs in enumerate(column_offsets):
+        # posts: top_delta (B), length (B), padding (B), length x B, padding (B)
+        top_delta = lump[offs]
+        while top_delta != 0xFF:
+            length = lump[offs + 1]
+            visible = min(length, height - top_delta)
+            if visible > 0:
+                indices[ix, top_delta: top_delta + visible] = lump_array[
+                    offs + 3: offs + 3 + visible]
+                mask[ix, top_delta: top_delta + visible] = True
+            offs += length + 4
+            top_delta = lump[offs]
+    return indices, mask
+
+
+def decode_flat(lump):
+    # 64 x 64 palette indices stored row by row, transposed to (x, y)
+    size = min(len(lump), 64 * 64)
+    indices = np.zeros(64 * 64, dtype=np.uint8)
+    indices[:size] = np.frombuffer(lump, dtype=np.uint8, count=size)
+    mask = np.arange(64 * 64) < size
+    # C-contiguous like the wall textures, so the kernels see a single array type
+    return np.ascontiguousarray(indices.reshape(64, 64).T), np.ascontiguousarray(mask.reshape(64, 64).T)
 
 
 class Patch:
-    def __init__(self, asset_data, name, is_sprite=True):
+    def __init__(self, asset_data, name, decoded, is_sprite=True):
         self.asset_data = asset_data
         self.name = name
         #
-        self.palette = asset_data.palette
-        self.header, self.patch_columns = self.load_patch_columns(name)
-        self.width = self.header.width
-        self.height = self.header.height
+        self.indices, self.mask = decoded
+        self.width, self.height = self.indices.shape
         #
-        self.image = self.get_image()
         if is_sprite:
-            self.image = pg.transform.scale(self.image, (
-                self.width * SCALE, self.height * SCALE)
-                )
-
-    def load_patch_columns(self, patch_name):
-        reader = self.asset_data.reader
-        patch_index = self.asset_data.get_lump_index(patch_name)
-        patch_offset = reader.directory[patch_index]['lump_offset']
-        #
-        patch_header = self.asset_data.reader.read_patch_header(patch_offset)
-        patch_columns = []
-
-        for i in range(patch_header.width):
-            offs = patch_offset + patch_header.column_offset[i]
-            while True:
-                patch_column, offs = reader.read_patch_column(offs)
-                patch_columns.append(patch_column)
-                if patch_column.top_delta == 0xFF:
-                    break
-        return patch_header, patch_columns
+            self.image = self.get_image()
 
     def get_image(self):
-        image = pg.Surface([self.width, self.height])
-        image.fill(COLOR_KEY)
-        image.set_colorkey(COLOR_KEY)
-
-        ix = 0
-        for column in self.patch_columns:
-            if column.top_delta == 0xFF:
-                ix += 1
-                continue
-
-            for iy in range(column.length):
-                color_idx = column.data[iy]
-                color = self.palette[color_idx]
-                image.set_at([ix, iy + column.top_delta], color)
-
-        return image
+        return self.asset_data.to_rgb(self.indices, self.mask)
 
 
 class Texture:
-    def __init__(self, asset_data, tex_map):
+    def __init__(self, asset_data, tex_map, p_names):
         self.asset_data = asset_data
         self.tex_map = tex_map
-        self.image = self.get_image()
+        self.p_names = p_names
+        self.indices, self.mask = self.composite()
+        # 8-bit palette indices, texels not covered by any patch are 0
+        self.image = self.indices
+
+    def composite(self):
+        # place the patches with array slicing, clipped to the texture bounds
+        tex_w, tex_h = self.tex_map.width, self.tex_map.height
+        indices = np.zeros((tex_w, tex_h), dtype=np.uint8)
+        mask = np.zeros((tex_w, tex_h), dtype=np.bool_)
 
-    def get_image(self):
-        image = pg.Surface([self.tex_map.width, self.tex_map.height])
-        image.fill(COLOR_KEY)
-        image.set_colorkey(COLOR_KEY)
-        #
         for patch_map in self.tex_map.patch_maps:
-            patch = self.asset_data.texture_patches[patch_map.p_name_index]
-            image.blit(patch.image, (patch_map.x_offset, patch_map.y_offset))
-        # --------------------------------- #
-        image = pg.surfarray.array3d(image)
-        # --------------------------------- #
-        return image
+            patch = self.asset_data.get_patch(self.p_names[patch_map.p_name_index])
+            if patch is None:
+                continue
+            x, y = patch_map.x_offset, patch_map.y_offset
+
+            x1, x2 = max(x, 0), min(x + patch.width, tex_w)
+            y1, y2 = max(y, 0), min(y + patch.height, tex_h)
+            if x1 >= x2 or y1 >= y2:
+                continue
+
+            patch_mask = patch.mask[x1 - x: x2 - x, y1 - y: y2 - y]
+            patch_indices = patch.indices[x1 - x: x2 - x, y1 - y: y2 - y]
+            indices[x1: x2, y1: y2][patch_mask] = patch_indices[patch_mask]
+            mask[x1: x2, y1: y2] |= patch_mask
+        return indices, mask
 
 
 # ---------------------------------------------------- #
 class Flat:
-    def __init__(self, asset_data, flat_data):
-        self.flat_data = flat_data
-        self.palette = asset_data.palette
-        self.image = self.get_image()
-
-    def get_image(self):
-        image = pg.Surface([64, 64])
-        #
-        for i, color_idx in enumerate(self.flat_data):
-            ix = i % 64
-            iy = i // 64
-            color = self.palette[color_idx]
-            image.set_at([ix, iy], color)
-        # --------------------------------- #
-        image = pg.surfarray.array3d(image)
-        # --------------------------------- #
-        return image
+    def __init__(self, asset_data, decoded):
+        self.asset_data = asset_data
+        self.indices, self.mask = decoded
+        # 8-bit palette indices
+        self.image = self.indices
 # --------------------------------------------------- #
 
 
+class ProgressiveTextures(dict):
+    # textures still being decoded read as a uniform 64 x 64 placeholder
+    def __init__(self):
+        super().__init__()
+        self.placeholders = {}
+
+    def __missing__(self, tex_name):
+        if tex_name not in self.placeholders:
+            color_idx = zlib.crc32(tex_name.encode()) % 256
+            self.placeholders[tex_name] = np.full((64, 64), color_idx, dtype=np.uint8)
+        return self.placeholders[tex_name]
+
+
 class AssetData:
     def __init__(self, wad_data):
         self.wad_data = wad_data
         self.reader = wad_data.reader
+        self.cache = wad_data.cache
         self.get_lump_index = wad_data.get_lump_index
+        # PNAMES lump index -> patch names
+        self.p_names = {}
+        # decoding runs in worker processes when ASSET_WORKERS > 0
+        self.num_workers = ASSET_WORKERS
+        self.pool = None
+        # wall texture definitions and the patches decoded for them so far
+        self.texture_maps = None
+        self.texture_patches = {}
+        # background thread of the progressive startup, if any
+        self.loader = None
 
-        # palettes
-        self.palettes = self.wad_data.get_lump_data(
-            reader_func=self.reader.read_palette,
-            lump_index=self.get_lump_index('PLAYPAL'),
-            num_bytes=256 * 3
-        )
+        # palettes as (256, 3) lookup tables, colormaps as (34, 256) light tables
+        palettes = self.load_palettes()
+        self.palette_luts = palettes['PLAYPAL']
+        self.colormaps = palettes['COLORMAP']
+        self.palettes = [list(map(tuple, palette)) for palette in self.palette_luts.tolist()]
         # current palette
         self.palette_idx = 0
         self.palette = self.palettes[self.palette_idx]
+        self.palette_lut = self.palette_luts[self.palette_idx]
+
+        # --------------------------------------------------------------------------- #
+        # sky
+        self.sky_id = wad_data.SKY_FLAT
+        self.sky_tex_name = 'SKY1'
+        # --------------------------------------------------------------------------- #
 
-        # sprites
-        self.sprites = self.get_sprites(start_marker='S_START', end_marker='S_END')
+        is_cached = self.cache.has('sprites') and self.cache.has('textures')
+        if PROGRESSIVE_LOADING and not is_cached:
+            # the first frame does not wait for the assets: only the sky is decoded
+            # up front, the rest is filled in by a background thread started after it
+            self.sprites = {}
+            self.textures = ProgressiveTextures()
+            self.textures |= self.get_textures([self.sky_tex_name])
+            self.loader = threading.Thread(target=self.load_progressive, daemon=True)
+        else:
+            # sprites
+            self.sprites = self.load_sprites()
+            # wall and flat textures, stored as palette indices
+            self.textures = self.load_textures()
+            self.shutdown_workers()
+        self.sky_tex = self.textures[self.sky_tex_name]
 
-        # texture patch names
-        self.p_names = self.wad_data.get_lump_data(
-            self.reader.read_string,
-            self.get_lump_index('PNAMES'),
-            num_bytes=8,
-            header_length=4
-        )
+    def decode_lumps(self, decode_func, lump_indices):
+        # decode independent lumps, sharded across worker processes when enabled
+        if not self.num_workers:
+            return [self.decode_lump(decode_func, idx) for idx in lump_indices]
+
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.num_workers)
+        lumps = [self.decode_lump(bytes, idx) for idx in lump_indices]
+        chunk_size = max(1, len(lumps) // (4 * self.num_workers))
+        return list(self.pool.map(decode_func, lumps, chunksize=chunk_size))
+
+    def decode_lump(self, decode_func, lump_index):
+        # the view is released as soon as the lump is decoded, so the reader can close
+        with self.reader.get_lump_view(lump_index) as lump:
+            return decode_func(lump)
+
+    def shutdown_workers(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def load_palettes(self):
+        palettes = self.cache.load('palettes')
+        if palettes is None:
+            playpal = self.wad_data.get_lump_data(
+                reader_name='read_palette',
+                lump_index=self.get_lump_index('PLAYPAL'),
+                num_bytes=256 * 3
+            )
+            colormap = self.decode_lump(bytes, self.get_lump_index('COLORMAP'))
+            palettes = {
+                'PLAYPAL': np.array(playpal, dtype=np.uint8),
+                'COLORMAP': np.frombuffer(colormap, dtype=np.uint8).reshape(-1, 256).copy()
+            }
+            self.cache.save('palettes', palettes)
+        return palettes
+
+    def to_rgb(self, indices, mask=None, background=COLOR_KEY):
+        # palette indices -> (..., 3) RGB in a single fancy-indexing pass
+        image = self.palette_lut[indices]
+        if mask is not None:
+            image[~mask] = background
+        return image
+
+    def load_sprites(self):
+        images = self.cache.load('sprites')
+        if images is None:
+            images = self.get_sprites()
+            self.cache.save('sprites', images)
+        return {name: self.get_sprite_image(image) for name, image in images.items()}
+
+    @staticmethod
+    def get_sprite_image(image):
+        image = pg.surfarray.make_surface(image)
+        image.set_colorkey(COLOR_KEY)
+        return pg.transform.scale(image, (image.get_width() * SCALE, image.get_height() * SCALE))
+
+    def load_textures(self):
+        textures = self.cache.load('textures')
+        if textures is None:
+            textures = self.get_textures()
+            # flat textures
+            textures |= self.get_flats()
+            self.cache.save('textures', textures)
+        return textures
+
+    def start_loader(self):
+        if self.loader is not None:
+            self.loader.start()
 
-        # texture patches
-        self.texture_patches = [
-            Patch(self, p_name, is_sprite=False) for p_name in self.p_names
-        ]
+    def load_progressive(self):
+        # textures of the map nearest to the player start first, then everything else
+        flat_names = self.reader.get_namespace('flats').keys()
+        # a flat replaces a wall texture of the same name, as in load_textures
+        for tex_name in self.get_map_texture_names():
+            if tex_name in flat_names:
+                self.textures |= self.get_flats(flat_names=[tex_name])
+            elif tex_name in self.texture_maps:
+                self.textures |= self.get_textures([tex_name])
 
-        # wall textures
-        texture_maps = self.load_texture_maps(texture_lump_name='TEXTURE1')
-        if self.get_lump_index('TEXTURE2'):
-            texture_maps += self.load_texture_maps(texture_lump_name='TEXTURE2')
+        self.textures |= self.get_textures(
+            self.texture_maps.keys() - self.textures.keys() - flat_names)
+        self.textures |= self.get_flats(flat_names=flat_names - self.textures.keys())
+        sprites = self.get_sprites()
+        self.sprites |= {name: self.get_sprite_image(image) for name, image in sprites.items()}
 
-        self.textures = {
-            tex_map.name: Texture(self, tex_map).image for tex_map in texture_maps
+        self.cache.save('sprites', sprites)
+        self.cache.save('textures', dict(self.textures))
+        self.shutdown_workers()
+        self.reader.close()
+
+    def get_map_texture_names(self):
+        # wall and flat names of every seg, ordered by the distance of the seg to the player start
+        map_arrays = self.wad_data.map_arrays
+        segs, vertexes = map_arrays.segments, map_arrays.vertexes
+        player_start = map_arrays.things[0]
+        seg_x = vertexes['x'][segs['start_vertex_id']] - float(player_start['x'])
+        seg_y = vertexes['y'][segs['start_vertex_id']] - float(player_start['y'])
+        dist = np.hypot(seg_x, seg_y)
+
+        # minisegs have no sidedef
+        is_drawn = map_arrays.seg_front_sidedef_ids >= 0
+        dist = dist[is_drawn]
+        sides = map_arrays.sidedefs[map_arrays.seg_front_sidedef_ids[is_drawn]]
+        sectors = map_arrays.sectors[map_arrays.seg_front_sector_ids[is_drawn]]
+        names = np.concatenate([
+            sides['middle_texture'], sides['upper_texture'], sides['lower_texture'],
+            sectors['floor_texture'], sectors['ceil_texture']
+        ])
+        order = np.argsort(np.tile(dist, 5), kind='stable')
+        unique_names, first = np.unique(names[order], return_index=True)
+        tex_names = [WADReader.decode_string(name) for name in unique_names[np.argsort(first)]]
+        return [tex_name for tex_name in tex_names if tex_name != '-']
+
+    def get_texture_maps(self):
+        # wall textures of every TEXTURE1 / TEXTURE2 in load order,
+        # a later definition replaces an earlier one with the same name
+        texture_lumps = sorted(
+            self.reader.get_lump_indices('TEXTURE1') + self.reader.get_lump_indices('TEXTURE2')
+        )
+        texture_maps = {}
+        for tex_idx in texture_lumps:
+            p_names = self.get_p_names(tex_idx)
+            for tex_map in self.load_texture_maps(tex_idx):
+                texture_maps[tex_map.name] = tex_map, p_names
+        return texture_maps
+
+    def get_textures(self, tex_names=None):
+        if self.texture_maps is None:
+            self.texture_maps = self.get_texture_maps()
+        tex_names = self.texture_maps.keys() if tex_names is None else tex_names
+
+        # only the winning definitions are composited, with the patches they use
+        p_names_used = {
+            p_names[patch_map.p_name_index]
+            for tex_map, p_names in map(self.texture_maps.get, tex_names)
+            for patch_map in tex_map.patch_maps
+        }
+        self.texture_patches |= self.get_patches(sorted(p_names_used - self.texture_patches.keys()))
+        return {
+            tex_name: Texture(self, *self.texture_maps[tex_name]).image for tex_name in tex_names
         }
-        # flat textures
-        self.textures |= self.get_flats()
 
-        # --------------------------------------------------------------------------- #
-        # sky
-        self.sky_id = 'F_SKY1'
-        self.sky_tex_name = 'SKY1'
-        self.sky_tex = self.textures[self.sky_tex_name]
-        # --------------------------------------------------------------------------- #
+    def get_p_names(self, tex_idx):
+        # texture patch names: the PNAMES of the same WAD, else the last one loaded before it
+        wad_id = self.reader.directory[tex_idx]['wad_id']
+        p_names_idx = [
+            idx for idx in self.reader.get_lump_indices('PNAMES')
+            if self.reader.directory[idx]['wad_id'] <= wad_id
+        ][-1]
 
-    def get_flats(self, start_marker='F_START', end_marker='F_END'):
-        idx1 = self.get_lump_index(start_marker) + 1
-        idx2 = self.get_lump_index(end_marker)
-        flat_lumps = self.reader.directory[idx1: idx2]
+        if p_names_idx not in self.p_names:
+            self.p_names[p_names_idx] = self.wad_data.get_lump_data(
+                'read_string',
+                p_names_idx,
+                num_bytes=8,
+                header_length=4
+            )
+        return self.p_names[p_names_idx]
 
-        flats = {}
-        for flat_lump in flat_lumps:
-            offset = flat_lump['lump_offset']
-            size = flat_lump['lump_size']  # 64 x 64
+    def get_patches(self, p_names):
+        # patches missing from every WAD are left out
+        patch_lumps = {
+            p_name: lump_index for p_name in p_names
+            if (lump_index := self.get_lump_index(p_name)) is not None
+        }
+        decoded = self.decode_lumps(decode_patch, patch_lumps.values())
+        return {
+            p_name: Patch(self, p_name, patch, is_sprite=False)
+            for p_name, patch in zip(patch_lumps, decoded)
+        }
 
-            flat_data = []
-            for i in range(size):
-                flat_data.append(self.reader.read_1_byte(offset + i, byte_format='B'))
+    def get_patch(self, p_name):
+        # None for patches missing from every WAD
+        return self.texture_patches.get(p_name)
 
-            flat_name = flat_lump['lump_name']
-            flats[flat_name] = Flat(self, flat_data).image
-        return flats
+    def get_flats(self, namespace='flats', flat_names=None):
+        flat_lumps = self.reader.get_namespace(namespace)
+        if flat_names is not None:
+            flat_lumps = {flat_name: flat_lumps[flat_name] for flat_name in flat_names}
+        decoded = self.decode_lumps(decode_flat, flat_lumps.values())  # 64 x 64
+        return {flat_name: Flat(self, flat).image for flat_name, flat in zip(flat_lumps, decoded)}
     # --------------------------------------------------------------------------- #
 
-    def load_texture_maps(self, texture_lump_name):
-        tex_idx = self.get_lump_index(texture_lump_name)
+    def load_texture_maps(self, tex_idx):
+        lump_reader = self.reader.get_lump_reader(tex_idx)
         offset = self.reader.directory[tex_idx]['lump_offset']
 
-        texture_header = self.reader.read_texture_header(offset)
+        texture_header = lump_reader.read_texture_header(offset)
 
         texture_maps = []
         for i in range(texture_header.texture_count):
-            tex_map = self.reader.read_texture_map(
+            tex_map = lump_reader.read_texture_map(
                 offset + texture_header.texture_data_offset[i]
             )
             texture_maps.append(tex_map)
         return texture_maps
 
-    def get_sprites(self, start_marker='S_START', end_marker='S_END'):
-        idx1 = self.get_lump_index(start_marker) + 1
-        idx2 = self.get_lump_index(end_marker)
-        lumps_info = self.reader.directory[idx1: idx2]
+    def get_sprites(self, namespace='sprites'):
+        sprite_lumps = self.reader.get_namespace(namespace)
+        decoded = self.decode_lumps(decode_patch, sprite_lumps.values())
+        # unscaled sprite images as arrays
         sprites = {
-            lump['lump_name']: Patch(self, lump['lump_name']).image for lump in lumps_info
+            sprite_name: Patch(self, sprite_name, patch).image
+            for sprite_name, patch in zip(sprite_lumps, decoded)
         }
         return sprites
@@ -0,0 +1,784 @@
+import os
+import sys
+import time
+import math
+import timeit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from wad_stack import WADStack
+
+# benchmarks run without a window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+
+def make_engine(wad_paths):
+    from main import DoomEngine
+    return DoomEngine(wad_paths[0], pwad_paths=wad_paths[1:])
+
+
+def configure(**overrides):
+    # every module star-imports the settings, so this only takes effect
+    # in a process that has not imported the engine yet
+    import settings
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+
+def run_configured(func, overrides, *args):
+    # run func in a fresh interpreter with the given settings
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        return pool.submit(func, overrides, *args).result()
+
+
+def measure_startup(overrides, wad_paths):
+    configure(**overrides)
+    engine = make_engine(wad_paths)
+    engine.update()
+    engine.draw()
+    asset_data = engine.wad_data.asset_data
+    if asset_data.loader is not None:
+        asset_data.loader.join()
+    return engine.time_to_first_frame, time.perf_counter() - engine.start_time
+
+
+def bench_startup(wad_paths):
+    # time to first frame and until every asset is decoded, without the asset cache
+    for progressive in (False, True):
+        overrides = {'PROGRESSIVE_LOADING': progressive, 'USE_ASSET_CACHE': False}
+        first_frame, all_loaded = run_configured(measure_startup, overrides, wad_paths)
+        print(f'progressive={progressive}: first frame {first_frame:.3f} s, '
+              f'all assets {all_loaded:.3f} s')
+
+
+def bench_assets(wad_paths, num_workers=os.cpu_count()):
+    # serial vs process-pool decoding of sprites, texture patches and flats
+    engine = make_engine(wad_paths)
+    wad_data, asset_data = engine.wad_data, engine.wad_data.asset_data
+    # the engine closes its reader once loading is done
+    wad_data.reader = asset_data.reader = WADStack(wad_paths)
+
+    timings = {}
+    for workers in (0, num_workers):
+        asset_data.num_workers = workers
+        t0 = time.perf_counter()
+        asset_data.get_sprites()
+        asset_data.get_textures()
+        asset_data.get_flats()
+        asset_data.shutdown_workers()
+        timings[workers] = time.perf_counter() - t0
+        print(f'workers={workers}: {timings[workers]:.3f} s')
+
+    asset_data.reader.close()
+    print(f'speedup: {timings[0] / timings[num_workers]:.2f}x')
+
+
+def bench_bsp(wad_paths, num_angles=72):
+    # compiled BSP walk vs drawing the ranges it emits, per frame from the player start,
+    # with the subtree culling against the solid walls and the PVS switched on in turn
+    engine = make_engine(wad_paths)
+    bsp, seg_handler, player = engine.bsp, engine.seg_handler, engine.player
+    engine.update()
+
+    for is_occlusion_culled, is_pvs_culled in ((False, False), (True, False), (True, True)):
+        bsp.is_occlusion_culled, bsp.is_pvs_culled = is_occlusion_culled, is_pvs_culled
+        timings = {'traversal': 0.0, 'seg drawing': 0.0}
+        num_ranges, counts = 0, 0
+        for i in range(num_angles):
+            player.angle = i * 360 / num_angles
+            seg_handler.update()
+            bsp.seg_projection.update()
+            bsp.update_pvs()
+            bsp.traverse()
+            t0 = time.perf_counter()
+            bsp.draw_ranges()
+            timings['traversal'] += bsp.traversal_time
+            timings['seg drawing'] += time.perf_counter() - t0
+            num_ranges += bsp.num_ranges
+            counts += bsp.counts
+
+        visited, outside_view, occluded, outside_pvs, projected, _ = counts / num_angles
+        print(f'occlusion culling={is_occlusion_culled}, pvs culling={is_pvs_culled}: ' +
+              ', '.join(f'{name} {total / num_angles * 1000:.3f} ms/frame'
+                        for name, total in timings.items()))
+        print(f'  {num_ranges / num_angles:.0f} seg ranges, {visited:.0f} nodes visited, '
+              f'{outside_view:.0f} culled outside the view, {occluded:.0f} occluded, '
+              f'{outside_pvs:.0f} outside the PVS, {projected:.0f} segs projected per frame')
+
+
+def legacy_clip_with_column_sets(bsp):
+    # the BSP walk clipping segs against the set of free screen columns the solid seg
+    # list replaced, in python, for comparison: the subtrees outside the view are
+    # skipped, not the occluded ones -> visible [seg_id, x1, x2] ranges, columns hashed
+    import numpy as np
+    from bsp_kernels import check_bbox, is_on_back_side, BBOX_CULLED
+    player, segs = bsp.player, bsp.engine.wad_data.segments
+    x_first, x_last = bsp.seg_handler.x_first, bsp.seg_handler.x_last
+    player_x, player_y = float(player.pos.x), float(player.pos.y)
+    view = bsp.get_view()
+    no_solid_segs = np.empty((0, 2), dtype=np.int64)
+    screen_range = set(range(x_first, x_last + 1))
+    ranges, steps = [], len(screen_range)
+
+    stack = [(bsp.root_node_id, -1, 0)]
+    while stack and screen_range:
+        node_id, check_node_id, check_side = stack.pop()
+        if check_node_id >= 0 and check_bbox(
+                bsp.node_bboxes[check_node_id, check_side], view, bsp.angle_to_x_array,
+                x_first, x_last, no_solid_segs, 0) == BBOX_CULLED:
+            continue
+        if node_id < bsp.SUB_SECTOR_IDENTIFIER:
+            front_child_id, back_child_id = bsp.node_children[node_id].tolist()
+            if is_on_back_side(bsp.node_lines, node_id, player_x, player_y):
+                stack += [(front_child_id, node_id, 0), (back_child_id, -1, 0)]
+            else:
+                stack += [(back_child_id, node_id, 1), (front_child_id, -1, 0)]
+            continue
+
+        first_seg_id, seg_count = bsp.sub_sector_segs[node_id - bsp.SUB_SECTOR_IDENTIFIER].tolist()
+        for seg_id in range(first_seg_id, first_seg_id + seg_count):
+            seg = segs[seg_id]
+            if not bsp.seg_is_drawn[seg_id]:
+                continue
+            if not (projected := legacy_project_seg(bsp, seg.start_vertex, seg.end_vertex)):
+                continue
+            x1, x2, _ = projected
+            if x1 == x2 or x2 <= x_first or x1 > x_last:
+                continue
+            curr_wall = set(range(x1, x2))
+            intersection = sorted(curr_wall & screen_range)
+            steps += len(curr_wall) + len(intersection)
+            for x in intersection:
+                if ranges and ranges[-1][0] == seg_id and ranges[-1][2] == x - 1:
+                    ranges[-1][2] = x
+                else:
+                    ranges.append([seg_id, x, x])
+            if bsp.seg_is_solid[seg_id]:
+                screen_range -= curr_wall
+    return ranges, steps
+
+
+def bench_clipping(wad_paths, num_angles=72):
+    # clipping cost per frame from the player start: the solid seg list of the compiled
+    # walk (projection included) vs the per-column sets it replaced, in python; both
+    # must find the same visible ranges
+    engine = make_engine(wad_paths)
+    bsp, player = engine.bsp, engine.player
+    engine.update()
+
+    timings = {'solid seg list': 0.0, 'column sets': 0.0}
+    steps = {name: 0 for name in timings}
+    num_mismatches = 0
+    for i in range(num_angles):
+        player.angle = i * 360 / num_angles
+        bsp.seg_projection.update()
+        bsp.update_pvs()
+        bsp.traverse()
+        timings['solid seg list'] += bsp.traversal_time
+        steps['solid seg list'] += bsp.counts[5]
+
+        t0 = time.perf_counter()
+        ranges, num_steps = legacy_clip_with_column_sets(bsp)
+        timings['column sets'] += time.perf_counter() - t0
+        steps['column sets'] += num_steps
+        num_mismatches += ranges != bsp.ranges[:bsp.num_ranges].tolist()
+
+    for name, total in timings.items():
+        print(f'{name}: {total / num_angles * 1000:.3f} ms/frame, '
+              f'{steps[name] / num_angles:.0f} steps/frame')
+    print(f'frames with different ranges: {num_mismatches} of {num_angles}')
+
+
+def bench_blockmap(wad_paths, num_points=2000, number=20):
+    # player queries at the thing positions: blockmap vs scanning every linedef for
+    # the walls near a point, then the subsector lookup and the collision test per step
+    import bsp_kernels
+    from blockmap import get_distance_to_line
+    from settings import PLAYER_RADIUS
+    engine = make_engine(wad_paths)
+    blockmap, bsp = engine.wad_data.blockmap, engine.bsp
+    things = engine.wad_data.things
+    points = [(float(thing.pos.x), float(thing.pos.y)) for thing in things]
+    lines = blockmap.lines
+
+    def scan_lines(x, y):
+        return [line_id for line_id in range(len(lines))
+                if get_distance_to_line(x, y, lines[line_id]) < PLAYER_RADIUS]
+
+    def query_blockmap(x, y):
+        return [line_id for line_id in blockmap.get_lines_near(x, y, PLAYER_RADIUS).tolist()
+                if get_distance_to_line(x, y, lines[line_id]) < PLAYER_RADIUS]
+
+    for name, func in (('linedef scan', scan_lines), ('blockmap', query_blockmap)):
+        func(*points[0])
+        t0 = time.perf_counter()
+        for x, y in points:
+            func(x, y)
+        print(f'{name}: {(time.perf_counter() - t0) / len(points) * 1e6:.1f} us/query '
+              f'({len(lines)} linedefs)')
+
+    # small steps from every thing, as a walking player takes them
+    path = [(x + 2.0 * i, y) for x, y in points for i in range(number)][:num_points]
+    root_node_id, nodes, children = bsp.root_node_id, bsp.node_lines, bsp.node_children
+    # compile first
+    bsp_kernels.find_sub_sector(root_node_id, nodes, children, *path[0])
+    blockmap.get_blocking_line(*path[0], *path[0], 0.0)
+    t0 = time.perf_counter()
+    for x, y in path:
+        bsp_kernels.find_sub_sector(root_node_id, nodes, children, x, y)
+    t1 = time.perf_counter()
+    for x, y in path:
+        blockmap.get_blocking_line(x, y, x + 2.0, y, 0.0)
+    t2 = time.perf_counter()
+    print(f'subsector lookup: {(t1 - t0) / len(path) * 1e6:.2f} us, '
+          f'collision test: {(t2 - t1) / len(path) * 1e6:.2f} us')
+
+
+def write_grid_map(wad_path, num_cells, room_size=8, cell_size=64, is_compressed=True):
+    # a PWAD replacing E1M1 with a square of num_cells x num_cells cells in rooms of
+    # room_size x room_size with stepped floors, and ZDBSP extended nodes built for the
+    # grid: every cell is cut along its diagonal into two subsectors, the cell edges
+    # inside a room and the diagonals are minisegs, the room walls are linedefs split
+    # into one seg per cell; returns the number of segs
+    import struct
+    import zlib
+    import numpy as np
+    from data_types import (THING_DTYPE, LINEDEF_DTYPE, SIDEDEF_DTYPE, VERTEX_DTYPE,
+                            SECTOR_DTYPE, EXT_NODES_VERTEX_DTYPE, EXT_NODES_SEG_DTYPE,
+                            EXT_NODES_NODE_DTYPE, SUB_SECTOR_FLAG)
+    num_rooms = num_cells // room_size
+    num_cells = num_rooms * room_size
+    room_width = room_size * cell_size
+
+    def get_room_id(room_x, room_y):
+        return room_y * num_rooms + room_x
+
+    sectors = np.zeros(num_rooms * num_rooms, dtype=SECTOR_DTYPE)
+    room_xs, room_ys = np.meshgrid(np.arange(num_rooms), np.arange(num_rooms))
+    sectors['floor_height'] = 16 * ((room_xs + room_ys) % 3).ravel()
+    sectors['ceil_height'] = 160
+    sectors['floor_texture'], sectors['ceil_texture'] = b'FLOOR4_8', b'CEIL3_5'
+    sectors['light_level'] = 160 + 32 * ((7 * room_xs + room_ys) % 3).ravel()
+
+    # room corners, the only vertexes of the linedefs
+    vertexes = np.zeros((num_rooms + 1) ** 2, dtype=VERTEX_DTYPE)
+    corner_xs, corner_ys = np.meshgrid(np.arange(num_rooms + 1), np.arange(num_rooms + 1))
+    vertexes['x'], vertexes['y'] = (corner_xs * room_width).ravel(), (corner_ys * room_width).ravel()
+
+    def get_corner_id(room_x, room_y):
+        return room_y * (num_rooms + 1) + room_x
+
+    # (start corner, end corner, front room, back room or -1) with the front on the right
+    lines, line_ids = [], {}
+    for room_y in range(num_rooms):
+        for room_x in range(num_rooms + 1):
+            start, end = get_corner_id(room_x, room_y), get_corner_id(room_x, room_y + 1)
+            if room_x == num_rooms:
+                line = end, start, get_room_id(room_x - 1, room_y), -1
+            else:
+                back = get_room_id(room_x - 1, room_y) if room_x else -1
+                line = start, end, get_room_id(room_x, room_y), back
+            line_ids['v', room_x, room_y] = len(lines)
+            lines.append(line)
+    for room_y in range(num_rooms + 1):
+        for room_x in range(num_rooms):
+            start, end = get_corner_id(room_x + 1, room_y), get_corner_id(room_x, room_y)
+            if room_y == num_rooms:
+                line = end, start, get_room_id(room_x, room_y - 1), -1
+            else:
+                back = get_room_id(room_x, room_y - 1) if room_y else -1
+                line = start, end, get_room_id(room_x, room_y), back
+            line_ids['h', room_x, room_y] = len(lines)
+            lines.append(line)
+
+    linedefs = np.zeros(len(lines), dtype=LINEDEF_DTYPE)
+    sidedefs = []
+    for line_id, (start, end, front, back) in enumerate(lines):
+        linedef = linedefs[line_id]
+        linedef['start_vertex_id'], linedef['end_vertex_id'] = start, end
+        linedef['front_sidedef_id'] = len(sidedefs)
+        if back < 0:
+            linedef['flags'], linedef['back_sidedef_id'] = 1, 0xFFFF  # blocking
+            sidedefs.append((0, 0, b'-', b'-', b'STARTAN3', front))
+        else:
+            linedef['flags'], linedef['back_sidedef_id'] = 4, len(sidedefs) + 1  # two-sided
+            sidedefs.append((0, 0, b'-', b'STARTAN3', b'-', front))
+            sidedefs.append((0, 0, b'-', b'STARTAN3', b'-', back))
+    sidedefs = np.array(sidedefs, dtype=SIDEDEF_DTYPE)
+
+    # the corners of every cell, added by the "node builder"
+    cell_xs, cell_ys = np.meshgrid(np.arange(num_cells + 1), np.arange(num_cells + 1))
+    new_vertexes = np.zeros((num_cells + 1) ** 2, dtype=EXT_NODES_VERTEX_DTYPE)
+    new_vertexes['x'] = (cell_xs * cell_size << 16).ravel()
+    new_vertexes['y'] = (cell_ys * cell_size << 16).ravel()
+
+    def get_vertex_id(x, y):
+        return len(vertexes) + y * (num_cells + 1) + x
+
+    def get_edge(x, y, direction):
+        # linedef and side of a cell edge on a room wall, or a miniseg; the vertical
+        # edge at x and the horizontal one at y start at (x, y); a line runs up / left,
+        # except the ones on the top / right border of the map
+        if direction == 'v':
+            if x % room_size:
+                return 0xFFFF, 0
+            room_x, room_y = x // room_size, y // room_size
+            return line_ids['v', room_x, room_y], room_x == num_rooms
+        if y % room_size:
+            return 0xFFFF, 0
+        room_x, room_y = x // room_size, y // room_size
+        return line_ids['h', room_x, room_y], room_y == num_rooms
+
+    segs, seg_counts, nodes = [], [], []
+
+    def add_sub_sector(*sub_sector_segs):
+        seg_counts.append(len(sub_sector_segs))
+        segs.extend(sub_sector_segs)
+        return (len(seg_counts) - 1) | SUB_SECTOR_FLAG
+
+    def add_node(partition, front_bbox, back_bbox, front_child_id, back_child_id):
+        nodes.append((*partition, *front_bbox, *back_bbox, front_child_id, back_child_id))
+        return len(nodes) - 1
+
+    def add_cell(x, y):
+        v1, v2 = get_vertex_id(x, y), get_vertex_id(x + 1, y + 1)
+        v3, v4 = get_vertex_id(x + 1, y), get_vertex_id(x, y + 1)
+        # walls of a cell run clockwise, a wall on a line running the other way is on its back
+        line_id, side = get_edge(x + 1, y, 'v')
+        right = v2, v3, line_id, 1 - side if line_id != 0xFFFF else 0
+        line_id, side = get_edge(x, y, 'h')
+        bottom = v3, get_vertex_id(x, y), line_id, side
+        line_id, side = get_edge(x, y, 'v')
+        left = get_vertex_id(x, y), v4, line_id, side
+        line_id, side = get_edge(x, y + 1, 'h')
+        top = v4, v2, line_id, 1 - side if line_id != 0xFFFF else 0
+        # the lower right half is in front of the diagonal
+        front_id = add_sub_sector((v1, v2, 0xFFFF, 0), right, bottom)
+        back_id = add_sub_sector((v2, v1, 0xFFFF, 0), left, top)
+        bbox = (y + 1) * cell_size, y * cell_size, x * cell_size, (x + 1) * cell_size
+        partition = x * cell_size, y * cell_size, cell_size, cell_size
+        return add_node(partition, bbox, bbox, front_id, back_id)
+
+    def add_cells(x1, y1, x2, y2):
+        # the cells [x1, x2) x [y1, y2), split in half along the longer side
+        if x2 - x1 == 1 and y2 - y1 == 1:
+            return add_cell(x1, y1)
+        top, bottom = y2 * cell_size, y1 * cell_size
+        left, right = x1 * cell_size, x2 * cell_size
+        if x2 - x1 >= y2 - y1:
+            x = (x1 + x2) // 2
+            # a line running up has the right half in front
+            back_id, front_id = add_cells(x1, y1, x, y2), add_cells(x, y1, x2, y2)
+            partition = x * cell_size, bottom, 0, top - bottom
+            return add_node(partition, (top, bottom, x * cell_size, right),
+                            (top, bottom, left, x * cell_size), front_id, back_id)
+        y = (y1 + y2) // 2
+        # a line running right has the lower half in front
+        front_id, back_id = add_cells(x1, y1, x2, y), add_cells(x1, y, x2, y2)
+        partition = left, y * cell_size, right - left, 0
+        return add_node(partition, (y * cell_size, bottom, left, right),
+                        (top, y * cell_size, left, right), front_id, back_id)
+
+    add_cells(0, 0, num_cells, num_cells)
+
+    def get_block(records, dtype):
+        return struct.pack('<I', len(records)) + np.array(records, dtype=dtype).tobytes()
+
+    nodes_data = b''.join([
+        struct.pack('<I', len(vertexes)),
+        struct.pack('<I', len(new_vertexes)) + new_vertexes.tobytes(),
+        get_block(seg_counts, np.dtype('<u4')),
+        get_block(segs, EXT_NODES_SEG_DTYPE),
+        get_block(nodes, EXT_NODES_NODE_DTYPE),
+    ])
+    nodes_lump = b'ZNOD' + zlib.compress(nodes_data) if is_compressed else b'XNOD' + nodes_data
+
+    # player start near the middle, off the partition lines
+    center = num_cells * cell_size // 2
+    things = np.array([(center + cell_size // 3, center + cell_size // 5, 90, 1, 7)],
+                      dtype=THING_DTYPE)
+    lumps = [
+        ('E1M1', b''), ('THINGS', things.tobytes()), ('LINEDEFS', linedefs.tobytes()),
+        ('SIDEDEFS', sidedefs.tobytes()), ('VERTEXES', vertexes.tobytes()), ('SEGS', b''),
+        ('SSECTORS', b''), ('NODES', nodes_lump), ('SECTORS', sectors.tobytes()),
+        ('REJECT', b''), ('BLOCKMAP', b''),
+    ]
+    with open(wad_path, 'wb') as wad_file:
+        directory, offset = [], 12
+        for name, data in lumps:
+            directory.append(struct.pack('<II8s', offset, len(data), name.encode()))
+            offset += len(data)
+        wad_file.write(struct.pack('<4sII', b'PWAD', len(lumps), offset))
+        for name, data in lumps:
+            wad_file.write(data)
+        wad_file.write(b''.join(directory))
+    return len(segs)
+
+
+def measure_scaling(overrides, wad_paths, num_angles=36):
+    # map load time, parsing the map arrays alone and the whole WADData the engine
+    # builds, then the BSP traversal per frame over a full turn, with the segs of the
+    # subsectors it reaches projected on the way
+    configure(**overrides)
+    from map_arrays import MapArrays
+    from wad_data import WADData
+    engine = make_engine(wad_paths)
+    wad_data, bsp, player = engine.wad_data, engine.bsp, engine.player
+    engine.update()
+    engine.draw()
+
+    wad_data.reader = WADStack(wad_paths)
+    t0 = time.perf_counter()
+    MapArrays(wad_data, 'E1M1')
+    arrays_time = time.perf_counter() - t0
+    wad_data.reader.close()
+    t0 = time.perf_counter()
+    WADData(engine, 'E1M1')
+    wad_data_time = time.perf_counter() - t0
+
+    traversal_time = num_projected = 0
+    for i in range(num_angles):
+        player.angle = i * 360 / num_angles
+        bsp.seg_projection.update()
+        bsp.update_pvs()
+        bsp.traverse()
+        traversal_time += bsp.traversal_time
+        num_projected += bsp.counts[4]
+    return (arrays_time, wad_data_time, engine.time_to_first_frame,
+            traversal_time / num_angles, num_projected / num_angles, len(wad_data.map_arrays.nodes))
+
+
+def bench_scaling(wad_paths, grid_sizes=(32, 96, 184, 296, 408)):
+    # generated grid maps with extended nodes, from a few thousand to a million segs;
+    # the WAD data includes decoding the IWAD assets, the first frame also compiling
+    # the kernels unless they are cached
+    import tempfile
+    overrides = {'USE_ASSET_CACHE': False}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for grid_size in grid_sizes:
+            pwad_path = os.path.join(tmp_dir, f'grid{grid_size}.wad')
+            num_segs = write_grid_map(pwad_path, grid_size)
+            (arrays_time, wad_data_time, startup_time, traversal_time, num_projected,
+             num_nodes) = run_configured(measure_scaling, overrides, [wad_paths[0], pwad_path])
+            print(f'{num_segs} segs, {num_nodes} nodes: map arrays {arrays_time:.3f} s, '
+                  f'WAD data {wad_data_time:.3f} s, first frame {startup_time:.2f} s, '
+                  f'traversal {traversal_time * 1000:.3f} ms/frame, '
+                  f'{num_projected:.0f} segs projected per frame')
+
+
+def measure_render(overrides, wad_paths, num_angles=72):
+    # average frame time over a full turn at the player start, after a warm-up frame
+    configure(**overrides)
+    engine = make_engine(wad_paths)
+    engine.update()
+    engine.draw()
+
+    t0 = time.perf_counter()
+    for i in range(num_angles):
+        engine.player.angle = i * 360 / num_angles
+        engine.update()
+        engine.draw()
+    return (time.perf_counter() - t0) / num_angles
+
+
+def legacy_project_seg(bsp, vertex1, vertex2):
+    # the per-seg scalar projection of the python BSP walk, for comparison
+    from settings import H_FOV, FOV
+    angle1, angle2 = bsp.point_to_angle(vertex1), bsp.point_to_angle(vertex2)
+    span = (angle1 - angle2) % 360
+    if span >= 180.0:
+        return False
+    rw_angle1 = angle1
+    angle1 -= bsp.player.angle
+    angle2 -= bsp.player.angle
+    span1 = (angle1 + H_FOV) % 360
+    if span1 > FOV:
+        if span1 >= span + FOV:
+            return False
+        angle1 = H_FOV
+    span2 = (H_FOV - angle2) % 360
+    if span2 > FOV:
+        if span2 >= span + FOV:
+            return False
+        angle2 = -H_FOV
+    return bsp.angle_to_x(angle1), bsp.angle_to_x(angle2), rw_angle1
+
+
+def bench_projection(wad_paths, num_angles=72):
+    # per frame: the BSP walk projecting the subsectors it reaches, every subsector of
+    # the map projected by the same kernel, and every seg projected in python
+    from numba import njit
+    from settings import FOV
+    from bsp_kernels import project_sub_sector
+
+    @njit
+    def project_all(sub_sectors, seg_is_drawn, projection, view, angle_to_x):
+        num_projected = 0
+        for sub_sector_id in range(len(sub_sectors)):
+            first_seg_id, seg_count = sub_sectors[sub_sector_id]
+            num_projected += project_sub_sector(sub_sector_id, first_seg_id, seg_count,
+                                                seg_is_drawn, projection, view, angle_to_x)
+        return num_projected
+
+    engine = make_engine(wad_paths)
+    bsp, projection = engine.bsp, engine.bsp.seg_projection
+    segs = engine.wad_data.segments
+    player = engine.player
+    engine.update()
+    view = (0.0, 0.0, 0.0, 0.0, 0.0, FOV)
+    project_all(bsp.sub_sector_segs, bsp.seg_is_drawn, projection.get_kernel_arrays(), view,
+                bsp.angle_to_x_array)
+
+    timings = {'walk': 0.0, 'whole map': 0.0, 'per seg': 0.0}
+    num_projected = {name: 0 for name in timings}
+    for i in range(num_angles):
+        player.angle = i * 360 / num_angles
+        projection.update()
+        bsp.update_pvs()
+        bsp.traverse()
+        timings['walk'] += bsp.traversal_time
+        num_projected['walk'] += bsp.counts[4]
+
+        # a new view, so that nothing is cached
+        projection.view_id += 1
+        view = (float(player.pos.x), float(player.pos.y), float(player.angle), 0.0, 0.0)
+        t0 = time.perf_counter()
+        num_projected['whole map'] += project_all(
+            bsp.sub_sector_segs, bsp.seg_is_drawn, projection.get_kernel_arrays(), view,
+            bsp.angle_to_x_array)
+        t1 = time.perf_counter()
+        for seg in segs:
+            legacy_project_seg(bsp, seg.start_vertex, seg.end_vertex)
+        t2 = time.perf_counter()
+        timings['whole map'] += t1 - t0
+        timings['per seg'] += t2 - t1
+        num_projected['per seg'] += len(segs)
+
+    for name, total in timings.items():
+        print(f'{name}: {total / num_angles * 1000:.3f} ms/frame, '
+              f'{num_projected[name] / num_angles:.0f} of {len(segs)} segs projected')
+
+
+def bench_render(wad_paths):
+    print(f'{measure_render({}, wad_paths) * 1000:.2f} ms/frame')
+
+
+def bench_resolution(wad_paths):
+    # frame time for internal render resolutions below the window size
+    from settings import WIN_RES, DOOM_RES
+    width, height = WIN_RES
+    for render_res in (WIN_RES, (width // 2, height // 2), DOOM_RES):
+        frame_time = run_configured(measure_render, {'RENDER_RES': render_res}, wad_paths)
+        print(f'{render_res[0]}x{render_res[1]}: {frame_time * 1000:.2f} ms/frame')
+
+
+def bench_planes(wad_paths, num_angles=72):
+    # floor / ceiling pixel work: the visplanes of each frame drawn as
+    # horizontal spans vs column by column
+    from numba import njit
+    from render_kernels import draw_flat_col, draw_plane_spans
+
+    @njit
+    def draw_plane_columns(framebuffer, tops, bottoms, min_x, max_x, flat_tex, light_table,
+                           world_z, view, screen_size):
+        for x in range(min_x, max_x + 1):
+            if tops[x] < bottoms[x]:
+                draw_flat_col(framebuffer, flat_tex, x, tops[x], bottoms[x], light_table,
+                              world_z, view[0], view[1], view[2],
+                              screen_size[0], screen_size[1], screen_size[2])
+
+    engine = make_engine(wad_paths)
+    renderer, visplanes = engine.view_renderer, engine.seg_handler.visplanes
+    engine.update()
+    # compile the column loop outside the timings
+    world_z, tex_id, light_level = visplanes.keys[0]
+    draw_plane_columns(engine.framebuffer, visplanes.tops[0], visplanes.bottoms[0], 0, -1,
+                       renderer.textures[tex_id], renderer.get_light_table(light_level),
+                       float(world_z), renderer.get_view(), renderer.screen_size)
+
+    timings = {'spans': 0.0, 'columns': 0.0}
+    for i in range(num_angles):
+        engine.player.angle = i * 360 / num_angles
+        engine.update()
+        view = renderer.get_view()
+        for plane_id, (world_z, tex_id, light_level) in enumerate(visplanes.keys):
+            min_x, max_x = visplanes.x_ranges[plane_id]
+            tops, bottoms = visplanes.tops[plane_id], visplanes.bottoms[plane_id]
+            flat_tex = renderer.textures[tex_id]
+            light_table = renderer.get_light_table(light_level)
+
+            t0 = time.perf_counter()
+            draw_plane_spans(engine.framebuffer, tops, bottoms, min_x, max_x, flat_tex,
+                             light_table, float(world_z), view, renderer.kernel_tables,
+                             visplanes.span_start)
+            t1 = time.perf_counter()
+            draw_plane_columns(engine.framebuffer, tops, bottoms, min_x, max_x, flat_tex,
+                               light_table, float(world_z), view, renderer.screen_size)
+            t2 = time.perf_counter()
+            timings['spans'] += t1 - t0
+            timings['columns'] += t2 - t1
+
+    for name, total in timings.items():
+        print(f'{name}: {total / num_angles * 1000:.3f} ms/frame')
+
+
+def bench_sky(wad_paths, num_angles=72):
+    # sky pixel work: the sky visplanes of each frame copied from the prescaled sky
+    # strip vs scaled from the sky texture column by column
+    from numba import njit
+    from render_kernels import draw_wall_col, draw_sky_columns
+
+    @njit
+    def draw_sky_texture_columns(framebuffer, tops, bottoms, min_x, max_x, sky_tex, sky_tex_alt,
+                                 sky_inv_scale, light_table, player_angle, x_to_angle, h_height):
+        for x in range(min_x, max_x + 1):
+            if tops[x] < bottoms[x]:
+                tex_column = 2.2 * (player_angle + x_to_angle[x])
+                draw_wall_col(framebuffer, sky_tex, tex_column, x, tops[x], bottoms[x],
+                              sky_tex_alt, sky_inv_scale, light_table, h_height)
+
+    engine = make_engine(wad_paths)
+    renderer, visplanes = engine.view_renderer, engine.seg_handler.visplanes
+    timings = {'sky strip': 0.0, 'texture columns': 0.0}
+    for i in range(num_angles + 1):
+        engine.player.angle = i * 360 / num_angles
+        engine.update()
+        angle = float(engine.player.angle)
+        for plane_id, (world_z, tex_id, light_level) in enumerate(visplanes.keys):
+            if tex_id != renderer.sky_id:
+                continue
+            min_x, max_x = visplanes.x_ranges[plane_id]
+            tops, bottoms = visplanes.tops[plane_id], visplanes.bottoms[plane_id]
+
+            t0 = time.perf_counter()
+            draw_sky_columns(engine.framebuffer, tops, bottoms, min_x, max_x,
+                             renderer.sky_strip, angle, renderer.x_to_angle)
+            t1 = time.perf_counter()
+            draw_sky_texture_columns(engine.framebuffer, tops, bottoms, min_x, max_x,
+                                     renderer.sky_tex, float(renderer.sky_tex_alt),
+                                     renderer.sky_inv_scale, renderer.sky_light_table, angle,
+                                     renderer.x_to_angle, engine.tables.h_height)
+            t2 = time.perf_counter()
+            # the first frame compiles the column loop
+            if i:
+                timings['sky strip'] += t1 - t0
+                timings['texture columns'] += t2 - t1
+
+    for name, total in timings.items():
+        print(f'{name}: {total / num_angles * 1000:.3f} ms/frame')
+
+
+def bench_tables(wad_paths, number=200000):
+    # hot-path angle functions: float trig in degrees vs the lookup tables
+    import numpy as np
+    from numba import njit
+    engine = make_engine(wad_paths)
+    bsp, seg_handler, tables = engine.bsp, engine.seg_handler, engine.tables
+    vertex = engine.wad_data.vertexes[0]
+    x_to_angle = seg_handler.x_to_angle_list
+
+    def angle_to_x_trig(angle):
+        return int(tables.screen_dist - math.tan(math.radians(angle)) * tables.h_width)
+
+    def point_to_angle_trig(vertex):
+        delta = vertex - bsp.player.pos
+        return math.degrees(math.atan2(delta.y, delta.x))
+
+    def scale_from_global_angle_trig(x, rw_normal_angle, rw_distance):
+        x_angle = x_to_angle[x]
+        num = tables.screen_dist * math.cos(math.radians(rw_normal_angle - x_angle - bsp.player.angle))
+        den = rw_distance * math.cos(math.radians(x_angle))
+        return min(seg_handler.MAX_SCALE, max(seg_handler.MIN_SCALE, num / den))
+
+    cases = {
+        'angle_to_x': (lambda: angle_to_x_trig(31.7), lambda: bsp.angle_to_x(31.7)),
+        'point_to_angle': (lambda: point_to_angle_trig(vertex), lambda: bsp.point_to_angle(vertex)),
+        'scale_from_global_angle': (lambda: scale_from_global_angle_trig(200, 123.4, 250.0),
+                                    lambda: seg_handler.scale_from_global_angle(200, 123.4, 250.0)),
+    }
+    for name, (trig_func, table_func) in cases.items():
+        trig_time = timeit.timeit(trig_func, number=number) / number
+        table_time = timeit.timeit(table_func, number=number) / number
+        print(f'{name}: trig {trig_time * 1e9:.0f} ns, tables {table_time * 1e9:.0f} ns')
+
+    # the texture column of every screen column, in compiled code
+    @njit
+    def texture_columns_trig(x_to_angle, center_angle, out):
+        for x in range(len(out)):
+            out[x] = 300.0 * math.tan(math.radians(center_angle - x_to_angle[x]))
+
+    from render_tables import DEG_TO_FINE as deg_to_fine, FINE_MASK as fine_mask
+
+    @njit
+    def texture_columns_tables(x_to_angle, fine_tangent, center_angle, out):
+        for x in range(len(out)):
+            fine_angle = int((center_angle - x_to_angle[x]) * deg_to_fine) & fine_mask
+            out[x] = 300.0 * fine_tangent[fine_angle]
+
+    out = np.empty(len(tables.x_to_angle))
+    texture_columns_trig(tables.x_to_angle, 10.0, out)
+    texture_columns_tables(tables.x_to_angle, tables.fine_tangent, 10.0, out)
+    trig_time = timeit.timeit(
+        lambda: texture_columns_trig(tables.x_to_angle, 10.0, out), number=number // 100)
+    table_time = timeit.timeit(
+        lambda: texture_columns_tables(tables.x_to_angle, tables.fine_tangent, 10.0, out),
+        number=number // 100)
+    print(f'texture columns / frame: trig {trig_time / (number // 100) * 1e6:.2f} us, '
+          f'tables {table_time / (number // 100) * 1e6:.2f} us')
+
+
+def bench_present(wad_paths, num_frames=200):
+    # getting a rendered frame into the window: the packed render surface scaled into
+    # the screen vs the RGB array blitted into it before, at the same size
+    import pygame as pg
+    engine = make_engine(wad_paths)
+    engine.update()
+    engine.draw()
+
+    present_time = 0.0
+    for _ in range(num_frames):
+        engine.present()
+        present_time += engine.present_time
+    print(f'packed surface: {present_time / num_frames * 1000:.3f} ms, '
+          f'{engine.present_bytes} bytes/frame')
+
+    if engine.render_surface.get_size() == engine.screen.get_size():
+        rgb = pg.surfarray.array3d(engine.render_surface)
+        t0 = time.perf_counter()
+        for _ in range(num_frames):
+            pg.surfarray.blit_array(engine.screen, rgb)
+        present_time = (time.perf_counter() - t0) / num_frames
+        print(f'RGB blit_array: {present_time * 1000:.3f} ms, '
+              f'{engine.screen.get_height() * engine.screen.get_pitch()} bytes/frame')
+
+
+def bench_strips(wad_paths, max_strips=os.cpu_count()):
+    # frame time for 1 to max_strips strips rendered in parallel
+    for num_strips in range(1, max_strips + 1):
+        frame_time = run_configured(measure_render, {'RENDER_STRIPS': num_strips}, wad_paths)
+        print(f'strips={num_strips}: {frame_time * 1000:.2f} ms/frame')
+
+
+BENCHMARKS = {
+    'assets': bench_assets,
+    'startup': bench_startup,
+    'clipping': bench_clipping,
+    'bsp': bench_bsp,
+    'blockmap': bench_blockmap,
+    'scaling': bench_scaling,
+    'projection': bench_projection,
+    'render': bench_render,
+    'resolution': bench_resolution,
+    'strips': bench_strips,
+    'present': bench_present,
+    'planes': bench_planes,
+    'sky': bench_sky,
+    'tables': bench_tables,
+}
+
+
+if __name__ == '__main__':
+    # usage: benchmark.py NAME [IWAD [PWAD ...]]
+    name = sys.argv[1] if len(sys.argv) > 1 else 'assets'
+    wad_paths = sys.argv[2:] or ['wad/DOOM1.WAD']
+    BENCHMARKS[name](wad_paths)
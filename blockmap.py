@@ -0,0 +1,188 @@
+from settings import *
+import numpy as np
+from numba import njit
+
+BLOCK_SIZE = 128
+
+
+class BlockMap:
+    # grid of 128 x 128 map unit blocks, each with the linedefs touching it, from the
+    # BLOCKMAP lump or generated from the linedefs when the lump is missing or broken;
+    # answers which lines are near a point or box without scanning every linedef
+
+    def __init__(self, wad_data, map_name):
+        map_arrays = wad_data.map_arrays
+        arrays = wad_data.cache.load(f'blockmap_{map_name}')
+        if arrays is None:
+            blockmap_index = wad_data.map_index + wad_data.LUMP_INDICES['BLOCKMAP']
+            with wad_data.reader.get_lump_view(blockmap_index) as lump:
+                arrays = self.read_lump(lump, len(map_arrays.linedefs))
+            if arrays is None:
+                arrays = self.build(map_arrays)
+            wad_data.cache.save(f'blockmap_{map_name}', arrays)
+        # (origin_x, origin_y, num_columns, num_rows)
+        self.header = tuple(arrays['header'].tolist())
+        # the lines of block (column, row) are block_lines[block_offsets[b]: block_offsets[b + 1]]
+        # with b = row * num_columns + column
+        self.block_offsets = arrays['block_offsets']
+        self.block_lines = arrays['block_lines']
+
+        # per linedef: (x1, y1, x2, y2), whether nothing passes, and the opening
+        # (highest floor, lowest ceiling) between the sectors of a two-sided line
+        vertexes, linedefs = map_arrays.vertexes, map_arrays.linedefs
+        start, end = linedefs['start_vertex_id'], linedefs['end_vertex_id']
+        self.lines = np.stack([vertexes['x'][start], vertexes['y'][start],
+                               vertexes['x'][end], vertexes['y'][end]], axis=1).astype(np.float64)
+        is_one_sided = linedefs['back_sidedef_id'] == 0xFFFF
+        is_blocking = (linedefs['flags'] & wad_data.LINEDEF_FLAGS['BLOCKING']) != 0
+        self.line_is_blocking = is_one_sided | is_blocking
+
+        sector_ids = map_arrays.sidedefs['sector_id'].astype(np.int64)
+        front_ids = sector_ids[linedefs['front_sidedef_id']]
+        back_ids = sector_ids[np.where(is_one_sided, linedefs['front_sidedef_id'],
+                                       linedefs['back_sidedef_id'])]
+        floors = map_arrays.sectors['floor_height'].astype(np.float64)
+        ceils = map_arrays.sectors['ceil_height'].astype(np.float64)
+        self.line_openings = np.stack([
+            np.maximum(floors[front_ids], floors[back_ids]),
+            np.minimum(ceils[front_ids], ceils[back_ids])], axis=1)
+
+    def read_lump(self, lump, num_lines):
+        # int16 header (origin_x, origin_y, num_columns, num_rows), a uint16 word offset
+        # per block, then the block lists: 0, line ids..., 0xFFFF
+        words = np.frombuffer(lump, dtype='<u2', count=len(lump) // 2)
+        if len(words) < 4:
+            return None
+        origin_x, origin_y = words[:2].view('<i2').tolist()
+        num_columns, num_rows = words[2:4].tolist()
+        num_blocks = num_columns * num_rows
+        list_starts = words[4: 4 + num_blocks].astype(np.int64)
+        # offsets wrap past 64k words on big maps
+        if not num_blocks or len(list_starts) < num_blocks or list_starts.min() < 4 + num_blocks:
+            return None
+
+        ends = np.flatnonzero(words == 0xFFFF)
+        if not len(ends):
+            return None
+        list_ends = ends[np.minimum(np.searchsorted(ends, list_starts), len(ends) - 1)]
+        if (list_ends < list_starts).any():
+            return None
+        # skip the 0 every vanilla list starts with, it is not linedef 0
+        list_starts += words[list_starts] == 0
+        counts = list_ends - list_starts
+        block_offsets = np.concatenate([[0], np.cumsum(counts)])
+        # index of every listed word, block after block
+        first_word_ids = np.repeat(list_starts - block_offsets[:-1], counts)
+        block_lines = words[first_word_ids + np.arange(block_offsets[-1])].astype(np.int32)
+        if (block_lines >= num_lines).any():
+            return None
+        return {'header': np.array([origin_x, origin_y, num_columns, num_rows], dtype=np.int64),
+                'block_offsets': block_offsets, 'block_lines': block_lines}
+
+    def build(self, map_arrays):
+        # every line goes to the blocks its bounding box touches
+        vertexes, linedefs = map_arrays.vertexes, map_arrays.linedefs
+        xs = vertexes['x'].astype(np.int64)
+        ys = vertexes['y'].astype(np.int64)
+        origin_x, origin_y = int(xs.min()) - 8, int(ys.min()) - 8
+        num_columns = (int(xs.max()) - origin_x) // BLOCK_SIZE + 1
+        num_rows = (int(ys.max()) - origin_y) // BLOCK_SIZE + 1
+
+        start, end = linedefs['start_vertex_id'], linedefs['end_vertex_id']
+        columns = (np.stack([xs[start], xs[end]]) - origin_x) // BLOCK_SIZE
+        rows = (np.stack([ys[start], ys[end]]) - origin_y) // BLOCK_SIZE
+        blocks = [[] for _ in range(num_columns * num_rows)]
+        for line_id, (column1, column2, row1, row2) in enumerate(zip(
+                columns.min(0).tolist(), columns.max(0).tolist(),
+                rows.min(0).tolist(), rows.max(0).tolist())):
+            for row in range(row1, row2 + 1):
+                for column in range(column1, column2 + 1):
+                    blocks[row * num_columns + column].append(line_id)
+
+        block_offsets = np.concatenate([[0], np.cumsum([len(block) for block in blocks])])
+        block_lines = np.array([line_id for block in blocks for line_id in block], dtype=np.int32)
+        return {'header': np.array([origin_x, origin_y, num_columns, num_rows], dtype=np.int64),
+                'block_offsets': block_offsets, 'block_lines': block_lines}
+
+    def get_lines_in_box(self, x1, y1, x2, y2):
+        # ids of the linedefs touching the blocks of the box, each once
+        column1, row1 = self.get_block(x1, y1)
+        column2, row2 = self.get_block(x2, y2)
+        num_columns = self.header[2]
+        line_ids = [
+            self.block_lines[self.block_offsets[block_id]: self.block_offsets[block_id + 1]]
+            for row in range(row1, row2 + 1)
+            for block_id in range(row * num_columns + column1, row * num_columns + column2 + 1)
+        ]
+        return np.unique(np.concatenate(line_ids)) if line_ids else np.empty(0, dtype=np.int32)
+
+    def get_lines_near(self, x, y, radius):
+        return self.get_lines_in_box(x - radius, y - radius, x + radius, y + radius)
+
+    def get_block(self, x, y):
+        origin_x, origin_y, num_columns, num_rows = self.header
+        column = min(max(int((x - origin_x) // BLOCK_SIZE), 0), num_columns - 1)
+        row = min(max(int((y - origin_y) // BLOCK_SIZE), 0), num_rows - 1)
+        return column, row
+
+    def get_blocking_line(self, x, y, new_x, new_y, floor_height):
+        # the settings are arguments, cached kernels keep the globals they were compiled with
+        player_size = float(PLAYER_RADIUS), float(MAX_STEP_HEIGHT), float(PLAYER_BODY_HEIGHT)
+        return get_blocking_line(
+            float(x), float(y), float(new_x), float(new_y), float(floor_height), player_size,
+            self.header, self.block_offsets, self.block_lines, self.lines, self.line_is_blocking,
+            self.line_openings)
+
+
+@njit(cache=True)
+def get_distance_to_line(x, y, line):
+    x1, y1, x2, y2 = line[0], line[1], line[2], line[3]
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else min(max(((x - x1) * dx + (y - y1) * dy) / length_sq, 0.0), 1.0)
+    return math.hypot(x - x1 - t * dx, y - y1 - t * dy)
+
+
+@njit(cache=True)
+def is_crossing(x, y, new_x, new_y, line):
+    # does the move from (x, y) to (new_x, new_y) go through the line?
+    x1, y1, x2, y2 = line[0], line[1], line[2], line[3]
+    dx, dy = x2 - x1, y2 - y1
+    side1 = dx * (y - y1) - dy * (x - x1)
+    side2 = dx * (new_y - y1) - dy * (new_x - x1)
+    if side1 * side2 >= 0:
+        return False
+    move_x, move_y = new_x - x, new_y - y
+    side1 = move_x * (y1 - y) - move_y * (x1 - x)
+    side2 = move_x * (y2 - y) - move_y * (x2 - x)
+    return side1 * side2 < 0
+
+
+@njit(cache=True)
+def get_blocking_line(x, y, new_x, new_y, floor_height, player_size, header, block_offsets,
+                      block_lines, lines, line_is_blocking, line_openings):
+    # a line the player cannot cross that the move goes through, or that is within
+    # the player radius of (new_x, new_y), or -1; moving away from a line the player
+    # already touches is always allowed. The blocks tested cover the whole move, as
+    # in DOOM's P_PathTraverse, so a long step cannot jump over a wall
+    radius, max_step_height, body_height = player_size
+    origin_x, origin_y, num_columns, num_rows = header
+    column1 = max(int((min(x, new_x) - radius - origin_x) // BLOCK_SIZE), 0)
+    column2 = min(int((max(x, new_x) + radius - origin_x) // BLOCK_SIZE), num_columns - 1)
+    row1 = max(int((min(y, new_y) - radius - origin_y) // BLOCK_SIZE), 0)
+    row2 = min(int((max(y, new_y) + radius - origin_y) // BLOCK_SIZE), num_rows - 1)
+    for row in range(row1, row2 + 1):
+        for column in range(column1, column2 + 1):
+            block_id = row * num_columns + column
+            for i in range(block_offsets[block_id], block_offsets[block_id + 1]):
+                line_id = block_lines[i]
+                line = lines[line_id]
+                if not is_crossing(x, y, new_x, new_y, line):
+                    distance = get_distance_to_line(new_x, new_y, line)
+                    if distance >= radius or distance >= get_distance_to_line(x, y, line):
+                        continue
+                open_bottom, open_top = line_openings[line_id, 0], line_openings[line_id, 1]
+                if (line_is_blocking[line_id] or open_bottom - floor_height > max_step_height or
+                        open_top - open_bottom < body_height):
+                    return line_id
+    return -1
@@ -1,157 +1,143 @@
 from settings import *
+import time
+import numpy as np
+import bsp_kernels
+from seg_projection import SegProjection
+from render_tables import FINE_MASK, DEG_TO_FINE, RAD_TO_DEG
 
 
 class BSP:
-    SUB_SECTOR_IDENTIFIER = 0x8000  # 2**15 = 32768
+    SUB_SECTOR_IDENTIFIER = bsp_kernels.SUB_SECTOR_IDENTIFIER
 
-    def __init__(self, engine):
+    def __init__(self, engine, seg_handler):
         self.engine = engine
         self.player = engine.player
+        self.seg_handler = seg_handler
+        self.seg_projection = SegProjection(engine)
         self.nodes = engine.wad_data.nodes
         self.sub_sectors = engine.wad_data.sub_sectors
-        self.segs = engine.wad_data.segments
+        self.seg_table = engine.wad_data.seg_table
+        self.pvs = engine.wad_data.pvs
         self.root_node_id = len(self.nodes) - 1
-        self.is_traverse_bsp = True
+        # view angle -> screen column, indexed by fine angle
+        self.angle_to_x_array = engine.tables.angle_to_x
+        self.angle_to_x_table = self.angle_to_x_array.tolist()
+        # view angle of the right edge of the columns drawn and their angular width,
+        # -H_FOV and FOV unless only a strip of the screen is drawn
+        x_to_angle = engine.tables.x_to_angle
+        self.view_right = float(x_to_angle[seg_handler.x_last + 1])
+        self.view_span = float(x_to_angle[seg_handler.x_first]) - self.view_right
+
+        # flat arrays walked by the compiled traversal
+        map_arrays = engine.wad_data.map_arrays
+        nodes = map_arrays.nodes
+        self.node_lines = np.stack([nodes[name] for name in (
+            'x_partition', 'y_partition', 'dx_partition', 'dy_partition')], axis=1).astype(np.float64)
+        self.node_children = np.stack(
+            [nodes['front_child_id'], nodes['back_child_id']], axis=1).astype(np.int64)
+        self.node_bboxes = np.stack([np.stack([nodes[f'{side}_{edge}'] for edge in (
+            'top', 'bottom', 'left', 'right')], axis=1) for side in ('front', 'back')],
+            axis=1).astype(np.float64)
+        sub_sectors = map_arrays.sub_sectors
+        self.sub_sector_segs = np.stack(
+            [sub_sectors['first_seg_id'], sub_sectors['seg_count']], axis=1).astype(np.int64)
+        self.seg_is_solid = engine.wad_data.seg_is_solid
+        self.seg_is_portal = engine.wad_data.seg_is_portal
+        self.seg_is_drawn = self.seg_is_solid | self.seg_is_portal
+        # every node and subsector is pushed at most once
+        self.stack = np.empty((2 * len(self.nodes) + 1, 3), dtype=np.int64)
+        # at most one solid seg between two drawn columns, plus the sentinels
+        self.solid_segs = np.empty((engine.tables.width + 2, 2), dtype=np.int64)
+        # (seg_id, x1, x2) per visible range, grown when a frame needs more
+        self.ranges = np.empty((4 * engine.tables.width, 3), dtype=np.int64)
+        self.num_ranges = 0
+        # skip subtrees whose bbox is hidden behind the solid walls drawn so far
+        self.is_occlusion_culled = True
+        # skip subtrees outside the potentially visible set of the player's subsector
+        self.is_pvs_culled = True
+        self.pvs_sub_sector_id = None
+        self.sub_sector_visible = np.ones(len(self.sub_sectors), dtype=np.bool_)
+        self.node_visible = np.ones(len(self.nodes), dtype=np.bool_)
+        # last frame: nodes and subsectors visited, subtrees outside the view,
+        # subtrees occluded (counted even when not culled), subtrees outside the PVS,
+        # segs projected, solid seg list entries visited by the clipping
+        self.counts = np.zeros(6, dtype=np.int64)
+        # seconds spent in the compiled walk last frame; a first walk here loads the
+        # kernels from the numba cache, or compiles them, so no frame is timed with it
+        self.update_pvs()
+        self.traverse()
+        self.traversal_time = 0.0
 
     def update(self):
-        self.is_traverse_bsp = True
-        self.render_bsp_node(node_id=self.root_node_id)
-
-    def get_sub_sector_height(self):
-        sub_sector_id = self.root_node_id
-
-        while not sub_sector_id >= self.SUB_SECTOR_IDENTIFIER:
-            node = self.nodes[sub_sector_id]
-
-            is_on_back = self.is_on_back_side(node)
-            if is_on_back:
-                sub_sector_id = self.nodes[sub_sector_id].back_child_id
-            else:
-                sub_sector_id = self.nodes[sub_sector_id].front_child_id
-
-        sub_sector = self.sub_sectors[sub_sector_id - self.SUB_SECTOR_IDENTIFIER]
-        seg = self.segs[sub_sector.first_seg_id]
-        return seg.front_sector.floor_height
-
-    @staticmethod
-    def angle_to_x(angle):
-        if angle > 0:
-            x = SCREEN_DIST - math.tan(math.radians(angle)) * H_WIDTH
-        else:
-            x = -math.tan(math.radians(angle)) * H_WIDTH + SCREEN_DIST
-        return int(x)
-
-    def add_segment_to_fov(self, vertex1, vertex2):
-        angle1 = self.point_to_angle(vertex1)
-        angle2 = self.point_to_angle(vertex2)
-
-        span = self.norm(angle1 - angle2)
-        # backface culling
-        if span >= 180.0:
-            return False
-
-        # needed for further calculations
-        rw_angle1 = angle1
-
-        angle1 -= self.player.angle
-        angle2 -= self.player.angle
-
-        span1 = self.norm(angle1 + H_FOV)
-        if span1 > FOV:
-            if span1 >= span + FOV:
-                return False
-            # clipping
-            angle1 = H_FOV
-
-        span2 = self.norm(H_FOV - angle2)
-        if span2 > FOV:
-            if span2 >= span + FOV:
-                return False
-            # clipping
-            angle2 = -H_FOV
-
-        x1 = self.angle_to_x(angle1)
-        x2 = self.angle_to_x(angle2)
-        return x1, x2, rw_angle1
-
-    def render_sub_sector(self, sub_sector_id):
-        sub_sector = self.sub_sectors[sub_sector_id]
-
-        for i in range(sub_sector.seg_count):
-            seg = self.segs[sub_sector.first_seg_id + i]
-            if result := self.add_segment_to_fov(seg.start_vertex, seg.end_vertex):
-                self.engine.seg_handler.classify_segment(seg, *result)
-
-    @staticmethod
-    def norm(angle):
-        return angle % 360
-
-    def check_bbox(self, bbox):
-        a, b = vec2(bbox.left, bbox.bottom), vec2(bbox.left, bbox.top)
-        c, d = vec2(bbox.right, bbox.top), vec2(bbox.right, bbox.bottom)
-
-        px, py = self.player.pos
-        if px < bbox.left:
-            if py > bbox.top:
-                bbox_sides = (b, a), (c, b)
-            elif py < bbox.bottom:
-                bbox_sides = (b, a), (a, d)
-            else:
-                bbox_sides = (b, a),
-        elif px > bbox.right:
-            if py > bbox.top:
-                bbox_sides = (c, b), (d, c)
-            elif py < bbox.bottom:
-                bbox_sides = (a, d), (d, c)
-            else:
-                bbox_sides = (d, c),
+        self.seg_projection.update()
+        self.update_pvs()
+        self.traverse()
+        self.draw_ranges()
+
+    def update_pvs(self):
+        # recomputed when the player enters another subsector, None: everything visible
+        sub_sector_id = None
+        if self.is_pvs_culled:
+            sub_sector_id = self.player.sub_sector_id
+        if sub_sector_id == self.pvs_sub_sector_id:
+            return None
+        self.pvs_sub_sector_id = sub_sector_id
+
+        if sub_sector_id is None:
+            self.sub_sector_visible.fill(True)
+            self.node_visible.fill(True)
         else:
-            if py > bbox.top:
-                bbox_sides = (c, b),
-            elif py < bbox.bottom:
-                bbox_sides = (a, d),
-            else:
-                return True
-
-        for v1, v2 in bbox_sides:
-            angle1 = self.point_to_angle(v1)
-            angle2 = self.point_to_angle(v2)
-
-            span = self.norm(angle1 - angle2)
-
-            angle1 -= self.player.angle
-            span1 = self.norm(angle1 + H_FOV)
-            if span1 > FOV:
-                if span1 >= span + FOV:
-                    continue
-            return True
-        return False
+            self.sub_sector_visible = self.pvs.get_visible_sub_sectors(sub_sector_id)
+            bsp_kernels.mark_visible_nodes(self.root_node_id, self.node_children,
+                                           self.sub_sector_visible, self.stack[:, 0],
+                                           self.node_visible)
+
+    def traverse(self):
+        t0 = time.perf_counter()
+        segs = self.seg_is_solid, self.seg_is_portal, self.seg_is_drawn
+        projection = self.seg_projection.get_kernel_arrays()
+        view = self.get_view()
+        while True:
+            self.num_ranges = bsp_kernels.walk_bsp(
+                self.root_node_id, self.node_lines, self.node_children, self.node_bboxes,
+                self.sub_sector_segs, segs, projection, view, self.angle_to_x_array,
+                self.seg_handler.x_first, self.seg_handler.x_last, self.is_occlusion_culled,
+                (self.sub_sector_visible, self.node_visible), self.stack, self.solid_segs,
+                self.ranges, self.counts)
+            if self.num_ranges <= len(self.ranges):
+                break
+            self.ranges = np.empty((2 * self.num_ranges, 3), dtype=np.int64)
+        self.traversal_time = time.perf_counter() - t0
+
+    def get_view(self):
+        # as taken by the compiled walk; FOV is passed in as the kernels are cached on
+        # disk with the values of the globals they read
+        return (float(self.player.pos.x), float(self.player.pos.y), float(self.player.angle),
+                self.view_right, self.view_span, FOV)
+
+    def draw_ranges(self):
+        # front to back, as the walk emitted them
+        seg_table, ranges = self.seg_table, self.ranges[:self.num_ranges]
+        rw_angle1 = self.seg_projection.rw_angle1[ranges[:, 0]].tolist()
+        draw_seg_range = self.seg_handler.draw_seg_range
+        for (seg_id, x1, x2), angle in zip(ranges.tolist(), rw_angle1):
+            draw_seg_range(seg_table[seg_id], x1, x2, angle)
+
+    def get_player_sub_sector(self):
+        return self.get_sub_sector_id(self.player.pos.x, self.player.pos.y)
+
+    def get_sub_sector_id(self, x, y):
+        # one compiled root to leaf descent, about a microsecond even on huge maps
+        return bsp_kernels.find_sub_sector(
+            self.root_node_id, self.node_lines, self.node_children, float(x), float(y))
+
+    def get_sector_id(self, x, y):
+        # -1 for a subsector without a sector
+        return int(self.pvs.sub_sector_sectors[self.get_sub_sector_id(x, y)])
+
+    def angle_to_x(self, angle):
+        return self.angle_to_x_table[int(angle * DEG_TO_FINE) & FINE_MASK]
 
     def point_to_angle(self, vertex):
         delta = vertex - self.player.pos
-        return math.degrees(math.atan2(delta.y, delta.x))
-
-    def render_bsp_node(self, node_id):
-        if self.is_traverse_bsp:
-
-            if node_id >= self.SUB_SECTOR_IDENTIFIER:
-                sub_sector_id = node_id - self.SUB_SECTOR_IDENTIFIER
-                self.render_sub_sector(sub_sector_id)
-                return None
-
-            node = self.nodes[node_id]
-
-            is_on_back = self.is_on_back_side(node)
-            if is_on_back:
-                self.render_bsp_node(node.back_child_id)
-                if self.check_bbox(node.bbox['front']):
-                    self.render_bsp_node(node.front_child_id)
-            else:
-                self.render_bsp_node(node.front_child_id)
-                if self.check_bbox(node.bbox['back']):
-                    self.render_bsp_node(node.back_child_id)
-
-    def is_on_back_side(self, node):
-        dx = self.player.pos.x - node.x_partition
-        dy = self.player.pos.y - node.y_partition
-        return dx * node.dy_partition - dy * node.dx_partition <= 0
+        return math.atan2(delta.y, delta.x) * RAD_TO_DEG
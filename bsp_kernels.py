@@ -0,0 +1,349 @@
+from settings import *
+from numba import njit
+import numpy as np
+from data_types import SUB_SECTOR_FLAG
+from render_tables import FINE_MASK, DEG_TO_FINE, RAD_TO_DEG
+
+SUB_SECTOR_IDENTIFIER = SUB_SECTOR_FLAG  # 2**31, child ids of the map arrays
+
+
+# ----------------------------------------------------------------------------- #
+# compiled front-to-back BSP walk, one call per frame
+#   nodes: (x_partition, y_partition, dx_partition, dy_partition) per node
+#   children: (front_child_id, back_child_id) per node
+#   bboxes: (top, bottom, left, right) per node and side, front = 0, back = 1
+#   sub_sectors: (first_seg_id, seg_count) per subsector
+#   segs: (is_solid, is_portal, is_drawn) arrays, is_drawn = is_solid | is_portal
+#   projection: per view caches of the seg columns, filled as subsectors are reached,
+#       see SegProjection.get_kernel_arrays
+#   view: (player_x, player_y, player_angle, view_right, view_span, fov)
+#   angle_to_x: view angle -> screen column, indexed by fine angle
+#   solid_segs: sorted disjoint [first, last] column ranges covered by solid walls,
+#       as in DOOM's solidsegs, with sentinels outside the columns drawn
+#   ranges: output, (seg_id, x1, x2) for every visible part of a seg in drawing order
+#   pvs: (sub_sector_visible, node_visible) bools, subtrees without a subsector in the
+#       potentially visible set of the player's subsector are skipped
+#   counts: output, nodes and subsectors visited, subtrees outside the view,
+#       subtrees hidden behind solid walls (culled unless is_occlusion_culled is off),
+#       subtrees outside the potentially visible set, segs projected and solid seg
+#       list entries visited by the clipping
+@njit(cache=True)
+def is_on_back_side(nodes, node_id, player_x, player_y):
+    dx = player_x - nodes[node_id, 0]
+    dy = player_y - nodes[node_id, 1]
+    return dx * nodes[node_id, 3] - dy * nodes[node_id, 2] <= 0
+
+
+# the two corners spanning a bbox as seen from the player, indexed by where the player
+# is: (x, y, x, y) of the left then the right corner as bbox indices, as in DOOM's
+# checkcoord; the middle row and column mean the player is between the edges
+BBOX_CORNERS = np.array([
+    [[3, 0, 2, 1], [3, 0, 2, 0], [3, 1, 2, 0]],
+    [[2, 0, 2, 1], [0, 0, 0, 0], [3, 1, 3, 0]],
+    [[2, 0, 3, 1], [2, 1, 3, 1], [2, 1, 3, 0]],
+])
+BBOX_INSIDE, BBOX_CULLED, BBOX_OCCLUDED = 0, 1, 2
+
+
+@njit(cache=True)
+def check_bbox(bbox, view, angle_to_x, x_first, x_last, solid_segs, num_solid):
+    # project the box to a column range: can anything in it be seen, is it outside
+    # the view or behind the solid walls drawn so far?
+    top, bottom, left, right = bbox[0], bbox[1], bbox[2], bbox[3]
+    player_x, player_y, player_angle, view_right, view_span = view[:5]
+    box_x = 0 if player_x <= left else 1 if player_x < right else 2
+    box_y = 0 if player_y >= top else 1 if player_y > bottom else 2
+    # the player is inside the box
+    if box_x == 1 and box_y == 1:
+        return BBOX_INSIDE
+    corners = BBOX_CORNERS[box_y, box_x]
+    x1, y1, x2, y2 = bbox[corners[0]], bbox[corners[1]], bbox[corners[2]], bbox[corners[3]]
+
+    angle1 = math.atan2(y1 - player_y, x1 - player_x) * RAD_TO_DEG
+    angle2 = math.atan2(y2 - player_y, x2 - player_x) * RAD_TO_DEG
+    span = (angle1 - angle2) % 360
+    # the box covers half the view around the player
+    if span >= 180.0:
+        return BBOX_INSIDE
+
+    # clipping against the columns drawn, the corners projected as the segs are
+    angle1 -= player_angle
+    angle2 -= player_angle
+    span1 = (angle1 - view_right) % 360
+    if span1 > view_span:
+        if span1 >= span + view_span:
+            return BBOX_CULLED
+        sx1 = x_first
+    else:
+        sx1 = angle_to_x[int(angle1 * DEG_TO_FINE) & FINE_MASK]
+    span2 = (view_right + view_span - angle2) % 360
+    if span2 > view_span:
+        if span2 >= span + view_span:
+            return BBOX_CULLED
+        sx2 = x_last + 1
+    else:
+        sx2 = angle_to_x[int(angle2 * DEG_TO_FINE) & FINE_MASK]
+    # does not cross a pixel
+    if sx1 >= sx2:
+        return BBOX_CULLED
+
+    # the segs inside draw within [sx1, sx2 - 1]: is a single solid seg covering it?
+    sx2 -= 1
+    for i in range(num_solid):
+        if solid_segs[i, 1] >= sx2:
+            if solid_segs[i, 0] <= sx1:
+                return BBOX_OCCLUDED
+            break
+    return BBOX_INSIDE
+
+
+@njit(cache=True)
+def get_vertex_angle(vertex_id, vertexes, vertex_angles, vertex_view_ids, view_id,
+                     player_x, player_y):
+    # angle from the player in degrees, computed once per view
+    if vertex_view_ids[vertex_id] != view_id:
+        vertex_angles[vertex_id] = math.atan2(vertexes[vertex_id, 1] - player_y,
+                                              vertexes[vertex_id, 0] - player_x) * RAD_TO_DEG
+        vertex_view_ids[vertex_id] = view_id
+    return vertex_angles[vertex_id]
+
+
+@njit(cache=True)
+def project_sub_sector(sub_sector_id, first_seg_id, seg_count, seg_is_drawn, projection, view,
+                       angle_to_x):
+    # screen columns of the segs of a subsector not projected for this view yet,
+    # backface and field of view culling included; returns the number of segs projected
+    (vertexes, seg_vertex_ids, view_id, vertex_angles, vertex_view_ids, sub_sector_view_ids,
+     seg_x1, seg_x2, seg_rw_angle1, seg_is_visible) = projection
+    if sub_sector_view_ids[sub_sector_id] == view_id:
+        return 0
+    sub_sector_view_ids[sub_sector_id] = view_id
+    player_x, player_y, player_angle, fov = view[0], view[1], view[2], view[5]
+    h_fov = fov / 2
+
+    num_projected = 0
+    for seg_id in range(first_seg_id, first_seg_id + seg_count):
+        # minisegs and lines used for triggers are never drawn
+        if not seg_is_drawn[seg_id]:
+            seg_is_visible[seg_id] = False
+            continue
+        num_projected += 1
+        angle1 = get_vertex_angle(seg_vertex_ids[seg_id, 0], vertexes, vertex_angles,
+                                  vertex_view_ids, view_id, player_x, player_y)
+        angle2 = get_vertex_angle(seg_vertex_ids[seg_id, 1], vertexes, vertex_angles,
+                                  vertex_view_ids, view_id, player_x, player_y)
+        span = (angle1 - angle2) % 360
+        # backface culling
+        is_visible = span < 180.0
+        seg_rw_angle1[seg_id] = angle1
+
+        angle1 -= player_angle
+        angle2 -= player_angle
+        # clipping against the field of view
+        span1 = (angle1 + h_fov) % 360
+        if span1 > fov:
+            is_visible &= span1 < span + fov
+            angle1 = h_fov
+        span2 = (h_fov - angle2) % 360
+        if span2 > fov:
+            is_visible &= span2 < span + fov
+            angle2 = -h_fov
+
+        seg_x1[seg_id] = angle_to_x[int(angle1 * DEG_TO_FINE) & FINE_MASK]
+        seg_x2[seg_id] = angle_to_x[int(angle2 * DEG_TO_FINE) & FINE_MASK]
+        seg_is_visible[seg_id] = is_visible
+    return num_projected
+
+
+@njit(cache=True)
+def add_range(ranges, num_ranges, seg_id, x1, x2):
+    # past the capacity only the count goes on, the caller grows the array and walks again
+    if num_ranges < len(ranges):
+        ranges[num_ranges, 0] = seg_id
+        ranges[num_ranges, 1] = x1
+        ranges[num_ranges, 2] = x2
+    return num_ranges + 1
+
+
+@njit(cache=True)
+def add_visible_ranges(solid_segs, num_solid, seg_id, x_first, x_last, ranges, num_ranges,
+                       counts):
+    # the parts of [x_first, x_last] between the solid segs
+    x = x_first
+    for i in range(num_solid):
+        counts[5] += 1
+        first, last = solid_segs[i, 0], solid_segs[i, 1]
+        if last < x:
+            continue
+        if first > x_last:
+            break
+        if first > x:
+            num_ranges = add_range(ranges, num_ranges, seg_id, x, first - 1)
+        x = last + 1
+    if x <= x_last:
+        num_ranges = add_range(ranges, num_ranges, seg_id, x, x_last)
+    return num_ranges
+
+
+@njit(cache=True)
+def add_solid_seg(solid_segs, num_solid, x_first, x_last, counts):
+    # replace the solid segs touching [x_first, x_last] by their union
+    i = 0
+    while solid_segs[i, 1] < x_first - 1:
+        i += 1
+    j = i
+    while j < num_solid and solid_segs[j, 0] <= x_last + 1:
+        j += 1
+    counts[5] += j + 1
+    if i < j:
+        x_first = min(x_first, solid_segs[i, 0])
+        x_last = max(x_last, solid_segs[j - 1, 1])
+    # the entries from j on move to i + 1
+    if j > i + 1:
+        solid_segs[i + 1: num_solid - (j - i - 1)] = solid_segs[j: num_solid].copy()
+    elif j == i:
+        solid_segs[i + 1: num_solid + 1] = solid_segs[i: num_solid].copy()
+    solid_segs[i, 0] = x_first
+    solid_segs[i, 1] = x_last
+    return num_solid - (j - i - 1)
+
+
+@njit(nogil=True, cache=True)
+def walk_bsp(root_node_id, nodes, children, bboxes, sub_sectors, segs, projection, view,
+             angle_to_x, x_first, x_last, is_occlusion_culled, pvs, stack, solid_segs, ranges,
+             counts):
+    seg_is_solid, seg_is_portal, seg_is_drawn = segs
+    view_id, sub_sector_view_ids = projection[2], projection[5]
+    seg_x1, seg_x2, seg_is_visible = projection[6], projection[7], projection[9]
+    sub_sector_visible, node_visible = pvs
+    player_x, player_y = view[0], view[1]
+
+    solid_segs[0, 0], solid_segs[0, 1] = -0x7fffffff, x_first - 1
+    solid_segs[1, 0], solid_segs[1, 1] = x_last + 1, 0x7fffffff
+    num_solid, num_ranges = 2, 0
+    counts[:] = 0
+
+    # entries: (node or subsector, node whose bbox must be checked first or -1, bbox side)
+    stack[0, 0], stack[0, 1], stack[0, 2] = root_node_id, -1, 0
+    stack_size = 1
+    while stack_size:
+        stack_size -= 1
+        node_id, check_node_id, check_side = stack[stack_size]
+        if node_id >= SUB_SECTOR_IDENTIFIER:
+            is_visible = sub_sector_visible[node_id - SUB_SECTOR_IDENTIFIER]
+        else:
+            is_visible = node_visible[node_id]
+        if not is_visible:
+            counts[3] += 1
+            continue
+        # the far side of a node is checked once the near side is done, against the
+        # solid walls it drew
+        if check_node_id >= 0:
+            result = check_bbox(bboxes[check_node_id, check_side], view, angle_to_x,
+                                x_first, x_last, solid_segs, num_solid)
+            if result == BBOX_CULLED:
+                counts[1] += 1
+                continue
+            if result == BBOX_OCCLUDED:
+                counts[2] += 1
+                if is_occlusion_culled:
+                    continue
+        counts[0] += 1
+
+        if node_id >= SUB_SECTOR_IDENTIFIER:
+            sub_sector_id = node_id - SUB_SECTOR_IDENTIFIER
+            first_seg_id, seg_count = sub_sectors[sub_sector_id]
+            if sub_sector_view_ids[sub_sector_id] != view_id:
+                counts[4] += project_sub_sector(sub_sector_id, first_seg_id, seg_count,
+                                                seg_is_drawn, projection, view, angle_to_x)
+            for seg_id in range(first_seg_id, first_seg_id + seg_count):
+                x1, x2 = seg_x1[seg_id], seg_x2[seg_id]
+                # facing away, outside the view, not crossing a pixel or not in this strip
+                if not seg_is_visible[seg_id] or x1 == x2 or x2 <= x_first or x1 > x_last:
+                    continue
+                if seg_is_solid[seg_id]:
+                    prev_num_ranges = num_ranges
+                    num_ranges = add_visible_ranges(
+                        solid_segs, num_solid, seg_id, x1, x2 - 1, ranges, num_ranges, counts)
+                    if num_ranges > prev_num_ranges:
+                        num_solid = add_solid_seg(solid_segs, num_solid, x1, x2 - 1, counts)
+                        # only one range left: the columns are full
+                        if num_solid == 1:
+                            return num_ranges
+                # empty lines used for triggers and special events are not portals
+                elif seg_is_portal[seg_id]:
+                    num_ranges = add_visible_ranges(
+                        solid_segs, num_solid, seg_id, x1, x2 - 1, ranges, num_ranges, counts)
+            continue
+
+        front_child_id, back_child_id = children[node_id, 0], children[node_id, 1]
+        if is_on_back_side(nodes, node_id, player_x, player_y):
+            near_child_id, far_child_id, far_side = back_child_id, front_child_id, 0
+        else:
+            near_child_id, far_child_id, far_side = front_child_id, back_child_id, 1
+        stack[stack_size, 0], stack[stack_size, 1], stack[stack_size, 2] = (
+            far_child_id, node_id, far_side)
+        stack[stack_size + 1, 0], stack[stack_size + 1, 1], stack[stack_size + 1, 2] = (
+            near_child_id, -1, 0)
+        stack_size += 2
+    return num_ranges
+
+
+@njit(cache=True)
+def find_sub_sector(root_node_id, nodes, children, x, y):
+    # the subsector containing a point, root to leaf
+    node_id = root_node_id
+    while node_id < SUB_SECTOR_IDENTIFIER:
+        node_id = children[node_id, 1 if is_on_back_side(nodes, node_id, x, y) else 0]
+    return node_id - SUB_SECTOR_IDENTIFIER
+
+
+# ----------------------------------------------------------------------------- #
+# potentially visible set
+@njit(cache=True)
+def flood_sectors(offsets, neighbors, is_rejected):
+    # per sector: the sectors REJECT allows it to see that are reachable through
+    # a chain of such sectors joined by two-sided lines
+    num_sectors = len(offsets) - 1
+    is_visible = np.zeros((num_sectors, num_sectors), dtype=np.bool_)
+    queue = np.empty(num_sectors, dtype=np.int64)
+    for sector_id in range(num_sectors):
+        visible = is_visible[sector_id]
+        visible[sector_id] = True
+        queue[0], queue_start, queue_end = sector_id, 0, 1
+        while queue_start < queue_end:
+            current_id = queue[queue_start]
+            queue_start += 1
+            for i in range(offsets[current_id], offsets[current_id + 1]):
+                neighbor_id = neighbors[i]
+                if not visible[neighbor_id] and not is_rejected[sector_id, neighbor_id]:
+                    visible[neighbor_id] = True
+                    queue[queue_end] = neighbor_id
+                    queue_end += 1
+    return is_visible
+
+
+@njit(cache=True)
+def mark_visible_nodes(root_node_id, children, sub_sector_visible, stack, node_visible):
+    # a node is visible when a subsector below it is: children first, then the node,
+    # pushed as ~node_id once its children are on the stack
+    stack[0], stack_size = root_node_id, 1
+    while stack_size:
+        stack_size -= 1
+        node_id = stack[stack_size]
+        if node_id < 0:
+            node_id = ~node_id
+            is_visible = False
+            for child_id in (children[node_id, 0], children[node_id, 1]):
+                if child_id >= SUB_SECTOR_IDENTIFIER:
+                    is_visible |= sub_sector_visible[child_id - SUB_SECTOR_IDENTIFIER]
+                else:
+                    is_visible |= node_visible[child_id]
+            node_visible[node_id] = is_visible
+            continue
+        stack[stack_size] = ~node_id
+        stack_size += 1
+        for child_id in (children[node_id, 0], children[node_id, 1]):
+            if child_id < SUB_SECTOR_IDENTIFIER:
+                stack[stack_size] = child_id
+                stack_size += 1
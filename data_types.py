@@ -1,3 +1,5 @@
+import numpy as np
+
 # H - uint16, h - int16, I - uint32, i - int32, c - char
 
 class TextureMap:
@@ -96,6 +98,36 @@ class Seg:
     __slots__ += ['start_vertex', 'end_vertex', 'linedef', 'front_sector', 'back_sector']
 
 
+class SegGeometry:
+    # per-seg render data resolved at load time, so drawing a seg only
+    # does the view-dependent math
+    __slots__ = [
+        'is_solid',  # one-sided, occludes everything behind it
+        'is_portal',  # two-sided with something to draw, False for invisible trigger lines
+        'front_sector',
+        'back_sector',
+        'side',  # the sidedef the textures come from
+        'start_x',
+        'start_y',
+        'dir_x',  # unit direction of the seg
+        'dir_y',
+        'normal_angle',  # degrees
+        'x_offset',  # seg + sidedef texture offsets
+        'y_offset',
+        'middle_texture',  # texture handles, 0 = no texture
+        'upper_texture',
+        'lower_texture',
+        'dont_peg_top',
+        'dont_peg_bottom',
+        'front_ceil_height',  # with the sky hack of two sky ceilings applied
+        'is_ceil_sky',
+        'is_ceil_changed',  # the ceiling / floor differs from the back sector
+        'is_floor_changed',
+        'draw_upper_wall',
+        'draw_lower_wall',
+    ]
+
+
 class Linedef:
     # 14 bytes = 2H x 7
     __slots__ = [
@@ -135,3 +167,79 @@ class Node:
     ]
     def __init__(self):
         self.bbox = {'front': self.BBox(), 'back': self.BBox()}
+
+
+# ----------------------------------------------------------------------- #
+# structured array layouts of the map lumps (little-endian, same field
+# order as the records above, so a lump can be viewed without decoding)
+VERTEX_DTYPE = np.dtype([('x', '<i2'), ('y', '<i2')])
+
+LINEDEF_DTYPE = np.dtype([
+    ('start_vertex_id', '<u2'), ('end_vertex_id', '<u2'), ('flags', '<u2'),
+    ('line_type', '<u2'), ('sector_tag', '<u2'),
+    ('front_sidedef_id', '<u2'), ('back_sidedef_id', '<u2')
+])
+
+SIDEDEF_DTYPE = np.dtype([
+    ('x_offset', '<i2'), ('y_offset', '<i2'), ('upper_texture', 'S8'),
+    ('lower_texture', 'S8'), ('middle_texture', 'S8'), ('sector_id', '<u2')
+])
+
+SEG_DTYPE = np.dtype([
+    ('start_vertex_id', '<i2'), ('end_vertex_id', '<i2'), ('angle', '<i2'),
+    ('linedef_id', '<i2'), ('direction', '<i2'), ('offset', '<i2')
+])
+
+SUB_SECTOR_DTYPE = np.dtype([('seg_count', '<i2'), ('first_seg_id', '<i2')])
+
+NODE_DTYPE = np.dtype([
+    ('x_partition', '<i2'), ('y_partition', '<i2'),
+    ('dx_partition', '<i2'), ('dy_partition', '<i2'),
+    ('front_top', '<i2'), ('front_bottom', '<i2'), ('front_left', '<i2'), ('front_right', '<i2'),
+    ('back_top', '<i2'), ('back_bottom', '<i2'), ('back_left', '<i2'), ('back_right', '<i2'),
+    ('front_child_id', '<u2'), ('back_child_id', '<u2')
+])
+
+SECTOR_DTYPE = np.dtype([
+    ('floor_height', '<i2'), ('ceil_height', '<i2'), ('floor_texture', 'S8'),
+    ('ceil_texture', 'S8'), ('light_level', '<u2'), ('type', '<u2'), ('tag', '<u2')
+])
+
+THING_DTYPE = np.dtype([
+    ('x', '<i2'), ('y', '<i2'), ('angle', '<u2'), ('type', '<u2'), ('flags', '<u2')
+])
+
+# ----------------------------------------------------------------------- #
+# ZDBSP extended nodes (XNOD, or ZNOD: the same zlib-compressed), all in the
+# NODES lump: vertexes added by the node builder, subsectors, segs and nodes
+# with 32-bit ids; counts are uint32 before each block
+EXT_NODES_VERTEX_DTYPE = np.dtype([('x', '<i4'), ('y', '<i4')])  # 16.16 fixed point
+
+EXT_NODES_SEG_DTYPE = np.dtype([
+    ('start_vertex_id', '<u4'), ('end_vertex_id', '<u4'), ('linedef_id', '<u2'), ('side', 'u1')
+])
+
+EXT_NODES_NODE_DTYPE = np.dtype([
+    ('x_partition', '<i2'), ('y_partition', '<i2'),
+    ('dx_partition', '<i2'), ('dy_partition', '<i2'),
+    ('front_top', '<i2'), ('front_bottom', '<i2'), ('front_left', '<i2'), ('front_right', '<i2'),
+    ('back_top', '<i2'), ('back_bottom', '<i2'), ('back_left', '<i2'), ('back_right', '<i2'),
+    ('front_child_id', '<u4'), ('back_child_id', '<u4')
+])
+
+# ----------------------------------------------------------------------- #
+# in-memory layouts of the map arrays: the vanilla lumps and the extended
+# nodes both load into these, with ids wide enough for any map; a child id
+# with bit 31 set is a subsector, a seg with linedef_id -1 is a miniseg
+SUB_SECTOR_FLAG = 0x80000000
+
+MAP_VERTEX_DTYPE = np.dtype([('x', '<f8'), ('y', '<f8')])
+
+MAP_SEG_DTYPE = np.dtype([
+    ('start_vertex_id', '<i4'), ('end_vertex_id', '<i4'), ('angle', '<i2'),
+    ('linedef_id', '<i4'), ('direction', '<i2'), ('offset', '<i4')
+])
+
+MAP_SUB_SECTOR_DTYPE = np.dtype([('seg_count', '<i4'), ('first_seg_id', '<i4')])
+
+MAP_NODE_DTYPE = EXT_NODES_NODE_DTYPE
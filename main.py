@@ -1,19 +1,37 @@
 from wad_data import WADData
 from settings import *
 import pygame as pg
+import numpy as np
 import sys
+import time
 from map_renderer import MapRenderer
 from player import Player
-from bsp import BSP
-from seg_handler import SegHandler
+from render_strips import RenderStrips
 from view_renderer import ViewRenderer
+from render_tables import RenderTables
 
 
 class DoomEngine:
-    def __init__(self, wad_path='wad/DOOM1.WAD'):
+    def __init__(self, wad_path='wad/DOOM1.WAD', pwad_paths=()):
+        self.start_time = time.perf_counter()
+        self.time_to_first_frame = None
         self.wad_path = wad_path
+        # the IWAD first, then the PWADs in load order
+        self.wad_paths = [wad_path, *pwad_paths]
         self.screen = pg.display.set_mode(WIN_RES, pg.SCALED)
-        self.framebuffer = pg.surfarray.array3d(self.screen)
+        # the 3D view is drawn at RENDER_RES into an offscreen surface in the screen's
+        # pixel format, and scaled to the window when presented
+        self.render_surface = pg.Surface(RENDER_RES, 0, self.screen)
+        # packed pixels of the render surface, which stays locked for its lifetime
+        self.surface_pixels = pg.surfarray.pixels2d(self.render_surface)
+        if INDEXED_MODE:
+            self.framebuffer = np.zeros(RENDER_RES, dtype=np.uint8)
+        else:
+            # the kernels write straight into the surface
+            self.framebuffer = self.surface_pixels
+        # time spent and bytes written getting the last frame into the window
+        self.present_time = 0.0
+        self.present_bytes = 0
         self.clock = pg.time.Clock()
         self.running = True
         self.dt = 1 / 60
@@ -21,23 +39,40 @@ class DoomEngine:
 
     def on_init(self):
         self.wad_data = WADData(self, map_name='E1M1')
+        self.tables = RenderTables(*RENDER_RES, FOV)
         self.map_renderer = MapRenderer(self)
         self.player = Player(self)
-        self.bsp = BSP(self)
-        self.seg_handler = SegHandler(self)
+        self.render_strips = RenderStrips(self, RENDER_STRIPS)
+        # the first strip, the whole view unless it is split
+        self.bsp, self.seg_handler = self.render_strips.strips[0]
         self.view_renderer = ViewRenderer(self)
 
     def update(self):
         self.player.update()
-        self.seg_handler.update()
-        self.bsp.update()
-        self.dt = self.clock.tick()
+        self.render_strips.render()
+        self.dt = min(self.clock.tick(), MAX_FRAME_TIME)
         pg.display.set_caption(f'{self.clock.get_fps() :.1f}')
 
     def draw(self):
-        pg.surfarray.blit_array(self.screen, self.framebuffer)
+        self.present()
         self.view_renderer.draw_sprite()
         pg.display.flip()
+        if self.time_to_first_frame is None:
+            self.time_to_first_frame = time.perf_counter() - self.start_time
+            # a progressive startup decodes the remaining assets from here on
+            self.wad_data.asset_data.start_loader()
+
+    def present(self):
+        t0 = time.perf_counter()
+        self.present_bytes = 0
+        if INDEXED_MODE:
+            np.take(self.view_renderer.packed_palette, self.framebuffer, out=self.surface_pixels)
+            self.present_bytes += self.surface_pixels.nbytes
+        # one copy into the window surface, row by row at the same size,
+        # nearest neighbour when scaling up
+        pg.transform.scale(self.render_surface, WIN_RES, self.screen)
+        self.present_bytes += self.screen.get_height() * self.screen.get_pitch()
+        self.present_time = time.perf_counter() - t0
 
     def check_events(self):
         for e in pg.event.get():
@@ -54,5 +89,6 @@ class DoomEngine:
 
 
 if __name__ == '__main__':
-    doom = DoomEngine()
+    # usage: main.py [IWAD [PWAD ...]]
+    doom = DoomEngine(*sys.argv[1:2], pwad_paths=sys.argv[2:])
     doom.run()
@@ -0,0 +1,236 @@
+import math
+import zlib
+from collections.abc import Sequence
+import numpy as np
+from data_types import *
+
+
+class LazyRecords(Sequence):
+    # list of records made from their index the first time they are read, so the
+    # python objects of a huge map are only built for what is actually used
+    def __init__(self, count, make_record):
+        self.make_record = make_record
+        self.records = [None] * count
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        record = self.records[index]
+        if record is None:
+            record = self.records[index] = self.make_record(index % len(self.records))
+        return record
+
+
+class MapArrays:
+    # structure-of-arrays view of a map: one structured array per lump,
+    # object references replaced by integer index columns (-1 = none)
+    ARRAY_NAMES = [
+        'vertexes', 'linedefs', 'nodes', 'sub_sectors', 'segments', 'things', 'sidedefs',
+        'sectors', 'seg_front_sidedef_ids', 'seg_back_sidedef_ids', 'seg_front_sector_ids',
+        'seg_back_sector_ids', 'seg_angles'
+    ]
+
+    def __init__(self, wad_data, map_name):
+        self.reader = wad_data.reader
+        self.two_sided_flag = wad_data.LINEDEF_FLAGS['TWO_SIDED']
+
+        # parsed and linked map, straight from the cache when possible
+        arrays = wad_data.cache.load(f'map_{map_name}')
+        if arrays is None:
+            self.load_lumps(wad_data.get_lump_index(map_name), wad_data.LUMP_INDICES)
+            self.link_segs()
+            wad_data.cache.save(f'map_{map_name}', self.get_arrays())
+        else:
+            for name, array in arrays.items():
+                setattr(self, name, array)
+
+    def get_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    def load_lumps(self, map_index, lump_indices):
+        vertexes = self.get_lump_array(map_index + lump_indices['VERTEXES'], VERTEX_DTYPE)
+        self.vertexes = vertexes.astype(MAP_VERTEX_DTYPE)
+        self.linedefs = self.get_lump_array(map_index + lump_indices['LINEDEFS'], LINEDEF_DTYPE)
+        self.things = self.get_lump_array(map_index + lump_indices['THINGS'], THING_DTYPE)
+        self.sidedefs = self.get_lump_array(map_index + lump_indices['SIDEDEFS'], SIDEDEF_DTYPE)
+        self.sectors = self.get_lump_array(map_index + lump_indices['SECTORS'], SECTOR_DTYPE)
+
+        with self.reader.get_lump_view(map_index + lump_indices['NODES']) as nodes_view:
+            if bytes(nodes_view[:4]) in (b'XNOD', b'ZNOD'):
+                self.load_extended_nodes(nodes_view)
+                return None
+        # vanilla ids are unsigned 16-bit, child ids flag subsectors with bit 15
+        nodes = self.get_lump_array(map_index + lump_indices['NODES'], NODE_DTYPE)
+        self.nodes = nodes.astype(MAP_NODE_DTYPE)
+        for name in ('front_child_id', 'back_child_id'):
+            child_ids = self.nodes[name]
+            is_sub_sector = (child_ids & 0x8000) != 0
+            self.nodes[name] = np.where(is_sub_sector, (child_ids & 0x7FFF) | SUB_SECTOR_FLAG, child_ids)
+
+        sub_sectors = self.get_lump_array(map_index + lump_indices['SSECTORS'], SUB_SECTOR_DTYPE)
+        self.sub_sectors = self.widen(sub_sectors, MAP_SUB_SECTOR_DTYPE, ('seg_count', 'first_seg_id'))
+        segs = self.get_lump_array(map_index + lump_indices['SEGS'], SEG_DTYPE)
+        self.segments = self.widen(
+            segs, MAP_SEG_DTYPE, ('start_vertex_id', 'end_vertex_id', 'linedef_id'))
+
+    @staticmethod
+    def widen(array, dtype, unsigned_names):
+        # copy into the wider layout, the named int16 fields read as uint16
+        wide = np.zeros(len(array), dtype=dtype)
+        for name in dtype.names:
+            wide[name] = array[name].view('<u2') if name in unsigned_names else array[name]
+        return wide
+
+    def load_extended_nodes(self, lump_view):
+        # ZDBSP nodes: the NODES lump holds the segs and subsectors as well
+        data = bytes(lump_view[4:])
+        if bytes(lump_view[:4]) == b'ZNOD':
+            data = zlib.decompress(data)
+
+        num_orig_vertexes = int(np.frombuffer(data, dtype='<u4', count=1)[0])
+        new_vertexes, offset = self.read_nodes_block(data, 4, EXT_NODES_VERTEX_DTYPE)
+        seg_counts, offset = self.read_nodes_block(data, offset, np.dtype('<u4'))
+        segs, offset = self.read_nodes_block(data, offset, EXT_NODES_SEG_DTYPE)
+        self.nodes, offset = self.read_nodes_block(data, offset, EXT_NODES_NODE_DTYPE)
+
+        vertexes = np.zeros(num_orig_vertexes + len(new_vertexes), dtype=MAP_VERTEX_DTYPE)
+        vertexes[:num_orig_vertexes] = self.vertexes[:num_orig_vertexes]
+        vertexes['x'][num_orig_vertexes:] = new_vertexes['x'] / 65536
+        vertexes['y'][num_orig_vertexes:] = new_vertexes['y'] / 65536
+        self.vertexes = vertexes
+
+        # the segs of a subsector follow those of the previous one
+        self.sub_sectors = np.zeros(len(seg_counts), dtype=MAP_SUB_SECTOR_DTYPE)
+        self.sub_sectors['seg_count'] = seg_counts
+        self.sub_sectors['first_seg_id'] = np.cumsum(seg_counts) - seg_counts
+
+        # angles and texture offsets are not stored, they come from the vertexes
+        self.segments = np.zeros(len(segs), dtype=MAP_SEG_DTYPE)
+        start_ids = segs['start_vertex_id'].astype(np.int64)
+        end_ids = segs['end_vertex_id'].astype(np.int64)
+        self.segments['start_vertex_id'] = start_ids
+        self.segments['end_vertex_id'] = end_ids
+        self.segments['direction'] = segs['side']
+        linedef_ids = np.where(segs['linedef_id'] == 0xFFFF, -1, segs['linedef_id'].astype(np.int64))
+        self.segments['linedef_id'] = linedef_ids
+
+        xs, ys = self.vertexes['x'], self.vertexes['y']
+        angles = np.arctan2(ys[end_ids] - ys[start_ids], xs[end_ids] - xs[start_ids])
+        bams = np.round(angles * (0x8000 / math.pi)).astype(np.int64)
+        self.segments['angle'] = (bams + 0x8000) % 0x10000 - 0x8000
+
+        # distance along the linedef, from its end vertex for a seg on the back side
+        line_ids = np.maximum(linedef_ids, 0)
+        line_start_ids = np.where(segs['side'] != 0, self.linedefs['end_vertex_id'][line_ids],
+                                  self.linedefs['start_vertex_id'][line_ids]).astype(np.int64)
+        offsets = np.hypot(xs[start_ids] - xs[line_start_ids], ys[start_ids] - ys[line_start_ids])
+        self.segments['offset'] = np.where(linedef_ids >= 0, np.round(offsets), 0)
+
+    @staticmethod
+    def read_nodes_block(data, offset, dtype):
+        # uint32 count then the records -> (array, offset past the block)
+        count = int(np.frombuffer(data, dtype='<u4', count=1, offset=offset)[0])
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=offset + 4).copy()
+        return array, offset + 4 + count * dtype.itemsize
+
+    def get_lump_array(self, lump_index, dtype):
+        with self.reader.get_lump_view(lump_index) as lump_view:
+            count = len(lump_view) // dtype.itemsize
+            # copy, so the array outlives the reader
+            return np.frombuffer(lump_view, dtype=dtype, count=count).copy()
+
+    def link_segs(self):
+        segs, linedefs, sidedefs = self.segments, self.linedefs, self.sidedefs
+        # minisegs only close subsectors, they read any line and are masked below
+        is_miniseg = segs['linedef_id'] < 0
+        linedef_ids = np.maximum(segs['linedef_id'], 0)
+        line_front = linedefs['front_sidedef_id'][linedef_ids].astype(np.int32)
+        line_back = linedefs['back_sidedef_id'][linedef_ids].astype(np.int32)
+        line_back[line_back == 0xFFFF] = -1  # undefined sidedef
+
+        is_reversed = segs['direction'] != 0
+        front_sidedef_ids = np.where(is_reversed, line_back, line_front)
+        back_sidedef_ids = np.where(is_reversed, line_front, line_back)
+
+        is_two_sided = (linedefs['flags'][linedef_ids] & self.two_sided_flag) != 0
+        is_two_sided &= ~is_miniseg
+        back_sidedef_ids[~is_two_sided] = -1
+        front_sidedef_ids[is_miniseg] = -1
+
+        sector_ids = sidedefs['sector_id'].astype(np.int32)
+        self.seg_front_sidedef_ids = front_sidedef_ids
+        self.seg_back_sidedef_ids = back_sidedef_ids
+        self.seg_front_sector_ids = np.where(
+            front_sidedef_ids >= 0, sector_ids[front_sidedef_ids], -1)
+        self.seg_back_sector_ids = np.where(
+            back_sidedef_ids >= 0, sector_ids[back_sidedef_ids], -1)
+        if is_miniseg.any():
+            self.link_minisegs(is_miniseg)
+
+        # convert angles from BAMS to degrees
+        angles = (segs['angle'].astype(np.int64) << 16) * 8.38190317e-8
+        self.seg_angles = np.where(angles < 0, angles + 360, angles)
+
+        self.fix_missing_textures(line_front.tolist(), is_two_sided)
+
+    def link_minisegs(self, is_miniseg):
+        # a miniseg has the sector of its subsector on both sides
+        seg_counts = self.sub_sectors['seg_count']
+        seg_sub_sector_ids = np.repeat(np.arange(len(seg_counts)), seg_counts)
+        sub_sector_sector_ids = np.full(len(seg_counts), -1, dtype=np.int64)
+        sub_sector_sector_ids[seg_sub_sector_ids[~is_miniseg]] = (
+            self.seg_front_sector_ids[~is_miniseg])
+
+        # subsectors made of minisegs only take the sector across one of them
+        miniseg_ids = np.flatnonzero(is_miniseg)
+        num_vertexes = len(self.vertexes)
+        start_ids = self.segments['start_vertex_id'][miniseg_ids].astype(np.int64)
+        end_ids = self.segments['end_vertex_id'][miniseg_ids].astype(np.int64)
+        keys = start_ids * num_vertexes + end_ids
+        order = np.argsort(keys)
+        partner_keys = end_ids * num_vertexes + start_ids
+        partner_pos = np.minimum(np.searchsorted(keys[order], partner_keys), len(keys) - 1)
+        has_partner = keys[order][partner_pos] == partner_keys
+        sub_sector_ids = seg_sub_sector_ids[miniseg_ids[has_partner]]
+        partner_sub_sector_ids = seg_sub_sector_ids[miniseg_ids[order[partner_pos[has_partner]]]]
+        while True:
+            is_open = ((sub_sector_sector_ids[sub_sector_ids] < 0) &
+                       (sub_sector_sector_ids[partner_sub_sector_ids] >= 0))
+            if not is_open.any():
+                break
+            sub_sector_sector_ids[sub_sector_ids[is_open]] = (
+                sub_sector_sector_ids[partner_sub_sector_ids[is_open]])
+
+        sector_ids = sub_sector_sector_ids[seg_sub_sector_ids[is_miniseg]]
+        self.seg_front_sector_ids[is_miniseg] = sector_ids
+        self.seg_back_sector_ids[is_miniseg] = sector_ids
+
+    def fix_missing_textures(self, line_front_ids, is_two_sided):
+        # texture special case: a two-sided line without an upper / lower
+        # texture borrows the one from the other side
+        upper = self.sidedefs['upper_texture'].tolist()
+        lower = self.sidedefs['lower_texture'].tolist()
+        pairs = zip(self.seg_front_sidedef_ids.tolist(), self.seg_back_sidedef_ids.tolist(),
+                    line_front_ids, is_two_sided.tolist())
+
+        for front_id, back_id, line_front_id, two_sided in pairs:
+            if two_sided:
+                if upper[front_id] == b'-':
+                    upper[line_front_id] = upper[back_id]
+                if lower[front_id] == b'-':
+                    lower[line_front_id] = lower[back_id]
+
+        self.sidedefs['upper_texture'] = upper
+        self.sidedefs['lower_texture'] = lower
+
+    @staticmethod
+    def get_objects(array, make_record, link=None):
+        # object view over the rows of a lump array, link(record, index) resolves
+        # the references of a record when it is made
+        def make_object(index):
+            record = make_record(*array[index].item())
+            if link is not None:
+                link(record, index)
+            return record
+        return LazyRecords(len(array), make_object)
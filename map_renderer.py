@@ -2,6 +2,7 @@ import pygame as pg
 import pygame.gfxdraw as gfx
 from settings import *
 import random
+import numpy as np
 
 
 class MapRenderer:
@@ -9,12 +10,12 @@ class MapRenderer:
         self.engine = engine
         self.screen = engine.screen
         self.wad_data = engine.wad_data
-        self.vertexes = self.wad_data.vertexes
+        vertexes = self.wad_data.map_arrays.vertexes
         self.linedefs = self.wad_data.linedefs
-        self.x_min, self.x_max, self.y_min, self.y_max = self.get_map_bounds()
-        # remapping
-        self.vertexes = [pg.math.Vector2(self.remap_x(v.x), self.remap_y(v.y))
-                         for v in self.vertexes]
+        self.x_min, self.x_max, self.y_min, self.y_max = self.get_map_bounds(vertexes)
+        # remapping, (x, y) rows
+        self.vertexes = np.stack(
+            [self.remap_x(vertexes['x']), self.remap_y(vertexes['y'])], axis=1)
 
     def draw(self):
         pass
@@ -81,22 +82,20 @@ class MapRenderer:
         pg.draw.line(self.engine.screen, 'blue', (x1, y1), (x2, y2), 4)
 
     def remap_x(self, n, out_min=30, out_max=WIDTH-30):
-        return (max(self.x_min, min(n, self.x_max)) - self.x_min) * (
+        # a coordinate or an array of them
+        return (np.clip(n, self.x_min, self.x_max) - self.x_min) * (
                 out_max - out_min) / (self.x_max - self.x_min) + out_min
 
     def remap_y(self, n, out_min=30, out_max=HEIGHT-30):
-        return HEIGHT - (max(self.y_min, min(n, self.y_max)) - self.y_min) * (
+        return HEIGHT - (np.clip(n, self.y_min, self.y_max) - self.y_min) * (
                 out_max - out_min) / (self.y_max - self.y_min) - out_min
 
-    def get_map_bounds(self):
-        x_sorted = sorted(self.vertexes, key=lambda v: v.x)
-        x_min, x_max = x_sorted[0].x, x_sorted[-1].x
-
-        y_sorted = sorted(self.vertexes, key=lambda v: v.y)
-        y_min, y_max = y_sorted[0].y, y_sorted[-1].y
-
-        return x_min, x_max, y_min, y_max
+    @staticmethod
+    def get_map_bounds(vertexes):
+        x_min, x_max = vertexes['x'].min(), vertexes['x'].max()
+        y_min, y_max = vertexes['y'].min(), vertexes['y'].max()
+        return float(x_min), float(x_max), float(y_min), float(y_max)
 
     def draw_vertexes(self):
-        for v in self.vertexes:
-            pg.draw.circle(self.engine.screen, 'white', (v.x, v.y), 4)
+        for v in self.vertexes.tolist():
+            pg.draw.circle(self.engine.screen, 'white', v, 4)
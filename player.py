@@ -13,14 +13,22 @@ class Player:
         self.height = PLAYER_HEIGHT
         self.floor_height = 0
         self.z_vel = 0
+        self.blockmap = engine.wad_data.blockmap
+        self.sectors = engine.wad_data.sectors
+        self.sub_sector_sectors = engine.wad_data.pvs.sub_sector_sectors
+        # kept up to date by the BSP, read by the PVS culling
+        self.sub_sector_id = None
 
     def update(self):
-        self.get_height()
         self.control()
+        self.sub_sector_id = self.engine.bsp.get_player_sub_sector()
+        self.get_height()
 
     def get_height(self):
-        # self.height = self.engine.bsp.get_sub_sector_height() + PLAYER_HEIGHT
-        self.floor_height = self.engine.bsp.get_sub_sector_height()
+        # a subsector without a sector keeps the last floor height
+        sector_id = self.sub_sector_sectors[self.sub_sector_id]
+        if sector_id >= 0:
+            self.floor_height = self.sectors[sector_id].floor_height
 
         if self.height < self.floor_height + PLAYER_HEIGHT:
             self.height += 0.4 * (self.floor_height + PLAYER_HEIGHT - self.height)
@@ -53,4 +61,17 @@ class Player:
             inc *= self.DIAG_MOVE_CORR
 
         inc.rotate_ip(self.angle)
-        self.pos += inc
+        if inc:
+            self.move(inc)
+
+    def move(self, inc):
+        # blocked by a wall: slide along it, stop in corners
+        line_id = self.blockmap.get_blocking_line(*self.pos, *(self.pos + inc), self.floor_height)
+        if line_id >= 0:
+            x1, y1, x2, y2 = self.blockmap.lines[line_id]
+            direction = vec2(x2 - x1, y2 - y1).normalize()
+            inc = direction * inc.dot(direction)
+            line_id = self.blockmap.get_blocking_line(
+                *self.pos, *(self.pos + inc), self.floor_height)
+        if line_id < 0:
+            self.pos += inc
@@ -0,0 +1,120 @@
+import numpy as np
+import bsp_kernels
+from data_types import SUB_SECTOR_FLAG
+
+
+class PVS:
+    # potentially visible set of every subsector, built at load time: the REJECT
+    # sector matrix as a first cut when it agrees with the map, then a flood through
+    # two-sided lines that only enters sectors REJECT leaves visible. The flood runs
+    # on sectors, so all the subsectors of a sector share one row of bits
+    # the bits grow with the square of the sector count, past this everything is visible
+    MAX_SECTORS = 8192
+
+    def __init__(self, wad_data, map_name):
+        map_arrays = wad_data.map_arrays
+        # sector of every subsector, -1 if it could not be resolved
+        self.sub_sector_sectors = self.get_sub_sector_sectors(map_arrays)
+        self.num_sectors = len(map_arrays.sectors)
+        self.sector_bits = None
+        if self.num_sectors > self.MAX_SECTORS:
+            return None
+
+        arrays = wad_data.cache.load(f'pvs_{map_name}')
+        if arrays is None:
+            reject_index = wad_data.map_index + wad_data.LUMP_INDICES['REJECT']
+            with wad_data.reader.get_lump_view(reject_index) as reject:
+                arrays = {'sector_bits': self.build(map_arrays, reject)}
+            wad_data.cache.save(f'pvs_{map_name}', arrays)
+        # (num_sectors, num_sectors / 8) bitsets, little-endian bit order
+        self.sector_bits = arrays['sector_bits']
+
+    @staticmethod
+    def get_sub_sector_sectors(map_arrays):
+        # the front sector of the first of its segs that has one
+        seg_counts = map_arrays.sub_sectors['seg_count'].astype(np.int64)
+        num_sub_sectors = len(seg_counts)
+        seg_sub_sector_ids = np.repeat(np.arange(num_sub_sectors), seg_counts)
+        seg_sector_ids = map_arrays.seg_front_sector_ids[:len(seg_sub_sector_ids)].astype(np.int64)
+        has_sector = seg_sector_ids >= 0
+        sub_sector_sectors = np.full(num_sub_sectors, -1, dtype=np.int64)
+        # reversed, so that the first seg is written last
+        sub_sector_sectors[seg_sub_sector_ids[has_sector][::-1]] = seg_sector_ids[has_sector][::-1]
+        if (sub_sector_sectors >= 0).all():
+            return sub_sector_sectors
+
+        # the others take a sector found below their parent node, or further up
+        children = np.stack([map_arrays.nodes['front_child_id'],
+                             map_arrays.nodes['back_child_id']], axis=1).astype(np.int64)
+        is_sub_sector = children >= SUB_SECTOR_FLAG
+        child_ids = np.where(is_sub_sector, children - SUB_SECTOR_FLAG, children)
+        parents = np.full(num_sub_sectors, -1, dtype=np.int64)
+        node_parents = np.full(len(children), -1, dtype=np.int64)
+        node_ids = np.repeat(np.arange(len(children))[:, None], 2, axis=1)
+        parents[child_ids[is_sub_sector]] = node_ids[is_sub_sector]
+        node_parents[child_ids[~is_sub_sector]] = node_ids[~is_sub_sector]
+
+        # any sector of a subsector below each node, children first
+        node_sectors = np.full(len(children), -1, dtype=np.int64)
+        while True:
+            child_sectors = np.where(is_sub_sector, sub_sector_sectors[np.where(
+                is_sub_sector, child_ids, 0)], node_sectors[np.where(is_sub_sector, 0, child_ids)])
+            new_sectors = np.where(node_sectors >= 0, node_sectors, child_sectors.max(axis=1))
+            if np.array_equal(new_sectors, node_sectors):
+                break
+            node_sectors = new_sectors
+
+        open_ids = np.flatnonzero(sub_sector_sectors < 0)
+        node_ids = parents[open_ids]
+        while len(open_ids):
+            is_kept = node_ids >= 0
+            open_ids, node_ids = open_ids[is_kept], node_ids[is_kept]
+            sectors = node_sectors[node_ids]
+            is_found = sectors >= 0
+            sub_sector_sectors[open_ids[is_found]] = sectors[is_found]
+            open_ids, node_ids = open_ids[~is_found], node_parents[node_ids[~is_found]]
+        return sub_sector_sectors
+
+    def build(self, map_arrays, reject):
+        num_sectors = self.num_sectors
+        # sectors joined by two-sided lines, both ways, as compressed rows; each pair
+        # is one key, a row-wise np.unique takes seconds on a million segs
+        front_ids = map_arrays.seg_front_sector_ids.astype(np.int64)
+        back_ids = map_arrays.seg_back_sector_ids.astype(np.int64)
+        is_two_sided = back_ids >= 0
+        front_ids, back_ids = front_ids[is_two_sided], back_ids[is_two_sided]
+        pair_keys = np.unique(np.concatenate([front_ids * num_sectors + back_ids,
+                                              back_ids * num_sectors + front_ids]))
+        pair_sectors, neighbors = np.divmod(pair_keys, num_sectors)
+        offsets = np.searchsorted(pair_sectors, np.arange(num_sectors + 1))
+
+        is_rejected = self.get_rejected(reject, pair_sectors, neighbors)
+        is_visible = bsp_kernels.flood_sectors(offsets, neighbors, is_rejected)
+        return np.packbits(is_visible, axis=1, bitorder='little')
+
+    def get_rejected(self, reject, pair_sectors, neighbors):
+        # (num_sectors, num_sectors) bools, [i, j]: sector j cannot be seen from sector i.
+        # REJECT only steers the monsters and maps edit it, e.g. to make monsters
+        # blind: a short lump, or one rejecting a sector from itself or from a sector
+        # it shares a two-sided line with, contradicts the map and rejects nothing
+        num_sectors = self.num_sectors
+        num_bits = num_sectors * num_sectors
+        if len(reject) * 8 < num_bits:
+            return np.zeros((num_sectors, num_sectors), dtype=np.bool_)
+        bits = np.unpackbits(np.frombuffer(reject, dtype=np.uint8), count=num_bits,
+                             bitorder='little')
+        is_rejected = bits.reshape(num_sectors, num_sectors).astype(np.bool_)
+        if is_rejected.diagonal().any() or is_rejected[pair_sectors, neighbors].any():
+            return np.zeros((num_sectors, num_sectors), dtype=np.bool_)
+        return is_rejected
+
+    def get_visible_sub_sectors(self, sub_sector_id):
+        # bool per subsector: can it be seen from anywhere in sub_sector_id?
+        # subsectors without a sector see and are seen from everywhere
+        sector_id = self.sub_sector_sectors[sub_sector_id]
+        if self.sector_bits is None or sector_id < 0:
+            return np.ones(len(self.sub_sector_sectors), dtype=np.bool_)
+        row = self.sector_bits[sector_id]
+        is_sector_visible = np.unpackbits(row, count=self.num_sectors, bitorder='little')
+        return np.where(self.sub_sector_sectors >= 0,
+                        is_sector_visible[self.sub_sector_sectors], 1).astype(np.bool_)
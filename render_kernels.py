@@ -0,0 +1,295 @@
+from settings import *
+from numba import njit
+from render_tables import FINE_ANGLES, FINE_MASK, DEG_TO_FINE
+
+
+@njit(cache=True)
+def put_pixel(framebuffer, x, y, color):
+    # color is a packed pixel of the render surface, or a palette index in indexed mode
+    framebuffer[x, y] = color
+
+
+@njit(fastmath=True, cache=True)
+def draw_flat_col(screen, flat_tex, x, y1, y2, light_table, world_z,
+                  player_angle, player_x, player_y, width, h_width, h_height):
+    player_dir_x = math.cos(math.radians(player_angle))
+    player_dir_y = math.sin(math.radians(player_angle))
+
+    for iy in range(y1, y2 + 1):
+        z = h_width * world_z / (h_height - iy)
+
+        px = player_dir_x * z + player_x
+        py = player_dir_y * z + player_y
+
+        left_x = -player_dir_y * z + px
+        left_y = player_dir_x * z + py
+        right_x = player_dir_y * z + px
+        right_y = -player_dir_x * z + py
+
+        dx = (right_x - left_x) / width
+        dy = (right_y - left_y) / width
+
+        tx = int(left_x + dx * x) & 63
+        ty = int(left_y + dy * x) & 63
+
+        put_pixel(screen, x, iy, light_table[flat_tex[tx, ty]])
+
+
+@njit(fastmath=True, cache=True)
+def draw_wall_col(framebuffer, tex, tex_col, x, y1, y2, tex_alt, inv_scale, light_table,
+                  h_height):
+    if y1 < y2:
+        tex_w, tex_h = len(tex), len(tex[0])
+        tex_col = int(tex_col) % tex_w
+        tex_y = tex_alt + (float(y1) - h_height) * inv_scale
+
+        for iy in range(y1, y2 + 1):
+            put_pixel(framebuffer, x, iy, light_table[tex[tex_col, int(tex_y) % tex_h]])
+            tex_y += inv_scale
+
+
+@njit(fastmath=True, cache=True)
+def draw_flat_span(framebuffer, flat_tex, y, x1, x2, light_table, world_z, y_slope, width,
+                   player_dir_x, player_dir_y, player_x, player_y):
+    # the row distance and texture step are the same for the whole span
+    z = world_z * y_slope[y]
+
+    px = player_dir_x * z + player_x
+    py = player_dir_y * z + player_y
+
+    left_x = -player_dir_y * z + px
+    left_y = player_dir_x * z + py
+    right_x = player_dir_y * z + px
+    right_y = -player_dir_x * z + py
+
+    dx = (right_x - left_x) / width
+    dy = (right_y - left_y) / width
+
+    for x in range(x1, x2 + 1):
+        tx = int(left_x + dx * x) & 63
+        ty = int(left_y + dy * x) & 63
+
+        put_pixel(framebuffer, x, y, light_table[flat_tex[tx, ty]])
+
+
+@njit(nogil=True, cache=True)
+def draw_plane_spans(framebuffer, tops, bottoms, min_x, max_x, flat_tex, light_table, world_z,
+                     view, tables, span_start):
+    # DOOM's R_MakeSpans: walking the columns, a span is closed on the rows the
+    # plane leaves and opened on the rows it enters
+    x_to_angle, fine_sine, fine_tangent, y_slope, width, h_height = tables
+    player_angle, player_x, player_y = view
+    fine_angle = int(player_angle * DEG_TO_FINE) & FINE_MASK
+    player_dir_x = fine_sine[fine_angle + FINE_ANGLES // 4]
+    player_dir_y = fine_sine[fine_angle]
+
+    t1, b1 = 0x7fff, -1
+    for x in range(min_x, max_x + 2):
+        # columns outside the plane are empty
+        if x <= max_x:
+            top, bottom = tops[x], bottoms[x]
+        else:
+            top, bottom = 0x7fff, -1
+        t2, b2 = top, bottom
+
+        while t1 < t2 and t1 <= b1:
+            draw_flat_span(framebuffer, flat_tex, t1, span_start[t1], x - 1, light_table,
+                           world_z, y_slope, width, player_dir_x, player_dir_y, player_x, player_y)
+            t1 += 1
+        while b1 > b2 and b1 >= t1:
+            draw_flat_span(framebuffer, flat_tex, b1, span_start[b1], x - 1, light_table,
+                           world_z, y_slope, width, player_dir_x, player_dir_y, player_x, player_y)
+            b1 -= 1
+        while t2 < t1 and t2 <= b2:
+            span_start[t2] = x
+            t2 += 1
+        while b2 > b1 and b2 >= t2:
+            span_start[b2] = x
+            b2 -= 1
+
+        t1, b1 = top, bottom
+
+
+@njit(nogil=True, cache=True)
+def draw_sky_columns(framebuffer, tops, bottoms, min_x, max_x, sky_strip, player_angle,
+                     x_to_angle):
+    # the rows of each sky column are one slice of the prescaled, shaded sky strip,
+    # the strip column picked by the view angle
+    sky_w = len(sky_strip)
+    for x in range(min_x, max_x + 1):
+        y1, y2 = tops[x], bottoms[x]
+        if y1 <= y2:
+            tex_column = int(2.2 * (player_angle + x_to_angle[x])) % sky_w
+            framebuffer[x, y1: y2 + 1] = sky_strip[tex_column, y1: y2 + 1]
+
+
+# ----------------------------------------------------------------------------- #
+# whole-span kernels, one call per visible range of a seg
+#   view: (player_angle, player_x, player_y)
+#   tables: (x_to_angle, fine_sine, fine_tangent, y_slope, width, h_height), see RenderTables
+#   plane: (world_z, plane_id)
+#   marks: (visplane tops, visplane bottoms)
+#   wall: (rw_scale1, rw_scale_step, rw_distance, rw_offset, rw_center_angle)
+@njit(cache=True)
+def mark_plane_col(plane, x, y1, y2, marks):
+    # floors, ceilings and the sky only mark their rows in the visplane,
+    # to be drawn once all walls are done
+    if y1 < y2:
+        world_z, plane_id = plane
+        tops, bottoms = marks
+        # a column marked twice by the same wall only ever grows
+        tops[plane_id, x] = min(tops[plane_id, x], y1)
+        bottoms[plane_id, x] = max(bottoms[plane_id, x], y2)
+
+
+@njit(nogil=True, cache=True)
+def draw_solid_wall_range(framebuffer, x1, x2, upper_clip, lower_clip, tables, marks, wall,
+                          light_table, ceil, floor, b_draw_ceil, b_draw_floor, wall_texture, b_draw_wall, middle_tex_alt):
+    rw_scale1, rw_scale_step, rw_distance, rw_offset, rw_center_angle = wall
+    x_to_angle, fine_tangent, h_height = tables[0], tables[2], tables[5]
+    world_front_z1, world_front_z2 = ceil[0], floor[0]
+
+    # determine where on the screen the wall is drawn
+    wall_y1 = h_height - world_front_z1 * rw_scale1
+    wall_y1_step = -rw_scale_step * world_front_z1
+
+    wall_y2 = h_height - world_front_z2 * rw_scale1
+    wall_y2_step = -rw_scale_step * world_front_z2
+
+    for x in range(x1, x2 + 1):
+        draw_wall_y1 = wall_y1 - 1
+        draw_wall_y2 = wall_y2
+
+        if b_draw_ceil:
+            cy1 = upper_clip[x] + 1
+            cy2 = int(min(draw_wall_y1 - 1, lower_clip[x] - 1))
+            mark_plane_col(ceil, x, cy1, cy2, marks)
+
+        if b_draw_wall:
+            wy1 = int(max(draw_wall_y1, upper_clip[x] + 1))
+            wy2 = int(min(draw_wall_y2, lower_clip[x] - 1))
+
+            if wy1 < wy2:
+                fine_angle = int((rw_center_angle - x_to_angle[x]) * DEG_TO_FINE) & FINE_MASK
+                texture_column = rw_distance * fine_tangent[fine_angle] - rw_offset
+                inv_scale = 1.0 / rw_scale1
+
+                draw_wall_col(framebuffer, wall_texture, texture_column, x, wy1, wy2,
+                              middle_tex_alt, inv_scale, light_table, h_height)
+
+        if b_draw_floor:
+            fy1 = int(max(draw_wall_y2 + 1, upper_clip[x] + 1))
+            fy2 = lower_clip[x] - 1
+            mark_plane_col(floor, x, fy1, fy2, marks)
+
+        rw_scale1 += rw_scale_step
+        wall_y1 += wall_y1_step
+        wall_y2 += wall_y2_step
+
+
+@njit(nogil=True, cache=True)
+def draw_portal_wall_range(framebuffer, x1, x2, upper_clip, lower_clip, tables, marks, wall,
+                           light_table, ceil, floor, b_draw_ceil, b_draw_floor,
+                           upper_wall_texture, b_draw_upper_wall, upper_tex_alt, world_back_z1,
+                           lower_wall_texture, b_draw_lower_wall, lower_tex_alt, world_back_z2):
+    rw_scale1, rw_scale_step, rw_distance, rw_offset, rw_center_angle = wall
+    x_to_angle, fine_tangent, h_height = tables[0], tables[2], tables[5]
+    world_front_z1, world_front_z2 = ceil[0], floor[0]
+    seg_textured = b_draw_upper_wall or b_draw_lower_wall
+
+    # the y positions of the top / bottom edges of the wall on the screen
+    wall_y1 = h_height - world_front_z1 * rw_scale1
+    wall_y1_step = -rw_scale_step * world_front_z1
+    wall_y2 = h_height - world_front_z2 * rw_scale1
+    wall_y2_step = -rw_scale_step * world_front_z2
+
+    # the y position of the top edge of the portal
+    portal_y1, portal_y1_step = 0.0, 0.0
+    if b_draw_upper_wall:
+        if world_back_z1 > world_front_z2:
+            portal_y1 = h_height - world_back_z1 * rw_scale1
+            portal_y1_step = -rw_scale_step * world_back_z1
+        else:
+            portal_y1 = wall_y2
+            portal_y1_step = wall_y2_step
+
+    portal_y2, portal_y2_step = 0.0, 0.0
+    if b_draw_lower_wall:
+        if world_back_z2 < world_front_z1:
+            portal_y2 = h_height - world_back_z2 * rw_scale1
+            portal_y2_step = -rw_scale_step * world_back_z2
+        else:
+            portal_y2 = wall_y1
+            portal_y2_step = wall_y1_step
+
+    texture_column, inv_scale = 0.0, 0.0
+    for x in range(x1, x2 + 1):
+        draw_wall_y1 = wall_y1 - 1
+        draw_wall_y2 = wall_y2
+
+        if seg_textured:
+            fine_angle = int((rw_center_angle - x_to_angle[x]) * DEG_TO_FINE) & FINE_MASK
+            texture_column = rw_distance * fine_tangent[fine_angle] - rw_offset
+            inv_scale = 1.0 / rw_scale1
+
+        if b_draw_upper_wall:
+            draw_upper_wall_y1 = wall_y1 - 1
+            draw_upper_wall_y2 = portal_y1
+
+            if b_draw_ceil:
+                cy1 = upper_clip[x] + 1
+                cy2 = int(min(draw_wall_y1 - 1, lower_clip[x] - 1))
+                mark_plane_col(ceil, x, cy1, cy2, marks)
+
+            wy1 = int(max(draw_upper_wall_y1, upper_clip[x] + 1))
+            wy2 = int(min(draw_upper_wall_y2, lower_clip[x] - 1))
+
+            draw_wall_col(framebuffer, upper_wall_texture, texture_column, x, wy1, wy2,
+                          upper_tex_alt, inv_scale, light_table, h_height)
+
+            if upper_clip[x] < wy2:
+                upper_clip[x] = wy2
+
+            portal_y1 += portal_y1_step
+
+        if b_draw_ceil:
+            cy1 = upper_clip[x] + 1
+            cy2 = int(min(draw_wall_y1 - 1, lower_clip[x] - 1))
+            mark_plane_col(ceil, x, cy1, cy2, marks)
+
+            if upper_clip[x] < cy2:
+                upper_clip[x] = cy2
+
+        if b_draw_lower_wall:
+
+            if b_draw_floor:
+                fy1 = int(max(draw_wall_y2 + 1, upper_clip[x] + 1))
+                fy2 = lower_clip[x] - 1
+                mark_plane_col(floor, x, fy1, fy2, marks)
+
+            draw_lower_wall_y1 = portal_y2 - 1
+            draw_lower_wall_y2 = wall_y2
+
+            wy1 = int(max(draw_lower_wall_y1, upper_clip[x] + 1))
+            wy2 = int(min(draw_lower_wall_y2, lower_clip[x] - 1))
+            #
+            draw_wall_col(framebuffer, lower_wall_texture, texture_column, x, wy1, wy2,
+                          lower_tex_alt, inv_scale, light_table, h_height)
+
+            if lower_clip[x] > wy1:
+                lower_clip[x] = wy1
+
+            portal_y2 += portal_y2_step
+
+        if b_draw_floor:
+
+            fy1 = int(max(draw_wall_y2 + 1, upper_clip[x] + 1))
+            fy2 = lower_clip[x] - 1
+            mark_plane_col(floor, x, fy1, fy2, marks)
+
+            if lower_clip[x] > draw_wall_y2 + 1:
+                lower_clip[x] = fy1
+
+        rw_scale1 += rw_scale_step
+        wall_y1 += wall_y1_step
+        wall_y2 += wall_y2_step
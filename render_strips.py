@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from bsp import BSP
+from seg_handler import SegHandler
+
+
+class RenderStrips:
+    # the 3D view split into vertical strips, each with its own BSP walk, clip state
+    # and visplanes; the strips draw disjoint framebuffer columns, so with more than
+    # one they run on a thread pool while the kernels release the GIL
+    def __init__(self, engine, num_strips=1):
+        self.engine = engine
+        bounds = np.linspace(0, engine.tables.width, num_strips + 1).astype(int).tolist()
+        self.strips = []
+        for x_first, x_next in zip(bounds, bounds[1:]):
+            seg_handler = SegHandler(engine, x_first, x_next - 1)
+            self.strips.append((BSP(engine, seg_handler), seg_handler))
+        self.pool = ThreadPoolExecutor(num_strips) if num_strips > 1 else None
+
+    def render(self):
+        if self.pool is None:
+            self.render_strip(*self.strips[0])
+        else:
+            # wait for all strips, re-raising the first error
+            for _ in self.pool.map(lambda strip: self.render_strip(*strip), self.strips):
+                pass
+
+    def render_strip(self, bsp, seg_handler):
+        seg_handler.update()
+        bsp.update()
+        self.engine.view_renderer.draw_planes(seg_handler.visplanes)
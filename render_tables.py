@@ -0,0 +1,42 @@
+import math
+import numpy as np
+
+# angles stay in degrees everywhere and index the tables as fine angles:
+# fine = int(angle * DEG_TO_FINE) & FINE_MASK
+# the kernels read these as globals and are cached on disk, numba does not see a
+# change here: clear the __pycache__ directories after editing them
+FINE_ANGLES = 8192
+FINE_MASK = FINE_ANGLES - 1
+DEG_TO_FINE = FINE_ANGLES / 360
+RAD_TO_DEG = 180 / math.pi
+
+
+class RenderTables:
+    # trig and projection lookup tables for one screen size and field of view
+    def __init__(self, width, height, fov):
+        self.width, self.height = width, height
+        self.h_width, self.h_height = width // 2, height // 2
+        self.screen_dist = self.h_width / math.tan(math.radians(fov / 2))
+
+        fine_angles = np.arange(FINE_ANGLES) * (2 * math.pi / FINE_ANGLES)
+        # sine over 5/4 of a turn, so the cosine is a view of it a quarter turn later
+        self.fine_sine = np.sin(np.arange(FINE_ANGLES * 5 // 4) * (2 * math.pi / FINE_ANGLES))
+        self.fine_cosine = self.fine_sine[FINE_ANGLES // 4:]
+        self.fine_tangent = np.tan(fine_angles)
+
+        # view angle relative to the player -> screen column
+        angle_to_x = (self.screen_dist - self.fine_tangent * self.h_width).astype(np.int64)
+        self.angle_to_x = np.clip(angle_to_x, 0, width)
+        # screen column -> view angle relative to the player
+        columns = np.arange(width + 1)
+        self.x_to_angle = np.degrees(np.arctan((self.h_width - columns) / self.screen_dist))
+        # 1 / cos of the column angle, the distance along the ray per unit of depth
+        self.dist_scale = 1 / np.cos(np.radians(self.x_to_angle))
+        # screen row -> depth of a plane one unit above / below the eye (0 on the horizon)
+        rows = self.h_height - np.arange(height)
+        self.y_slope = np.divide(self.h_width, rows, out=np.zeros(height), where=rows != 0)
+
+    def get_kernel_tables(self):
+        # the tables the span kernels index, with the screen size they were built for
+        return (self.x_to_angle, self.fine_sine, self.fine_tangent, self.y_slope,
+                self.width, self.h_height)
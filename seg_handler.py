@@ -1,84 +1,100 @@
 from settings import *
+import numpy as np
+import render_kernels
+from visplanes import VisPlanes
+from render_tables import FINE_MASK, DEG_TO_FINE
 
 
 class SegHandler:
     MAX_SCALE = 64.0
     MIN_SCALE = 0.00390625
 
-    def __init__(self, engine):
+    def __init__(self, engine, x_first=0, x_last=None):
         self.engine = engine
         self.wad_data = engine.wad_data
         self.player = engine.player
         self.framebuffer = self.engine.framebuffer
         self.textures = self.wad_data.asset_data.textures
         self.sky_id = self.wad_data.asset_data.sky_id
+        self.texture_names = self.wad_data.texture_names
         #
         self.seg = None
         self.rw_angle1 = None
-        self.screen_range: set = None
-        self.x_to_angle = self.get_x_to_angle_table()
-        self.upper_clip, self.lower_clip = [], []
+        # lookup tables: arrays for the kernels, lists for the python side
+        self.tables = engine.tables
+        self.kernel_tables = self.tables.get_kernel_tables()
+        self.x_to_angle = self.tables.x_to_angle
+        self.x_to_angle_list = self.tables.x_to_angle.tolist()
+        # screen distance / cos of the column angle
+        self.column_scale = (self.tables.dist_scale * self.tables.screen_dist).tolist()
+        self.fine_sine = self.tables.fine_sine.tolist()
+        self.fine_cosine = self.tables.fine_cosine.tolist()
+        # everything is sized for the internal render resolution
+        width, height = self.tables.width, self.tables.height
+        # the columns drawn by this handler, the whole screen unless it renders a strip
+        self.x_first = x_first
+        self.x_last = width - 1 if x_last is None else x_last
+        self.upper_clip = np.full(width, -1, dtype=np.int32)
+        self.lower_clip = np.full(width, height, dtype=np.int32)
+        self.visplanes = VisPlanes(width, height)
 
     def update(self):
         self.init_floor_ceil_clip_height()
-        self.init_screen_range()
+        self.visplanes.clear()
 
     def init_floor_ceil_clip_height(self):
-        self.upper_clip = [-1 for _ in range(WIDTH)]
-        self.lower_clip = [HEIGHT for _ in range(WIDTH)]
-
-    @staticmethod
-    def get_x_to_angle_table():
-        x_to_angle = []
-        for i in range(0, WIDTH + 1):
-            angle = math.degrees(math.atan((H_WIDTH - i) / SCREEN_DIST))
-            x_to_angle.append(angle)
-        return x_to_angle
+        self.upper_clip.fill(-1)
+        self.lower_clip.fill(self.tables.height)
 
     def scale_from_global_angle(self, x, rw_normal_angle, rw_distance):
-        x_angle = self.x_to_angle[x]
-        num = SCREEN_DIST * math.cos(math.radians(rw_normal_angle - x_angle - self.player.angle))
-        den = rw_distance * math.cos(math.radians(x_angle))
-
-        scale = num / den
+        fine_angle = int((rw_normal_angle - self.x_to_angle_list[x] - self.player.angle)
+                         * DEG_TO_FINE) & FINE_MASK
+        scale = self.column_scale[x] * self.fine_cosine[fine_angle] / rw_distance
         scale = min(self.MAX_SCALE, max(self.MIN_SCALE, scale))
         return scale
 
-    def init_screen_range(self):
-        self.screen_range = set(range(WIDTH))
+    def get_plane(self, tex_id, world_z, light_level, is_drawn, x1, x2):
+        # (relative height, visplane) as taken by the span kernels
+        if not is_drawn:
+            return float(world_z), -1
+        if tex_id == self.sky_id:
+            # the sky looks the same at any height and light level
+            key = 0, tex_id, 1.0
+        else:
+            key = world_z, tex_id, light_level
+        return float(world_z), self.visplanes.check_plane(key, x1, x2)
+
+    def get_wall_texture(self, tex_handle, is_drawn):
+        # parts that are not drawn still need an array of the same type
+        if is_drawn:
+            return self.textures[self.texture_names[tex_handle]]
+        return self.engine.view_renderer.sky_tex
 
     def draw_solid_wall_range(self, x1, x2):
         # some aliases to shorten the following code
         seg = self.seg
         front_sector = seg.front_sector
-        line = seg.linedef
-        side = seg.linedef.front_sidedef
         renderer = self.engine.view_renderer
-        upper_clip = self.upper_clip
-        lower_clip = self.lower_clip
-        framebuffer = self.framebuffer
 
         # textures
-        wall_texture_id = side.middle_texture
-        ceil_texture_id = front_sector.ceil_texture
-        floor_texture_id = front_sector.floor_texture
-        light_level = front_sector.light_level
+        light_table = renderer.get_light_table(front_sector.light_level)
 
         # calculate the relative plane heights of front sector
-        world_front_z1 = front_sector.ceil_height - self.player.height
+        world_front_z1 = seg.front_ceil_height - self.player.height
         world_front_z2 = front_sector.floor_height - self.player.height
 
         # check which parts must be rendered
-        b_draw_wall = side.middle_texture != '-'
-        b_draw_ceil = world_front_z1 > 0 or front_sector.ceil_texture == self.sky_id
+        b_draw_wall = seg.middle_texture != 0
+        b_draw_ceil = world_front_z1 > 0 or seg.is_ceil_sky
         b_draw_floor = world_front_z2 < 0
 
         # calculate the scaling factors of the left and right edges of the wall range
-        rw_normal_angle = seg.angle + 90
+        rw_normal_angle = seg.normal_angle
         offset_angle = rw_normal_angle - self.rw_angle1
 
-        hypotenuse = math.dist(self.player.pos, seg.start_vertex)
-        rw_distance = hypotenuse * math.cos(math.radians(offset_angle))
+        # start vertex relative to the player, along the seg normal and direction
+        dx, dy = seg.start_x - self.player.pos.x, seg.start_y - self.player.pos.y
+        rw_distance = seg.dir_x * dy - seg.dir_y * dx
 
         rw_scale1 = self.scale_from_global_angle(x1, rw_normal_angle, rw_distance)
 
@@ -94,106 +110,57 @@ class SegHandler:
 
         # -------------------------------------------------------------------------- #
         # determine how the wall texture are vertically aligned
-        wall_texture = self.textures[wall_texture_id]
-        if line.flags & self.wad_data.LINEDEF_FLAGS['DONT_PEG_BOTTOM']:
+        wall_texture = self.get_wall_texture(seg.middle_texture, b_draw_wall)
+        if seg.dont_peg_bottom:
             v_top = front_sector.floor_height + wall_texture.shape[1]
             middle_tex_alt = v_top - self.player.height
         else:
             middle_tex_alt = world_front_z1
-        middle_tex_alt += side.y_offset
+        middle_tex_alt += seg.y_offset
 
         # determine how the wall textures are horizontally aligned
-        rw_offset = hypotenuse * math.sin(math.radians(offset_angle))
-        rw_offset += seg.offset + side.x_offset
+        rw_offset = seg.dir_x * dx + seg.dir_y * dy + seg.x_offset
         #
         rw_center_angle = rw_normal_angle - self.player.angle
         # -------------------------------------------------------------------------- #
 
-        # determine where on the screen the wall is drawn
-        wall_y1 = H_HEIGHT - world_front_z1 * rw_scale1
-        wall_y1_step = -rw_scale_step * world_front_z1
-
-        wall_y2 = H_HEIGHT - world_front_z2 * rw_scale1
-        wall_y2_step = -rw_scale_step * world_front_z2
-
-        # now the rendering is carried out
-        for x in range(x1, x2 + 1):
-            draw_wall_y1 = wall_y1 - 1
-            draw_wall_y2 = wall_y2
-
-            if b_draw_ceil:
-                cy1 = upper_clip[x] + 1
-                cy2 = int(min(draw_wall_y1 - 1, lower_clip[x] - 1))
-                renderer.draw_flat(ceil_texture_id, light_level, x, cy1, cy2, world_front_z1)
-
-            if b_draw_wall:
-                wy1 = int(max(draw_wall_y1, upper_clip[x] + 1))
-                wy2 = int(min(draw_wall_y2, lower_clip[x] - 1))
-
-                if wy1 < wy2:
-                    angle = rw_center_angle - self.x_to_angle[x]
-                    texture_column = rw_distance * math.tan(math.radians(angle)) - rw_offset
-                    inv_scale = 1.0 / rw_scale1
-
-                    renderer.draw_wall_col(framebuffer, wall_texture, texture_column, x, wy1, wy2,
-                                           middle_tex_alt, inv_scale, light_level)
-
-            if b_draw_floor:
-                fy1 = int(max(draw_wall_y2 + 1, upper_clip[x] + 1))
-                fy2 = lower_clip[x] - 1
-                renderer.draw_flat(floor_texture_id, light_level, x, fy1, fy2, world_front_z2)
-
-            rw_scale1 += rw_scale_step
-            wall_y1 += wall_y1_step
-            wall_y2 += wall_y2_step
+        # floors and ceilings go to their visplanes
+        light_level = front_sector.light_level
+        ceil = self.get_plane(
+            front_sector.ceil_texture, world_front_z1, light_level, b_draw_ceil, x1, x2)
+        floor = self.get_plane(
+            front_sector.floor_texture, world_front_z2, light_level, b_draw_floor, x1, x2)
+
+        # now the rendering of the whole range is carried out in one call
+        render_kernels.draw_solid_wall_range(
+            self.framebuffer, x1, x2, self.upper_clip, self.lower_clip, self.kernel_tables,
+            (self.visplanes.tops, self.visplanes.bottoms),
+            (rw_scale1, float(rw_scale_step), rw_distance, rw_offset, float(rw_center_angle)),
+            light_table, ceil, floor, b_draw_ceil, b_draw_floor,
+            wall_texture, b_draw_wall, float(middle_tex_alt)
+        )
 
     def draw_portal_wall_range(self, x1, x2):
         # some aliases to shorten the following code
         seg = self.seg
         front_sector = seg.front_sector
         back_sector = seg.back_sector
-        line = seg.linedef
-        side = seg.linedef.front_sidedef
         renderer = self.engine.view_renderer
-        upper_clip = self.upper_clip
-        lower_clip = self.lower_clip
-        framebuffer = self.framebuffer
 
         # textures
-        upper_wall_texture = side.upper_texture
-        lower_wall_texture = side.lower_texture
-        tex_ceil_id = front_sector.ceil_texture
-        tex_floor_id = front_sector.floor_texture
-        light_level = front_sector.light_level
+        light_table = renderer.get_light_table(front_sector.light_level)
 
         # calculate the relative plane heights of front and back sector
-        world_front_z1 = front_sector.ceil_height - self.player.height
+        world_front_z1 = seg.front_ceil_height - self.player.height
         world_back_z1 = back_sector.ceil_height - self.player.height
         world_front_z2 = front_sector.floor_height - self.player.height
         world_back_z2 = back_sector.floor_height - self.player.height
 
-        # sky hack
-        if front_sector.ceil_texture == back_sector.ceil_texture == self.sky_id:
-            world_front_z1 = world_back_z1
-
         # check which parts must be rendered
-        if (world_front_z1 != world_back_z1 or
-                front_sector.light_level != back_sector.light_level or
-                front_sector.ceil_texture != back_sector.ceil_texture):
-            b_draw_upper_wall = side.upper_texture != '-' and world_back_z1 < world_front_z1
-            b_draw_ceil = world_front_z1 >= 0 or front_sector.ceil_texture == self.sky_id
-        else:
-            b_draw_upper_wall = False
-            b_draw_ceil = False
-
-        if (world_front_z2 != world_back_z2 or
-                front_sector.floor_texture != back_sector.floor_texture or
-                front_sector.light_level != back_sector.light_level):
-            b_draw_lower_wall = side.lower_texture != '-' and world_back_z2 > world_front_z2
-            b_draw_floor = world_front_z2 <= 0
-        else:
-            b_draw_lower_wall = False
-            b_draw_floor = False
+        b_draw_upper_wall = seg.draw_upper_wall
+        b_draw_ceil = seg.is_ceil_changed and (world_front_z1 >= 0 or seg.is_ceil_sky)
+        b_draw_lower_wall = seg.draw_lower_wall
+        b_draw_floor = seg.is_floor_changed and world_front_z2 <= 0
 
         # if nothing must be rendered, we can skip this seg
         if (not b_draw_upper_wall and not b_draw_ceil and not b_draw_lower_wall and
@@ -201,11 +168,11 @@ class SegHandler:
             return None
 
         # calculate the scaling factors of the left and right edges of the wall range
-        rw_normal_angle = seg.angle + 90
-        offset_angle = rw_normal_angle - self.rw_angle1
+        rw_normal_angle = seg.normal_angle
 
-        hypotenuse = math.dist(self.player.pos, seg.start_vertex)
-        rw_distance = hypotenuse * math.cos(math.radians(offset_angle))
+        # start vertex relative to the player, along the seg normal and direction
+        dx, dy = seg.start_x - self.player.pos.x, seg.start_y - self.player.pos.y
+        rw_distance = seg.dir_x * dy - seg.dir_y * dx
 
         rw_scale1 = self.scale_from_global_angle(x1, rw_normal_angle, rw_distance)
         if x2 > x1:
@@ -215,196 +182,58 @@ class SegHandler:
             rw_scale_step = 0
 
         # determine how the wall textures are vertically aligned
+        upper_wall_texture = self.get_wall_texture(seg.upper_texture, b_draw_upper_wall)
+        upper_tex_alt = 0
         if b_draw_upper_wall:
-            upper_wall_texture = self.textures[side.upper_texture]
-
-            if line.flags & self.wad_data.LINEDEF_FLAGS['DONT_PEG_TOP']:
+            if seg.dont_peg_top:
                 upper_tex_alt = world_front_z1
             else:
                 v_top = back_sector.ceil_height + upper_wall_texture.shape[1]
                 upper_tex_alt = v_top - self.player.height
-            upper_tex_alt += side.y_offset
+            upper_tex_alt += seg.y_offset
 
+        lower_wall_texture = self.get_wall_texture(seg.lower_texture, b_draw_lower_wall)
+        lower_tex_alt = 0
         if b_draw_lower_wall:
-            lower_wall_texture = self.textures[side.lower_texture]
-
-            if line.flags & self.wad_data.LINEDEF_FLAGS['DONT_PEG_BOTTOM']:
+            if seg.dont_peg_bottom:
                 lower_tex_alt = world_front_z1
             else:
                 lower_tex_alt = world_back_z2
-            lower_tex_alt += side.y_offset
+            lower_tex_alt += seg.y_offset
 
         # determine how the wall textures are horizontally aligned
-        if seg_textured:= b_draw_upper_wall or b_draw_lower_wall:
-            rw_offset = hypotenuse * math.sin(math.radians(offset_angle))
-            rw_offset += seg.offset + side.x_offset
+        rw_offset, rw_center_angle = 0, 0
+        if b_draw_upper_wall or b_draw_lower_wall:
+            rw_offset = seg.dir_x * dx + seg.dir_y * dy + seg.x_offset
             #
             rw_center_angle = rw_normal_angle - self.player.angle
 
-        # the y positions of the top / bottom edges of the wall on the screen
-        wall_y1 = H_HEIGHT - world_front_z1 * rw_scale1
-        wall_y1_step = -rw_scale_step * world_front_z1
-        wall_y2 = H_HEIGHT - world_front_z2 * rw_scale1
-        wall_y2_step = -rw_scale_step * world_front_z2
-
-        # the y position of the top edge of the portal
-        if b_draw_upper_wall:
-            if world_back_z1 > world_front_z2:
-                portal_y1 = H_HEIGHT - world_back_z1 * rw_scale1
-                portal_y1_step = -rw_scale_step * world_back_z1
-            else:
-                portal_y1 = wall_y2
-                portal_y1_step = wall_y2_step
-
-        if b_draw_lower_wall:
-            if world_back_z2 < world_front_z1:
-                portal_y2 = H_HEIGHT - world_back_z2 * rw_scale1
-                portal_y2_step = -rw_scale_step * world_back_z2
-            else:
-                portal_y2 = wall_y1
-                portal_y2_step = wall_y1_step
-
-        # now the rendering is carried out
-        for x in range(x1, x2 + 1):
-            draw_wall_y1 = wall_y1 - 1
-            draw_wall_y2 = wall_y2
-
-            if seg_textured:
-                angle = rw_center_angle - self.x_to_angle[x]
-                texture_column = rw_distance * math.tan(math.radians(angle)) - rw_offset
-                inv_scale = 1.0 / rw_scale1
-
-            if b_draw_upper_wall:
-                draw_upper_wall_y1 = wall_y1 - 1
-                draw_upper_wall_y2 = portal_y1
-
-                if b_draw_ceil:
-                    cy1 = upper_clip[x] + 1
-                    cy2 = int(min(draw_wall_y1 - 1, lower_clip[x] - 1))
-                    renderer.draw_flat(tex_ceil_id, light_level, x, cy1, cy2, world_front_z1)
-
-                wy1 = int(max(draw_upper_wall_y1, upper_clip[x] + 1))
-                wy2 = int(min(draw_upper_wall_y2, lower_clip[x] - 1))
-
-                renderer.draw_wall_col(framebuffer, upper_wall_texture, texture_column, x, wy1, wy2,
-                                       upper_tex_alt, inv_scale, light_level)
-
-                if upper_clip[x] < wy2:
-                    upper_clip[x] = wy2
-
-                portal_y1 += portal_y1_step
-
-            if b_draw_ceil:
-                cy1 = upper_clip[x] + 1
-                cy2 = int(min(draw_wall_y1 - 1, lower_clip[x] - 1))
-                renderer.draw_flat(tex_ceil_id, light_level, x, cy1, cy2, world_front_z1)
-
-                if upper_clip[x] < cy2:
-                    upper_clip[x] = cy2
-
-            if b_draw_lower_wall:
-
-                if b_draw_floor:
-                    fy1 = int(max(draw_wall_y2 + 1, upper_clip[x] + 1))
-                    fy2 = lower_clip[x] - 1
-                    renderer.draw_flat(tex_floor_id, light_level, x, fy1, fy2, world_front_z2)
-
-                draw_lower_wall_y1 = portal_y2 - 1
-                draw_lower_wall_y2 = wall_y2
-
-                wy1 = int(max(draw_lower_wall_y1, upper_clip[x] + 1))
-                wy2 = int(min(draw_lower_wall_y2, lower_clip[x] - 1))
-                #
-                renderer.draw_wall_col(framebuffer, lower_wall_texture, texture_column, x, wy1, wy2,
-                                       lower_tex_alt, inv_scale, light_level)
-
-                if lower_clip[x] > wy1:
-                    lower_clip[x] = wy1
-
-                portal_y2 += portal_y2_step
-
-            if b_draw_floor:
-
-                fy1 = int(max(draw_wall_y2 + 1, upper_clip[x] + 1))
-                fy2 = lower_clip[x] - 1
-                renderer.draw_flat(tex_floor_id, light_level, x, fy1, fy2, world_front_z2)
-
-                if lower_clip[x] > draw_wall_y2 + 1:
-                    lower_clip[x] = fy1
-
-            rw_scale1 += rw_scale_step
-            wall_y1 += wall_y1_step
-            wall_y2 += wall_y2_step
-
-    def clip_portal_walls(self, x_start, x_end):
-        curr_wall = set(range(x_start, x_end))
-        #
-        if intersection := curr_wall & self.screen_range:
-            #
-            if len(intersection) == len(curr_wall):
-                self.draw_portal_wall_range(x_start, x_end - 1)
-            else:
-                arr = sorted(intersection)
-                x = arr[0]
-                for x1, x2 in zip(arr, arr[1:]):
-                    if x2 - x1 > 1:
-                        self.draw_portal_wall_range(x, x1)
-                        x = x2
-                #
-                self.draw_portal_wall_range(x, arr[-1])
-
-    def clip_solid_walls(self, x_start, x_end):
-        if self.screen_range:
-            curr_wall = set(range(x_start, x_end))
-            #
-            if intersection := curr_wall & self.screen_range:
-                #
-                if len(intersection) == len(curr_wall):
-                    self.draw_solid_wall_range(x_start, x_end - 1)
-                else:
-                    arr = sorted(intersection)
-                    x, x2 = arr[0], arr[-1]
-                    for x1, x2 in zip(arr, arr[1:]):
-                        if x2 - x1 > 1:
-                            self.draw_solid_wall_range(x, x1)
-                            x = x2
-                    self.draw_solid_wall_range(x, x2)
-                #
-                self.screen_range -= intersection
-        else:
-            self.engine.bsp.is_traverse_bsp = False
-
-    def classify_segment(self, segment, x1, x2, rw_angle1):
-        # add seg data
-        self.seg = segment
+        # floors and ceilings go to their visplanes
+        light_level = front_sector.light_level
+        ceil = self.get_plane(
+            front_sector.ceil_texture, world_front_z1, light_level, b_draw_ceil, x1, x2)
+        floor = self.get_plane(
+            front_sector.floor_texture, world_front_z2, light_level, b_draw_floor, x1, x2)
+
+        # now the rendering of the whole range is carried out in one call
+        render_kernels.draw_portal_wall_range(
+            self.framebuffer, x1, x2, self.upper_clip, self.lower_clip, self.kernel_tables,
+            (self.visplanes.tops, self.visplanes.bottoms),
+            (rw_scale1, float(rw_scale_step), rw_distance, float(rw_offset), float(rw_center_angle)),
+            light_table, ceil, floor, b_draw_ceil, b_draw_floor,
+            upper_wall_texture, b_draw_upper_wall, float(upper_tex_alt), float(world_back_z1),
+            lower_wall_texture, b_draw_lower_wall, float(lower_tex_alt), float(world_back_z2)
+        )
+
+    def draw_seg_range(self, seg, x1, x2, rw_angle1):
+        # one visible range of a seg, as emitted by the BSP walk
+        self.seg = seg
         self.rw_angle1 = rw_angle1
 
-        # does not cross a pixel?
-        if x1 == x2:
-            return None
-
-        back_sector = segment.back_sector
-        front_sector = segment.front_sector
-
         # handle solid walls
-        if back_sector is None:
-            self.clip_solid_walls(x1, x2)
-            return None
-
-        # wall with window
-        if (front_sector.ceil_height != back_sector.ceil_height or
-                front_sector.floor_height != back_sector.floor_height):
-            self.clip_portal_walls(x1, x2)
-            return None
-
-        # reject empty lines used for triggers and special events.
-        # identical floor and ceiling on both sides, identical
-        # light levels on both sides, and no middle texture.
-        if (back_sector.ceil_texture == front_sector.ceil_texture and
-                back_sector.floor_texture == front_sector.floor_texture and
-                back_sector.light_level == front_sector.light_level and
-                self.seg.linedef.front_sidedef.middle_texture == '-'):
-            return None
+        if seg.is_solid:
+            self.draw_solid_wall_range(x1, x2)
 
-        # borders with different light levels and textures
-        self.clip_portal_walls(x1, x2)
+        # windows and borders with different light levels and textures
+        else:
+            self.draw_portal_wall_range(x1, x2)
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class SegProjection:
+    # segs projected to screen columns for the current view, subsector by subsector:
+    # the compiled BSP walk projects a subsector the first time it reaches it after the
+    # view changed, so the work per frame follows what is visited, not the size of the
+    # map. One per render strip, the strips walk in parallel
+    def __init__(self, engine):
+        self.player = engine.player
+        map_arrays = engine.wad_data.map_arrays
+        vertexes, segs = map_arrays.vertexes, map_arrays.segments
+        self.vertexes = np.stack([vertexes['x'], vertexes['y']], axis=1).astype(np.float64)
+        self.seg_vertex_ids = np.stack(
+            [segs['start_vertex_id'], segs['end_vertex_id']], axis=1).astype(np.int64)
+        # the view the caches are filled for, an entry is valid while its view id is current
+        self.view = None
+        self.view_id = 0
+        # per vertex: angle from the player in degrees
+        self.vertex_angles = np.zeros(len(vertexes))
+        self.vertex_view_ids = np.full(len(vertexes), -1, dtype=np.int64)
+        self.sub_sector_view_ids = np.full(len(map_arrays.sub_sectors), -1, dtype=np.int64)
+        # per seg: screen columns and the angle of the start vertex, is_visible is False
+        # for segs facing away or outside the field of view
+        self.x1 = np.zeros(len(segs), dtype=np.int64)
+        self.x2 = np.zeros(len(segs), dtype=np.int64)
+        self.rw_angle1 = np.zeros(len(segs))
+        self.is_visible = np.zeros(len(segs), dtype=np.bool_)
+
+    def update(self):
+        view = self.player.pos.x, self.player.pos.y, self.player.angle
+        if view != self.view:
+            self.view = view
+            self.view_id += 1
+
+    def get_kernel_arrays(self):
+        # as taken by the compiled BSP walk, see bsp_kernels.project_sub_sector
+        return (self.vertexes, self.seg_vertex_ids, self.view_id, self.vertex_angles,
+                self.vertex_view_ids, self.sub_sector_view_ids, self.x1, self.x2,
+                self.rw_angle1, self.is_visible)
@@ -6,14 +6,36 @@ DOOM_RES = DOOM_W, DOOM_H = 320, 200
 SCALE = 2.25
 WIN_RES = WIDTH, HEIGHT = int(DOOM_W * SCALE), int(DOOM_H * SCALE)
 H_WIDTH, H_HEIGHT = WIDTH // 2, HEIGHT // 2
+# size of the framebuffer the 3D view is drawn into, scaled up to WIN_RES when presented,
+# e.g. DOOM_RES for the native resolution or (WIDTH // 2, HEIGHT // 2)
+RENDER_RES = WIN_RES
+# vertical strips of the 3D view rendered in parallel, 1 = single threaded
+RENDER_STRIPS = 1
 
 FOV = 90.0
 H_FOV = FOV / 2
 
 PLAYER_SPEED = 0.3
 PLAYER_ROT_SPEED = 0.12
+# longest frame time in ms the movement is scaled by, a slow frame (the first one
+# compiles the kernels) does not send the player across the map
+MAX_FRAME_TIME = 100
 PLAYER_HEIGHT = 41
+# collision: radius, highest step up and the room needed under a ceiling
+PLAYER_RADIUS = 16
+MAX_STEP_HEIGHT = 24
+PLAYER_BODY_HEIGHT = 56
 
 SCREEN_DIST = H_WIDTH / math.tan(math.radians(H_FOV))
 
-COLOR_KEY = (152, 0, 136)
\ No newline at end of file
+COLOR_KEY = (152, 0, 136)
+
+# render palette indices lit through COLORMAP, converted to RGB once per frame
+INDEXED_MODE = False
+
+USE_ASSET_CACHE = True
+CACHE_DIR = 'cache'
+# worker processes for decoding assets at startup, 0 = decode serially
+ASSET_WORKERS = 0
+# draw the first frame before the assets are decoded, missing textures show a placeholder colour
+PROGRESSIVE_LOADING = False
@@ -0,0 +1,49 @@
+import numpy as np
+from asset_cache import AssetCache
+
+ARRAYS = {
+    'indices': np.arange(64 * 48, dtype=np.uint8).reshape(64, 48),
+    'offsets': np.array([0, 3, 7, 11], dtype=np.int64),
+    'records': np.array([(1, -2.5), (3, 4.0)], dtype=[('id', '<i4'), ('x', '<f8')]),
+    'empty': np.empty((0, 3), dtype=np.int32),
+}
+
+
+def make_cache(tmp_path, wad_bytes=b'PWAD' + bytes(8)):
+    wad_path = tmp_path / 'test.wad'
+    wad_path.write_bytes(wad_bytes)
+    return AssetCache([str(wad_path)], cache_dir=str(tmp_path / 'cache'), enabled=True)
+
+
+def test_round_trip(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.load('group') is None
+    assert not cache.has('group')
+    cache.save('group', ARRAYS)
+    assert cache.has('group')
+
+    arrays = cache.load('group')
+    assert arrays.keys() == ARRAYS.keys()
+    for name, array in ARRAYS.items():
+        assert arrays[name].dtype == array.dtype
+        assert arrays[name].shape == array.shape
+        assert np.array_equal(arrays[name], array)
+
+
+def test_version_mismatch_invalidates(tmp_path, monkeypatch):
+    make_cache(tmp_path).save('group', ARRAYS)
+    monkeypatch.setattr(AssetCache, 'VERSION', AssetCache.VERSION + 1)
+    assert make_cache(tmp_path).load('group') is None
+
+
+def test_wad_change_invalidates(tmp_path):
+    make_cache(tmp_path).save('group', ARRAYS)
+    assert make_cache(tmp_path, b'PWAD' + bytes(12)).load('group') is None
+
+
+def test_disabled(tmp_path):
+    cache = AssetCache([], cache_dir=str(tmp_path / 'cache'), enabled=False)
+    cache.save('group', ARRAYS)
+    assert cache.load('group') is None
+    assert not cache.has('group')
+    assert not (tmp_path / 'cache').exists()
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+import numpy as np
+from asset_cache import AssetCache
+from blockmap import BlockMap
+from data_types import MAP_VERTEX_DTYPE, LINEDEF_DTYPE, SIDEDEF_DTYPE, SECTOR_DTYPE
+
+
+def make_lump(origin_x, origin_y, num_columns, num_rows, block_lists):
+    # int16 header, a word offset per block, then 0, line ids..., 0xFFFF per block
+    words = [origin_x & 0xFFFF, origin_y & 0xFFFF, num_columns, num_rows]
+    offset = 4 + len(block_lists)
+    lists = []
+    for line_ids in block_lists:
+        words.append(offset)
+        lists += [0, *line_ids, 0xFFFF]
+        offset += len(line_ids) + 2
+    return np.array(words + lists, dtype='<u2').tobytes()
+
+
+def make_room():
+    # a 256 x 128 room of four one-sided lines
+    map_arrays = SimpleNamespace()
+    map_arrays.vertexes = np.array([(0, 0), (256, 0), (256, 128), (0, 128)], dtype=MAP_VERTEX_DTYPE)
+    map_arrays.linedefs = np.zeros(4, dtype=LINEDEF_DTYPE)
+    map_arrays.linedefs['start_vertex_id'] = [0, 1, 2, 3]
+    map_arrays.linedefs['end_vertex_id'] = [1, 2, 3, 0]
+    map_arrays.linedefs['back_sidedef_id'] = 0xFFFF
+    map_arrays.sidedefs = np.zeros(1, dtype=SIDEDEF_DTYPE)
+    map_arrays.sectors = np.zeros(1, dtype=SECTOR_DTYPE)
+    map_arrays.sectors['ceil_height'] = 128
+    return map_arrays
+
+
+def make_blockmap(lump):
+    wad_data = SimpleNamespace(
+        map_arrays=make_room(), cache=AssetCache([], enabled=False), map_index=0,
+        LUMP_INDICES={'BLOCKMAP': 0}, LINEDEF_FLAGS={'BLOCKING': 1},
+        reader=SimpleNamespace(get_lump_view=lambda lump_index: memoryview(lump)))
+    return BlockMap(wad_data, 'E1M1')
+
+
+def test_read_lump():
+    lump = make_lump(-8, -16, 2, 1, [[0, 3], [1, 2, 3]])
+    arrays = BlockMap.read_lump(None, lump, 4)
+    assert arrays['header'].tolist() == [-8, -16, 2, 1]
+    assert arrays['block_offsets'].tolist() == [0, 2, 5]
+    assert arrays['block_lines'].tolist() == [0, 3, 1, 2, 3]
+
+
+def test_read_lump_rejects_bad_offsets():
+    lump = bytearray(make_lump(0, 0, 2, 1, [[0], [1]]))
+    # an offset pointing into the offset table
+    lump[8:10] = (5).to_bytes(2, 'little')
+    assert BlockMap.read_lump(None, bytes(lump), 4) is None
+    # a line id past the linedefs
+    assert BlockMap.read_lump(None, make_lump(0, 0, 1, 1, [[7]]), 4) is None
+    # a list without its end marker
+    assert BlockMap.read_lump(None, make_lump(0, 0, 1, 1, [[0]])[:-2], 4) is None
+    # too short for a header, or no blocks
+    assert BlockMap.read_lump(None, b'\x00' * 6, 4) is None
+    assert BlockMap.read_lump(None, make_lump(0, 0, 0, 0, []), 4) is None
+
+
+def test_build_fallback():
+    blockmap = make_blockmap(make_lump(0, 0, 1, 1, [[9]]))
+    # origin 8 units outside the vertexes, 128 unit blocks
+    assert blockmap.header == (-8, -8, 3, 2)
+    assert blockmap.get_lines_near(4, 64, 1).tolist() == [0, 3]
+    assert blockmap.get_lines_near(4, 124, 1).tolist() == [2, 3]
+    assert blockmap.get_lines_near(252, 4, 8).tolist() == [0, 1]
+    assert blockmap.get_lines_in_box(-8, -8, 300, 200).tolist() == [0, 1, 2, 3]
+
+
+def test_lump_used_when_valid():
+    lump = make_lump(-8, -8, 1, 1, [[2]])
+    blockmap = make_blockmap(lump)
+    assert blockmap.header == (-8, -8, 1, 1)
+    assert blockmap.get_lines_near(100, 100, 1).tolist() == [2]
+
+
+def test_long_move_cannot_cross_a_wall():
+    blockmap = make_blockmap(b'')
+    # far past the right wall in one step, then along it
+    assert blockmap.get_blocking_line(200, 64, 600, 64, 0) == 1
+    assert blockmap.get_blocking_line(200, 64, 200, 90, 0) == -1
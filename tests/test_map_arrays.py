@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+import zlib
+import numpy as np
+from asset_cache import AssetCache
+from map_arrays import MapArrays
+from data_types import (THING_DTYPE, LINEDEF_DTYPE, SIDEDEF_DTYPE, VERTEX_DTYPE, SEG_DTYPE,
+                        SUB_SECTOR_DTYPE, NODE_DTYPE, SECTOR_DTYPE, EXT_NODES_VERTEX_DTYPE,
+                        EXT_NODES_SEG_DTYPE, EXT_NODES_NODE_DTYPE, SUB_SECTOR_FLAG,
+                        MAP_SUB_SECTOR_DTYPE)
+
+LUMP_INDICES = {
+    'THINGS': 1, 'LINEDEFS': 2, 'SIDEDEFS': 3, 'VERTEXES': 4, 'SEGS': 5,
+    'SSECTORS': 6, 'NODES': 7, 'SECTORS': 8
+}
+
+# a 128 x 128 room of four one-sided lines, split by the node line x = 64.5 into
+# a left (back) and a right (front) subsector
+ROOM_VERTEXES = [(0, 0), (128, 0), (128, 128), (0, 128)]
+SPLIT_VERTEXES = [(64.5, 0), (64.5, 128)]
+# (start vertex, end vertex, linedef or None for a miniseg) per subsector
+LEFT_SEGS = [(0, 4, 0), (5, 3, 2), (3, 0, 3), (4, 5, None)]
+RIGHT_SEGS = [(4, 1, 0), (1, 2, 1), (2, 5, 2), (5, 4, None)]
+
+
+def get_records(records, dtype):
+    return np.array(records, dtype=dtype).tobytes()
+
+
+def get_block(records, dtype):
+    # uint32 count then the records, as in the extended nodes
+    return np.uint32(len(records)).tobytes() + get_records(records, dtype)
+
+
+def get_node(front_child_id, back_child_id):
+    return (64, 0, 0, 128, 128, 0, 64, 128, 128, 0, 0, 65, front_child_id, back_child_id)
+
+
+def get_room_lumps(vertexes, nodes=b'', segs=b'', sub_sectors=b''):
+    linedefs = np.zeros(4, dtype=LINEDEF_DTYPE)
+    linedefs['start_vertex_id'] = [0, 1, 2, 3]
+    linedefs['end_vertex_id'] = [1, 2, 3, 0]
+    linedefs['front_sidedef_id'] = [0, 1, 2, 3]
+    linedefs['back_sidedef_id'] = 0xFFFF
+    sidedefs = np.zeros(4, dtype=SIDEDEF_DTYPE)
+    sidedefs['upper_texture'] = sidedefs['lower_texture'] = sidedefs['middle_texture'] = b'-'
+    return {
+        'THINGS': get_records([(32, 64, 0, 1, 7)], THING_DTYPE),
+        'LINEDEFS': linedefs.tobytes(),
+        'SIDEDEFS': sidedefs.tobytes(),
+        'VERTEXES': get_records(vertexes, VERTEX_DTYPE),
+        'SEGS': segs,
+        'SSECTORS': sub_sectors,
+        'NODES': nodes,
+        'SECTORS': get_records([(0, 128, b'FLAT', b'FLAT', 160, 0, 0)], SECTOR_DTYPE),
+    }
+
+
+def load_map_arrays(lumps):
+    lump_data = {LUMP_INDICES[name]: data for name, data in lumps.items()}
+    wad_data = SimpleNamespace(
+        reader=SimpleNamespace(get_lump_view=lambda lump_index: memoryview(lump_data[lump_index])),
+        cache=AssetCache([], enabled=False), LUMP_INDICES=LUMP_INDICES,
+        LINEDEF_FLAGS={'TWO_SIDED': 4}, get_lump_index=lambda lump_name: 0)
+    return MapArrays(wad_data, 'E1M1')
+
+
+def get_extended_nodes():
+    new_vertexes = [(int(x * 65536), int(y * 65536)) for x, y in SPLIT_VERTEXES]
+    segs = [(start, end, 0xFFFF if line is None else line, 0)
+            for start, end, line in LEFT_SEGS + RIGHT_SEGS]
+    nodes = [get_node(1 | SUB_SECTOR_FLAG, 0 | SUB_SECTOR_FLAG)]
+    return (np.uint32(len(ROOM_VERTEXES)).tobytes() +
+            get_block(new_vertexes, EXT_NODES_VERTEX_DTYPE) +
+            get_block([len(LEFT_SEGS), len(RIGHT_SEGS)], np.dtype('<u4')) +
+            get_block(segs, EXT_NODES_SEG_DTYPE) +
+            get_block(nodes, EXT_NODES_NODE_DTYPE))
+
+
+def check_extended_map(map_arrays):
+    assert len(map_arrays.vertexes) == 6
+    assert map_arrays.vertexes['x'][4:].tolist() == [64.5, 64.5]
+    assert map_arrays.vertexes['y'][4:].tolist() == [0.0, 128.0]
+
+    assert map_arrays.sub_sectors['seg_count'].tolist() == [4, 4]
+    assert map_arrays.sub_sectors['first_seg_id'].tolist() == [0, 4]
+    assert map_arrays.nodes['front_child_id'].tolist() == [1 | SUB_SECTOR_FLAG]
+    assert map_arrays.nodes['back_child_id'].tolist() == [SUB_SECTOR_FLAG]
+    assert map_arrays.nodes['x_partition'].tolist() == [64]
+
+    segs = map_arrays.segments
+    assert segs['linedef_id'].tolist() == [0, 2, 3, -1, 0, 1, 2, -1]
+    assert segs['start_vertex_id'].tolist() == [0, 5, 3, 4, 4, 1, 2, 5]
+    # derived from the vertexes: BAMs, and the distance along the linedef
+    assert segs['angle'].tolist()[4:7] == [0, 0x4000, -0x8000]
+    assert segs['offset'].tolist()[4:7] == [64, 0, 0]
+    assert np.allclose(map_arrays.seg_angles[4:7], [0, 90, 180])
+
+    # minisegs have no sidedef and the sector of their subsector on both sides
+    assert map_arrays.seg_front_sidedef_ids.tolist() == [0, 2, 3, -1, 0, 1, 2, -1]
+    assert map_arrays.seg_front_sector_ids.tolist() == [0] * 8
+    assert map_arrays.seg_back_sector_ids.tolist() == [-1, -1, -1, 0, -1, -1, -1, 0]
+
+
+def test_xnod():
+    map_arrays = load_map_arrays(get_room_lumps(ROOM_VERTEXES, b'XNOD' + get_extended_nodes()))
+    check_extended_map(map_arrays)
+
+
+def test_znod():
+    nodes = b'ZNOD' + zlib.compress(get_extended_nodes())
+    check_extended_map(load_map_arrays(get_room_lumps(ROOM_VERTEXES, nodes)))
+
+
+def test_vanilla_nodes():
+    # the same room with the split vertexes rounded, no minisegs
+    vertexes = ROOM_VERTEXES + [(64, 0), (64, 128)]
+    segs = [(start, end, 0, line, 0, 0)
+            for start, end, line in LEFT_SEGS + RIGHT_SEGS if line is not None]
+    lumps = get_room_lumps(
+        vertexes, nodes=get_records([get_node(0x8001, 0x8000)], NODE_DTYPE),
+        segs=get_records(segs, SEG_DTYPE), sub_sectors=get_records([(3, 0), (3, 3)], SUB_SECTOR_DTYPE))
+    map_arrays = load_map_arrays(lumps)
+
+    # bit 15 of a child id becomes SUB_SECTOR_FLAG
+    assert map_arrays.nodes['front_child_id'].tolist() == [1 | SUB_SECTOR_FLAG]
+    assert map_arrays.nodes['back_child_id'].tolist() == [SUB_SECTOR_FLAG]
+    assert map_arrays.sub_sectors.dtype == MAP_SUB_SECTOR_DTYPE
+    assert map_arrays.sub_sectors['first_seg_id'].tolist() == [0, 3]
+    assert map_arrays.segments['linedef_id'].tolist() == [0, 2, 3, 0, 1, 2]
+    assert map_arrays.seg_front_sector_ids.tolist() == [0] * 6
+
+
+def test_widen_reads_ids_unsigned():
+    sub_sectors = np.array([(-28672, 5)], dtype=SUB_SECTOR_DTYPE)
+    wide = MapArrays.widen(sub_sectors, MAP_SUB_SECTOR_DTYPE, ('seg_count', 'first_seg_id'))
+    assert wide['seg_count'].tolist() == [36864]
+    assert wide['first_seg_id'].tolist() == [5]
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+import numpy as np
+from asset_cache import AssetCache
+from pvs import PVS
+from data_types import SECTOR_DTYPE, MAP_SUB_SECTOR_DTYPE, MAP_NODE_DTYPE, SUB_SECTOR_FLAG
+
+# five sectors: 0 - 1 - 2 - 3 joined by two-sided lines, 4 on its own;
+# one subsector per seg pair
+SEG_FRONT_SECTORS = [0, 1, 1, 2, 2, 3, 0, 4]
+SEG_BACK_SECTORS = [1, 0, 2, 1, 3, 2, -1, -1]
+NUM_SECTORS = 5
+
+
+def make_reject(rejected_pairs, num_sectors=NUM_SECTORS):
+    # bit i * num_sectors + j: sector j cannot be seen from sector i
+    bits = np.zeros(num_sectors * num_sectors, dtype=np.uint8)
+    for sector_id, other_id in rejected_pairs:
+        bits[sector_id * num_sectors + other_id] = 1
+    return np.packbits(bits, bitorder='little').tobytes()
+
+
+def make_tree(seg_sectors, seg_counts, children):
+    map_arrays = SimpleNamespace()
+    map_arrays.sectors = np.zeros(NUM_SECTORS, dtype=SECTOR_DTYPE)
+    map_arrays.seg_front_sector_ids = np.array(seg_sectors, dtype=np.int64)
+    map_arrays.sub_sectors = np.zeros(len(seg_counts), dtype=MAP_SUB_SECTOR_DTYPE)
+    map_arrays.sub_sectors['seg_count'] = seg_counts
+    map_arrays.sub_sectors['first_seg_id'] = np.cumsum(seg_counts) - seg_counts
+    map_arrays.nodes = np.zeros(len(children), dtype=MAP_NODE_DTYPE)
+    map_arrays.nodes['front_child_id'], map_arrays.nodes['back_child_id'] = np.array(children).T
+    return map_arrays
+
+
+def make_pvs(reject):
+    map_arrays = make_tree(SEG_FRONT_SECTORS, [2, 2, 2, 2],
+                           [(SUB_SECTOR_FLAG, 1 | SUB_SECTOR_FLAG),
+                            (2 | SUB_SECTOR_FLAG, 3 | SUB_SECTOR_FLAG), (0, 1)])
+    map_arrays.seg_back_sector_ids = np.array(SEG_BACK_SECTORS, dtype=np.int64)
+    wad_data = SimpleNamespace(
+        map_arrays=map_arrays, cache=AssetCache([], enabled=False), map_index=0,
+        LUMP_INDICES={'REJECT': 0},
+        reader=SimpleNamespace(get_lump_view=lambda lump_index: memoryview(reject)))
+    return PVS(wad_data, 'E1M1')
+
+
+def get_visible_sectors(pvs):
+    is_visible = np.unpackbits(pvs.sector_bits, axis=1, count=NUM_SECTORS, bitorder='little')
+    return [np.flatnonzero(row).tolist() for row in is_visible]
+
+
+def test_flood_without_reject():
+    pvs = make_pvs(make_reject([]))
+    assert get_visible_sectors(pvs) == [[0, 1, 2, 3]] * 4 + [[4]]
+
+
+def test_reject_stops_the_flood():
+    # 2 cannot be seen from 0, so neither can 3 behind it; the rows are independent
+    pvs = make_pvs(make_reject([(0, 2), (2, 0)]))
+    visible = get_visible_sectors(pvs)
+    assert visible[0] == [0, 1]
+    assert visible[2] == [1, 2, 3]
+    assert visible[3] == [0, 1, 2, 3]
+
+
+def test_reject_contradicting_the_map_is_ignored():
+    all_visible = [[0, 1, 2, 3]] * 4 + [[4]]
+    # a sector hidden from a neighbour, or from itself, as in maps with blind monsters
+    assert get_visible_sectors(make_pvs(make_reject([(0, 2), (1, 2)]))) == all_visible
+    assert get_visible_sectors(make_pvs(make_reject([(0, 2), (3, 3)]))) == all_visible
+    assert get_visible_sectors(make_pvs(b'\xff' * 4)) == all_visible
+    # truncated
+    assert get_visible_sectors(make_pvs(make_reject([(0, 2)])[:2])) == all_visible
+
+
+def test_visible_sub_sectors():
+    pvs = make_pvs(make_reject([(0, 2), (2, 0)]))
+    assert pvs.sub_sector_sectors.tolist() == [0, 1, 2, 0]
+    assert pvs.get_visible_sub_sectors(0).tolist() == [True, True, False, True]
+    # a subsector without a sector sees and is seen from everywhere
+    pvs.sub_sector_sectors[2] = -1
+    assert pvs.get_visible_sub_sectors(0).tolist() == [True, True, True, True]
+    assert pvs.get_visible_sub_sectors(2).tolist() == [True, True, True, True]
+
+
+def test_sub_sector_sectors_from_segs():
+    # the first seg with a sector
+    map_arrays = make_tree([-1, 3, 2, 1, 4], [3, 2], [(SUB_SECTOR_FLAG, 1 | SUB_SECTOR_FLAG)])
+    assert PVS.get_sub_sector_sectors(map_arrays).tolist() == [3, 1]
+
+
+def test_sub_sector_sectors_from_the_tree():
+    # node 0: subsectors 0 (sector 3) and 1, node 1: subsectors 2 and 3, node 2: nodes
+    # 0 and 1, node 3 (root): node 2 and subsector 4 (sector 4); subsectors 1 to 3
+    # only have minisegs without a sector
+    seg_sectors = [3, -1, -1, -1, -1, 4]
+    children = [(SUB_SECTOR_FLAG, 1 | SUB_SECTOR_FLAG),
+                (2 | SUB_SECTOR_FLAG, 3 | SUB_SECTOR_FLAG), (0, 1), (2, 4 | SUB_SECTOR_FLAG)]
+    map_arrays = make_tree(seg_sectors, [1, 1, 2, 1, 1], children)
+    # 1 from its parent, 2 and 3 from the parent of theirs, none is left at -1
+    assert PVS.get_sub_sector_sectors(map_arrays).tolist() == [3, 3, 3, 3, 4]
+
+    # a tree without any sector leaves them unresolved
+    map_arrays = make_tree([-1] * 6, [1, 1, 2, 1, 1], children)
+    assert PVS.get_sub_sector_sectors(map_arrays).tolist() == [-1] * 5
@@ -0,0 +1,88 @@
+import numpy as np
+from bsp_kernels import add_solid_seg, add_visible_ranges
+
+WIDTH = 64
+# the sentinels walk_bsp starts with, outside the columns drawn
+LEFT_SENTINEL, RIGHT_SENTINEL = [-0x7fffffff, -1], [WIDTH, 0x7fffffff]
+
+
+class SolidSegs:
+    def __init__(self):
+        self.solid_segs = np.empty((WIDTH + 2, 2), dtype=np.int64)
+        self.solid_segs[:2] = LEFT_SENTINEL, RIGHT_SENTINEL
+        self.num_solid = 2
+        self.counts = np.zeros(6, dtype=np.int64)
+
+    def add(self, x1, x2):
+        self.num_solid = add_solid_seg(self.solid_segs, self.num_solid, x1, x2, self.counts)
+        return self
+
+    def get_ranges(self, x1, x2, capacity=WIDTH):
+        ranges = np.zeros((capacity, 3), dtype=np.int64)
+        num_ranges = add_visible_ranges(self.solid_segs, self.num_solid, 7, x1, x2, ranges, 0,
+                                        self.counts)
+        return num_ranges, ranges[:num_ranges].tolist()
+
+    def get_inner(self):
+        # without the sentinels
+        return self.solid_segs[1: self.num_solid - 1].tolist()
+
+
+def test_disjoint_segs_stay_sorted():
+    solid = SolidSegs().add(50, 60).add(10, 20).add(30, 40)
+    assert solid.get_inner() == [[10, 20], [30, 40], [50, 60]]
+
+
+def test_merging():
+    # adjacent, then overlapping on the left
+    solid = SolidSegs().add(10, 19).add(20, 29)
+    assert solid.get_inner() == [[10, 29]]
+    assert solid.add(5, 12).get_inner() == [[5, 29]]
+    # one seg bridging two
+    assert solid.add(40, 50).add(25, 45).get_inner() == [[5, 50]]
+    # inside an existing one
+    assert solid.add(20, 30).get_inner() == [[5, 50]]
+
+
+def test_merging_with_the_sentinels():
+    solid = SolidSegs().add(0, 9).add(54, WIDTH - 1)
+    assert solid.num_solid == 2
+    assert solid.solid_segs[:2].tolist() == [[LEFT_SENTINEL[0], 9], [54, RIGHT_SENTINEL[1]]]
+
+
+def test_covering_the_screen():
+    # from the left edge over both segs, into the left sentinel
+    solid = SolidSegs().add(10, 20).add(40, 50).add(0, 45)
+    assert solid.num_solid == 2
+    assert solid.solid_segs[0].tolist() == [LEFT_SENTINEL[0], 50]
+    solid.add(46, WIDTH - 1)
+    # a single range left: the walk stops
+    assert solid.num_solid == 1
+    assert solid.solid_segs[0].tolist() == [LEFT_SENTINEL[0], RIGHT_SENTINEL[1]]
+    assert solid.get_ranges(0, WIDTH - 1) == (0, [])
+
+
+def test_visible_ranges_split_around_solid_segs():
+    solid = SolidSegs().add(10, 19).add(30, 39)
+    assert solid.get_ranges(0, 50) == (3, [[7, 0, 9], [7, 20, 29], [7, 40, 50]])
+    assert solid.get_ranges(15, 35) == (1, [[7, 20, 29]])
+    assert solid.get_ranges(12, 18) == (0, [])
+    # clipped to the screen by the sentinels
+    assert solid.get_ranges(-5, WIDTH + 5) == (3, [[7, 0, 9], [7, 20, 29], [7, 40, WIDTH - 1]])
+
+
+def test_ranges_past_the_capacity_are_counted():
+    solid = SolidSegs().add(10, 19).add(30, 39)
+    num_ranges, ranges = solid.get_ranges(0, 50, capacity=1)
+    assert num_ranges == 3
+    assert ranges == [[7, 0, 9]]
+
+
+def test_clip_steps_are_counted():
+    solid = SolidSegs()
+    solid.add(10, 19)
+    steps = solid.counts[5]
+    assert steps > 0
+    solid.get_ranges(0, 50)
+    # every entry of the list, sentinels included
+    assert solid.counts[5] == steps + 3
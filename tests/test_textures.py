@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+import struct
+import numpy as np
+import pygame as pg
+from settings import COLOR_KEY
+from asset_data import decode_patch, Patch, Texture
+
+# palette index -> a colour that is never the colour key
+PALETTE = [(i, 255 - i, 7) for i in range(256)]
+
+
+def make_patch(width, height, columns):
+    # columns: per column a list of posts (top_delta, palette indices)
+    header = struct.pack('<HHhh', width, height, 0, 0)
+    offset = len(header) + 4 * width
+    offsets, data = [], b''
+    for posts in columns:
+        offsets.append(offset + len(data))
+        for top_delta, pixels in posts:
+            data += bytes([top_delta, len(pixels), 0, *pixels, 0])
+        data += b'\xff'
+    return header + struct.pack(f'<{width}I', *offsets) + data
+
+
+def get_old_patch_image(lump):
+    # the per-pixel decoding the arrays replaced: posts read one by one, set_at per texel
+    width, height = struct.unpack_from('<HH', lump, 0)
+    image = pg.Surface([width, height])
+    image.fill(COLOR_KEY)
+    image.set_colorkey(COLOR_KEY)
+    for ix in range(width):
+        offs = struct.unpack_from('<I', lump, 8 + 4 * ix)[0]
+        while lump[offs] != 0xFF:
+            top_delta, length = lump[offs], lump[offs + 1]
+            for iy in range(length):
+                image.set_at([ix, iy + top_delta], PALETTE[lump[offs + 3 + iy]])
+            offs += length + 4
+    return image
+
+
+def get_old_texture(tex_map, lumps):
+    # the per-pixel compositing the arrays replaced: patch surfaces blitted with a colour key
+    image = pg.Surface([tex_map.width, tex_map.height])
+    image.fill(COLOR_KEY)
+    image.set_colorkey(COLOR_KEY)
+    for patch_map in tex_map.patch_maps:
+        image.blit(get_old_patch_image(lumps[patch_map.p_name_index]),
+                   (patch_map.x_offset, patch_map.y_offset))
+    return pg.surfarray.array3d(image)
+
+
+def to_rgb(indices, mask):
+    image = np.array(PALETTE, dtype=np.uint8)[indices]
+    image[~mask] = COLOR_KEY
+    return image
+
+
+# a post each side of a transparent gap, a column without posts, a post
+# running past the bottom edge
+PATCH_A = make_patch(4, 6, [
+    [(0, [1, 2]), (4, [3, 4])],
+    [],
+    [(1, [5, 6, 7, 8, 9, 10, 11])],
+    [(0, [12, 13, 14, 15, 16, 17])],
+])
+PATCH_B = make_patch(3, 3, [[(0, [20, 21, 22])], [(1, [23])], [(0, [24]), (2, [25])]])
+
+
+def test_decode_patch():
+    indices, mask = decode_patch(PATCH_A)
+    assert indices.shape == mask.shape == (4, 6)
+    assert mask.T.astype(int).tolist() == [
+        [1, 0, 0, 1], [1, 0, 1, 1], [0, 0, 1, 1], [0, 0, 1, 1], [1, 0, 1, 1], [1, 0, 1, 1]]
+    assert indices[0].tolist() == [1, 2, 0, 0, 3, 4]
+    assert indices[2].tolist() == [0, 5, 6, 7, 8, 9]
+    old = pg.surfarray.array3d(get_old_patch_image(PATCH_A))
+    assert np.array_equal(to_rgb(indices, mask), old)
+
+
+def test_composite_matches_the_old_blits():
+    lumps = [PATCH_A, PATCH_B]
+    asset_data = SimpleNamespace()
+    patches = {name: Patch(asset_data, name, decode_patch(lump), is_sprite=False)
+               for name, lump in zip(['A', 'B'], lumps)}
+    asset_data.get_patch = patches.get
+
+    placements = [
+        # inside, overlapping, negative origins, past the right and bottom edges,
+        # and a patch missing from the WADs
+        [(0, 0, 0)],
+        [(0, 1, 1), (1, 2, 2)],
+        [(0, -2, -3), (1, -1, 4)],
+        [(0, 6, 3), (1, 5, -2), (2, 0, 0)],
+    ]
+    for patch_maps in placements:
+        tex_map = SimpleNamespace(width=8, height=5, patch_maps=[
+            SimpleNamespace(p_name_index=p_name_index, x_offset=x, y_offset=y)
+            for p_name_index, x, y in patch_maps])
+        texture = Texture(asset_data, tex_map, ['A', 'B', 'MISSING'])
+        old = get_old_texture(tex_map, lumps + [make_patch(1, 1, [[]])])
+        assert np.array_equal(to_rgb(texture.indices, texture.mask), old), patch_maps
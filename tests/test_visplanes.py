@@ -0,0 +1,68 @@
+from visplanes import VisPlanes
+
+FLOOR, CEIL = (-41, 3, 160), (87, 5, 160)
+
+
+def mark(visplanes, plane_id, x1, x2, top=10, bottom=20):
+    # as the wall kernels do for the columns a plane is seen in
+    visplanes.tops[plane_id, x1: x2 + 1] = top
+    visplanes.bottoms[plane_id, x1: x2 + 1] = bottom
+
+
+def test_keys_get_their_own_planes():
+    visplanes = VisPlanes(64, 32)
+    assert visplanes.check_plane(FLOOR, 0, 9) == 0
+    assert visplanes.check_plane(CEIL, 0, 9) == 1
+    assert visplanes.keys == [FLOOR, CEIL]
+
+
+def test_merging_columns_not_marked():
+    visplanes = VisPlanes(64, 32)
+    plane_id = visplanes.check_plane(FLOOR, 10, 19)
+    mark(visplanes, plane_id, 10, 19)
+    # disjoint on either side
+    assert visplanes.check_plane(FLOOR, 30, 39) == plane_id
+    assert visplanes.check_plane(FLOOR, 0, 5) == plane_id
+    # inside the range so far, over columns still empty
+    assert visplanes.check_plane(FLOOR, 22, 28) == plane_id
+    assert visplanes.x_ranges[plane_id] == (0, 39)
+    assert len(visplanes.keys) == 1
+
+
+def test_splitting_on_marked_columns():
+    visplanes = VisPlanes(64, 32)
+    plane_id = visplanes.check_plane(FLOOR, 10, 19)
+    mark(visplanes, plane_id, 10, 19)
+    # one column already marked is enough for a new plane
+    new_plane_id = visplanes.check_plane(FLOOR, 19, 25)
+    assert new_plane_id == 1
+    assert visplanes.x_ranges == [(10, 19), (19, 25)]
+    # the latest plane of the key is the one checked from then on
+    mark(visplanes, new_plane_id, 19, 25)
+    assert visplanes.check_plane(FLOOR, 0, 9) == new_plane_id
+    assert visplanes.x_ranges[new_plane_id] == (0, 25)
+    # only its own marks count, not those of the earlier plane
+    assert visplanes.check_plane(FLOOR, 12, 14) == new_plane_id
+    assert visplanes.check_plane(FLOOR, 20, 22) == 2
+
+
+def test_growing_keeps_the_marks():
+    visplanes = VisPlanes(8, 32, max_planes=2)
+    for plane_id in range(2):
+        visplanes.check_plane((plane_id, 1, 160), 0, 7)
+        mark(visplanes, plane_id, 0, 7, top=plane_id)
+    assert visplanes.check_plane((2, 1, 160), 0, 7) == 2
+    assert visplanes.tops.shape == visplanes.bottoms.shape == (4, 8)
+    assert visplanes.tops[:2, 0].tolist() == [0, 1]
+    assert (visplanes.tops[2:] == VisPlanes.EMPTY_TOP).all()
+    assert (visplanes.bottoms[2:] == VisPlanes.EMPTY_BOTTOM).all()
+
+
+def test_clear():
+    visplanes = VisPlanes(64, 32)
+    mark(visplanes, visplanes.check_plane(FLOOR, 0, 63), 0, 63)
+    visplanes.clear()
+    assert visplanes.keys == [] and visplanes.x_ranges == []
+    assert (visplanes.tops[0] == VisPlanes.EMPTY_TOP).all()
+    # the same columns are free again
+    assert visplanes.check_plane(FLOOR, 0, 63) == 0
@@ -0,0 +1,73 @@
+import struct
+from wad_stack import WADStack
+
+
+def write_wad(path, lumps, identification=b'PWAD'):
+    # header, lump data in order, then the directory
+    directory, offset = [], 12
+    for name, data in lumps:
+        directory.append(struct.pack('<ii8s', offset, len(data), name.encode()))
+        offset += len(data)
+    with open(path, 'wb') as wad_file:
+        wad_file.write(struct.pack('<4sii', identification, len(lumps), offset))
+        for name, data in lumps:
+            wad_file.write(data)
+        wad_file.write(b''.join(directory))
+    return str(path)
+
+
+def make_stack(tmp_path):
+    iwad = write_wad(tmp_path / 'iwad.wad', [
+        ('PLAYPAL', b'iwad'), ('TEXTURE1', b'iwad'),
+        ('S_START', b''), ('TROOA1', b'iwad'), ('POSSA1', b'iwad'), ('S_END', b''),
+        ('F_START', b''), ('F1_START', b''), ('FLOOR1', b'iwad'), ('FLOOR2', b'iwad'),
+        ('F1_END', b''), ('F_END', b''),
+    ], identification=b'IWAD')
+    # replaces a sprite and a flat, adds one of each, with the PWAD style markers
+    pwad1 = write_wad(tmp_path / 'pwad1.wad', [
+        ('PLAYPAL', b'pwad1'),
+        ('SS_START', b''), ('TROOA1', b'pwad1'), ('NEWSPR', b'pwad1'), ('SS_END', b''),
+        ('FF_START', b''), ('FLOOR2', b'pwad1'), ('NEWFLAT', b'pwad1'), ('FF_END', b''),
+    ])
+    pwad2 = write_wad(tmp_path / 'pwad2.wad', [
+        ('PLAYPAL', b'pwad2'),
+        ('FF_START', b''), ('NEWFLAT', b'pwad2'), ('FF_END', b''),
+        # outside the markers: a lump, not a flat
+        ('FLOOR1', b'pwad2'),
+    ])
+    return WADStack([iwad, pwad1, pwad2])
+
+
+def read_lump(stack, lump_index):
+    with stack.get_lump_view(lump_index) as lump:
+        return bytes(lump)
+
+
+def test_later_files_override(tmp_path):
+    stack = make_stack(tmp_path)
+    assert read_lump(stack, stack.get_lump_index('PLAYPAL')) == b'pwad2'
+    # every lump of a name in load order, each read from its own file
+    indices = stack.get_lump_indices('PLAYPAL')
+    assert [read_lump(stack, index) for index in indices] == [b'iwad', b'pwad1', b'pwad2']
+    assert [stack.directory[index]['wad_id'] for index in indices] == [0, 1, 2]
+    assert stack.get_lump_reader(indices[1]) is stack.readers[1]
+    # lumps only in the IWAD are still found
+    assert read_lump(stack, stack.get_lump_index('TEXTURE1')) == b'iwad'
+    assert stack.get_lump_index('MISSING') is None
+    assert stack.get_lump_indices('MISSING') == []
+    stack.close()
+
+
+def test_namespaces_merge_across_files(tmp_path):
+    stack = make_stack(tmp_path)
+    sprites = {name: read_lump(stack, index) for name, index in stack.get_namespace('sprites').items()}
+    assert sprites == {'TROOA1': b'pwad1', 'POSSA1': b'iwad', 'NEWSPR': b'pwad1'}
+
+    # the zero-sized sub-markers are not flats, a lump outside the markers does not
+    # replace the flat of the same name
+    flats = {name: read_lump(stack, index) for name, index in stack.get_namespace('flats').items()}
+    assert flats == {'FLOOR1': b'iwad', 'FLOOR2': b'pwad1', 'NEWFLAT': b'pwad2'}
+    assert read_lump(stack, stack.get_lump_index('FLOOR1', 'flats')) == b'iwad'
+    assert read_lump(stack, stack.get_lump_index('FLOOR1')) == b'pwad2'
+    assert stack.get_namespace('patches') == {}
+    stack.close()
@@ -1,9 +1,8 @@
 from settings import *
-import random
-from random import randrange as rnd
 import pygame.gfxdraw as gfx
 import pygame as pg
-from numba import njit
+import numpy as np
+from render_kernels import draw_plane_spans, draw_sky_columns
 
 
 class ViewRenderer:
@@ -17,15 +16,53 @@ class ViewRenderer:
         self.screen = engine.screen
         self.framebuffer = engine.framebuffer
         self.x_to_angle = self.engine.seg_handler.x_to_angle
-        self.colors = {}
+        self.kernel_tables = engine.tables.get_kernel_tables()
+        # internal render resolution: (width, h_width, h_height)
+        self.screen_size = engine.tables.width, engine.tables.h_width, engine.tables.h_height
+        # shading: palette index -> framebuffer pixel, one table per light level
+        self.palette_lut = self.asset_data.palette_lut
+        self.packed_palette = self.pack_pixels(self.palette_lut)
+        self.colormaps = self.asset_data.colormaps
+        self.light_tables = {}
         # sky settings
         self.sky_id = self.asset_data.sky_id
         self.sky_tex = self.asset_data.sky_tex
-        self.sky_inv_scale = 160 / HEIGHT
+        self.sky_inv_scale = 160 / engine.tables.height
         self.sky_tex_alt = 100
+        self.sky_light_table = self.get_light_table(1.0)
+        self.sky_strip = self.get_sky_strip()
+
+    def draw_planes(self, visplanes):
+        # floors and ceilings marked by the walls of this frame, drawn as horizontal spans
+        view = self.get_view()
+        for plane_id, (world_z, tex_id, light_level) in enumerate(visplanes.keys):
+            min_x, max_x = visplanes.x_ranges[plane_id]
+            if tex_id == self.sky_id:
+                draw_sky_columns(self.framebuffer, visplanes.tops[plane_id],
+                                 visplanes.bottoms[plane_id], min_x, max_x, self.sky_strip,
+                                 view[0], self.x_to_angle)
+                continue
+            draw_plane_spans(self.framebuffer, visplanes.tops[plane_id], visplanes.bottoms[plane_id],
+                             min_x, max_x, self.textures[tex_id], self.get_light_table(light_level),
+                             float(world_z), view, self.kernel_tables, visplanes.span_start)
+
+    def get_sky_strip(self):
+        # the sky texture scaled to the screen rows and shaded, built once for the render
+        # height: (sky texture column, screen row) -> pixel
+        tables = self.engine.tables
+        tex_y = self.sky_tex_alt + (np.arange(tables.height) - tables.h_height) * self.sky_inv_scale
+        rows = tex_y.astype(np.int64) % self.sky_tex.shape[1]
+        return np.ascontiguousarray(self.sky_light_table[self.sky_tex[:, rows]])
+
+    def get_view(self):
+        # player parameters as taken by the span kernels
+        return float(self.player.angle), float(self.player.pos.x), float(self.player.pos.y)
 
     def draw_sprite(self):
-        img = self.sprites['SHTGA0']
+        img = self.sprites.get('SHTGA0')
+        # not decoded yet during a progressive startup
+        if img is None:
+            return
         pos = (H_WIDTH - img.get_width() // 2, HEIGHT - img.get_height())
         self.screen.blit(img, pos)
 
@@ -36,79 +73,20 @@ class ViewRenderer:
                 col = pal[iy * 16 + ix]
                 gfx.box(self.screen, (ix * size, iy * size, size, size), col)
 
-    def get_color(self, tex, light_level):
-        str_light = str(light_level)
-        if tex + str_light not in self.colors:
-            tex_id = hash(tex)
-            random.seed(tex_id)
-            color = self.palette[rnd(0, 256)]
-            color = color[0] * light_level, color[1] * light_level, color[2] * light_level
-            self.colors[tex + str_light] = color
-        return self.colors[tex + str_light]
-
-    def draw_vline(self, x, y1, y2, tex, light):
-        if y1 < y2:
-            color = self.get_color(tex, light)
-            self.draw_column(self.framebuffer, x, y1, y2, color)
-
-    @staticmethod
-    @njit
-    def draw_column(framebuffer, x, y1, y2, color):
-        for iy in range(y1, y2 + 1):
-            framebuffer[x, iy] = color
-
-    def draw_flat(self, tex_id, light_level, x, y1, y2, world_z):
-        if y1 < y2:
-            if tex_id == self.sky_id:
-                tex_column = 2.2 * (self.player.angle + self.engine.seg_handler.x_to_angle[x])
-
-                self.draw_wall_col(self.framebuffer, self.sky_tex, tex_column, x, y1, y2,
-                                   self.sky_tex_alt, self.sky_inv_scale, light_level=1.0)
+    def get_light_table(self, light_level):
+        if light_level not in self.light_tables:
+            if INDEXED_MODE:
+                # COLORMAP rows go from full bright (0) to dark (31)
+                table = self.colormaps[min(31, int((1.0 - light_level) * 32))]
             else:
-                flat_tex = self.textures[tex_id]
-
-                self.draw_flat_col(self.framebuffer, flat_tex,
-                                   x, y1, y2, light_level, world_z,
-                                   self.player.angle, self.player.pos.x, self.player.pos.y)
-
-    @staticmethod
-    @njit(fastmath=True)
-    def draw_flat_col(screen, flat_tex, x, y1, y2, light_level, world_z,
-                      player_angle, player_x, player_y):
-        player_dir_x = math.cos(math.radians(player_angle))
-        player_dir_y = math.sin(math.radians(player_angle))
-
-        for iy in range(y1, y2 + 1):
-            z = H_WIDTH * world_z / (H_HEIGHT - iy)
-
-            px = player_dir_x * z + player_x
-            py = player_dir_y * z + player_y
-
-            left_x = -player_dir_y * z + px
-            left_y = player_dir_x * z + py
-            right_x = player_dir_y * z + px
-            right_y = -player_dir_x * z + py
-
-            dx = (right_x - left_x) / WIDTH
-            dy = (right_y - left_y) / WIDTH
-
-            tx = int(left_x + dx * x) & 63
-            ty = int(left_y + dy * x) & 63
-
-            col = flat_tex[tx, ty]
-            col = col[0] * light_level, col[1] * light_level, col[2] * light_level
-            screen[x, iy] = col
-
-    @staticmethod
-    @njit(fastmath=True)
-    def draw_wall_col(framebuffer, tex, tex_col, x, y1, y2, tex_alt, inv_scale, light_level):
-        if y1 < y2:
-            tex_w, tex_h = len(tex), len(tex[0])
-            tex_col = int(tex_col) % tex_w
-            tex_y = tex_alt + (float(y1) - H_HEIGHT) * inv_scale
-
-            for iy in range(y1, y2 + 1):
-                col = tex[tex_col, int(tex_y) % tex_h]
-                col = col[0] * light_level, col[1] * light_level, col[2] * light_level
-                framebuffer[x, iy] = col
-                tex_y += inv_scale
+                table = self.pack_pixels((self.palette_lut * light_level).astype(np.uint8))
+            self.light_tables[light_level] = table
+        return self.light_tables[light_level]
+
+    def pack_pixels(self, rgb):
+        # RGB rows -> 32-bit pixels in the format of the render surface
+        surface = self.engine.render_surface
+        r_shift, g_shift, b_shift, _ = surface.get_shifts()
+        rgb = rgb.astype(np.uint32)
+        return ((rgb[..., 0] << r_shift) | (rgb[..., 1] << g_shift) | (rgb[..., 2] << b_shift)
+                | surface.get_masks()[3])
@@ -0,0 +1,53 @@
+from settings import *
+import numpy as np
+
+
+class VisPlanes:
+    # floor / ceiling surfaces of one frame, one per (height, flat, light level),
+    # with the top and bottom screen row marked by the walls for each column
+    EMPTY_TOP = 0x7fff
+    EMPTY_BOTTOM = -1
+
+    def __init__(self, width, height, max_planes=128):
+        self.tops = np.full((max_planes, width), self.EMPTY_TOP, dtype=np.int16)
+        self.bottoms = np.full((max_planes, width), self.EMPTY_BOTTOM, dtype=np.int16)
+        # per plane: (world_z, tex_id, light_level) and the marked column range
+        self.keys = []
+        self.x_ranges = []
+        # key -> the latest plane with that key
+        self.last_plane = {}
+        # column where the open span of each screen row started
+        self.span_start = np.zeros(height, dtype=np.int32)
+
+    def clear(self):
+        num_planes = len(self.keys)
+        self.tops[:num_planes] = self.EMPTY_TOP
+        self.bottoms[:num_planes] = self.EMPTY_BOTTOM
+        self.keys.clear()
+        self.x_ranges.clear()
+        self.last_plane.clear()
+
+    def check_plane(self, key, x1, x2):
+        # a plane can only take columns it has not marked yet, otherwise a new one is started
+        plane_id = self.last_plane.get(key)
+        if plane_id is not None:
+            # only the overlap with the columns of the plane so far needs a look
+            min_x, max_x = self.x_ranges[plane_id]
+            lo, hi = max(x1, min_x), min(x2, max_x)
+            if lo > hi or (self.tops[plane_id, lo: hi + 1] == self.EMPTY_TOP).all():
+                self.x_ranges[plane_id] = min(min_x, x1), max(max_x, x2)
+                return plane_id
+        return self.new_plane(key, x1, x2)
+
+    def new_plane(self, key, x1, x2):
+        plane_id = len(self.keys)
+        if plane_id == len(self.tops):
+            self.grow()
+        self.keys.append(key)
+        self.x_ranges.append((x1, x2))
+        self.last_plane[key] = plane_id
+        return plane_id
+
+    def grow(self):
+        self.tops = np.concatenate([self.tops, np.full_like(self.tops, self.EMPTY_TOP)])
+        self.bottoms = np.concatenate([self.bottoms, np.full_like(self.bottoms, self.EMPTY_BOTTOM)])
@@ -1,5 +1,13 @@
+import math
+import numpy as np
+from wad_stack import WADStack
 from wad_reader import WADReader
 from asset_data import AssetData
+from map_arrays import MapArrays, LazyRecords
+from asset_cache import AssetCache
+from pvs import PVS
+from blockmap import BlockMap
+from data_types import SegGeometry
 
 
 class WADData:
@@ -11,104 +19,187 @@ class WADData:
         'BLOCKING': 1, 'BLOCK_MONSTERS': 2, 'TWO_SIDED': 4, 'DONT_PEG_TOP': 8,
         'DONT_PEG_BOTTOM': 16, 'SECRET': 32, 'SOUND_BLOCK': 64, 'DONT_DRAW': 128, 'MAPPED': 256
     }
+    SKY_FLAT = 'F_SKY1'
 
     def __init__(self, engine, map_name):
-        self.reader = WADReader(engine.wad_path)
+        # IWAD + PWADs, later files override lumps of earlier ones
+        self.reader = WADStack(engine.wad_paths)
+        self.cache = AssetCache(engine.wad_paths)
         self.map_index = self.get_lump_index(lump_name=map_name)
-        self.vertexes = self.get_lump_data(
-            reader_func=self.reader.read_vertex,
-            lump_index=self.map_index + self.LUMP_INDICES['VERTEXES'],
-            num_bytes=4  # num bytes per vertex
-        )
-        self.linedefs = self.get_lump_data(
-            reader_func=self.reader.read_linedef,
-            lump_index=self.map_index + self.LUMP_INDICES['LINEDEFS'],
-            num_bytes=14
-        )
-        self.nodes = self.get_lump_data(
-            reader_func=self.reader.read_node,
-            lump_index=self.map_index + self.LUMP_INDICES['NODES'],
-            num_bytes=28
-        )
-        self.sub_sectors = self.get_lump_data(
-            reader_func=self.reader.read_sub_sector,
-            lump_index=self.map_index + self.LUMP_INDICES['SSECTORS'],
-            num_bytes=4
-        )
-        self.segments = self.get_lump_data(
-            reader_func=self.reader.read_segment,
-            lump_index=self.map_index + self.LUMP_INDICES['SEGS'],
-            num_bytes=12
-        )
-        self.things = self.get_lump_data(
-            reader_func=self.reader.read_thing,
-            lump_index=self.map_index + self.LUMP_INDICES['THINGS'],
-            num_bytes=10
-        )
-        self.sidedefs = self.get_lump_data(
-            reader_func=self.reader.read_sidedef,
-            lump_index=self.map_index + self.LUMP_INDICES['SIDEDEFS'],
-            num_bytes=30
-        )
-        self.sectors = self.get_lump_data(
-            reader_func=self.reader.read_sector,
-            lump_index=self.map_index + self.LUMP_INDICES['SECTORS'],
-            num_bytes=26
-        )
+        self.map_arrays = MapArrays(self, map_name)
+        self.pvs = PVS(self, map_name)
+        self.blockmap = BlockMap(self, map_name)
+        # object views of the map arrays, a record is made when first read
+        map_arrays = self.map_arrays
+        get_objects = map_arrays.get_objects
+        map_reader = self.reader.get_lump_reader(self.map_index)
+        self.vertexes = get_objects(map_arrays.vertexes, map_reader.make_vertex)
+        self.linedefs = get_objects(map_arrays.linedefs, map_reader.make_linedef, self.link_linedef)
+        self.nodes = get_objects(map_arrays.nodes, map_reader.make_node)
+        self.sub_sectors = get_objects(map_arrays.sub_sectors, map_reader.make_sub_sector)
+        self.segments = get_objects(map_arrays.segments, map_reader.make_segment, self.link_seg)
+        self.things = get_objects(map_arrays.things, map_reader.make_thing)
+        self.sidedefs = get_objects(map_arrays.sidedefs, map_reader.make_sidedef, self.link_sidedef)
+        self.sectors = get_objects(map_arrays.sectors, map_reader.make_sector)
+        # wall texture handle -> name, handle 0 is no texture; every sidedef texture
+        # has its handle before the seg geometry is made, on any thread
+        self.texture_names = ['-']
+        self.texture_handles = {'-': 0}
+        sidedefs = map_arrays.sidedefs
+        for tex_name in self.decode_names(np.concatenate([
+                sidedefs['middle_texture'], sidedefs['upper_texture'], sidedefs['lower_texture']]))[0]:
+            self.get_texture_handle(tex_name)
+        # per seg id: SegGeometry, made when the seg is first drawn; the seg kinds the
+        # BSP walk needs for every seg come from the arrays
+        self.seg_table = LazyRecords(len(self.segments), self.get_seg_geometry_by_id)
+        self.seg_is_solid, self.seg_is_portal = self.get_seg_kinds()
 
-        self.update_data()
         # ------------------------------- #
         self.asset_data = AssetData(self)
         # ------------------------------- #
-        self.reader.close()
-
-    def update_data(self):
-        self.update_linedefs()
-        self.update_sidedefs()
-        self.update_segs()
-
-    def update_sidedefs(self):
-        for sidedef in self.sidedefs:
-            sidedef.sector = self.sectors[sidedef.sector_id]
-
-    def update_linedefs(self):
-        for linedef in self.linedefs:
-            linedef.front_sidedef = self.sidedefs[linedef.front_sidedef_id]
-            #
-            if linedef.back_sidedef_id == 0xFFFF:  # undefined sidedef
-                linedef.back_sidedef = None
-            else:
-                linedef.back_sidedef = self.sidedefs[linedef.back_sidedef_id]
-
-    def update_segs(self):
-        for seg in self.segments:
-            seg.start_vertex = self.vertexes[seg.start_vertex_id]
-            seg.end_vertex = self.vertexes[seg.end_vertex_id]
-            seg.linedef = self.linedefs[seg.linedef_id]
-            #
-            if seg.direction:
-                front_sidedef = seg.linedef.back_sidedef
-                back_sidedef = seg.linedef.front_sidedef
-            else:
-                front_sidedef = seg.linedef.front_sidedef
-                back_sidedef = seg.linedef.back_sidedef
-            #
-            seg.front_sector = front_sidedef.sector
-            if self.LINEDEF_FLAGS['TWO_SIDED'] & seg.linedef.flags:
-                seg.back_sector = back_sidedef.sector
-            else:
-                seg.back_sector = None
-
-            # convert angles from BAMS to degrees
-            seg.angle = (seg.angle << 16) * 8.38190317e-8
-            seg.angle = seg.angle + 360 if seg.angle < 0 else seg.angle
-
-            # texture special case
-            if seg.front_sector and seg.back_sector:
-                if front_sidedef.upper_texture == '-':
-                    seg.linedef.front_sidedef.upper_texture = back_sidedef.upper_texture
-                if front_sidedef.lower_texture == '-':
-                    seg.linedef.front_sidedef.lower_texture = back_sidedef.lower_texture
+        # a progressive startup closes the reader once its background loading is done
+        if self.asset_data.loader is None:
+            self.reader.close()
+
+    def link_sidedef(self, sidedef, sidedef_id):
+        sidedef.sector = self.sectors[sidedef.sector_id]
+
+    def link_linedef(self, linedef, linedef_id):
+        linedef.front_sidedef = self.sidedefs[linedef.front_sidedef_id]
+        #
+        if linedef.back_sidedef_id == 0xFFFF:  # undefined sidedef
+            linedef.back_sidedef = None
+        else:
+            linedef.back_sidedef = self.sidedefs[linedef.back_sidedef_id]
+
+    def link_seg(self, seg, seg_id):
+        # sector links, angles and texture fixes are already resolved by the map arrays
+        map_arrays = self.map_arrays
+        seg.start_vertex = self.vertexes[seg.start_vertex_id]
+        seg.end_vertex = self.vertexes[seg.end_vertex_id]
+        #
+        back_sector_id = int(map_arrays.seg_back_sector_ids[seg_id])
+        seg.front_sector = self.sectors[int(map_arrays.seg_front_sector_ids[seg_id])]
+        seg.back_sector = self.sectors[back_sector_id] if back_sector_id >= 0 else None
+        # degrees
+        seg.angle = float(map_arrays.seg_angles[seg_id])
+        # minisegs of extended nodes have no linedef and are never drawn
+        seg.linedef = self.linedefs[seg.linedef_id] if seg.linedef_id >= 0 else None
+
+    def get_seg_geometry_by_id(self, seg_id):
+        seg = self.segments[seg_id]
+        if seg.linedef is None:
+            return self.get_miniseg_geometry(seg)
+        return self.get_seg_geometry(seg)
+
+    def get_seg_kinds(self):
+        # is_solid and is_portal of every seg as get_seg_geometry decides them
+        map_arrays = self.map_arrays
+        sectors, linedefs = map_arrays.sectors, map_arrays.linedefs
+        linedef_ids = map_arrays.segments['linedef_id']
+        front_ids, back_ids = map_arrays.seg_front_sector_ids, map_arrays.seg_back_sector_ids
+        is_line = linedef_ids >= 0
+        is_solid = is_line & (back_ids < 0)
+        is_two_sided = is_line & (back_ids >= 0)
+
+        back_ids = np.maximum(back_ids, 0)
+        flat_ids = self.decode_names(np.concatenate([sectors['floor_texture'], sectors['ceil_texture']]))[1]
+        floor_ids, ceil_ids = np.split(flat_ids, 2)
+        middle_names, middle_ids = self.decode_names(
+            map_arrays.sidedefs['middle_texture'][linedefs['front_sidedef_id'][linedef_ids]])
+        has_middle = np.array([name != '-' for name in middle_names], dtype=np.bool_)[middle_ids]
+
+        def is_changed(values):
+            return values[front_ids] != values[back_ids]
+
+        is_portal = is_two_sided & (
+            is_changed(sectors['ceil_height']) | is_changed(sectors['floor_height']) |
+            is_changed(ceil_ids) | is_changed(floor_ids) | is_changed(sectors['light_level']) |
+            has_middle)
+        return is_solid, is_portal
+
+    @staticmethod
+    def decode_names(raw_names):
+        # 8-byte names -> (distinct names, id of each name among them), every raw name
+        # decoded once
+        raw_unique, raw_ids = np.unique(raw_names, return_inverse=True)
+        decoded = [WADReader.decode_string(raw_name) for raw_name in raw_unique.tolist()]
+        names = list(dict.fromkeys(decoded))
+        name_ids = {name: name_id for name_id, name in enumerate(names)}
+        unique_ids = np.array([name_ids[name] for name in decoded], dtype=np.int64)
+        return names, unique_ids[raw_ids.ravel()]
+
+    def get_seg_geometry(self, seg):
+        geometry = SegGeometry()
+        front_sector, back_sector = seg.front_sector, seg.back_sector
+        line = seg.linedef
+        side = line.front_sidedef
+        geometry.front_sector, geometry.back_sector, geometry.side = front_sector, back_sector, side
+
+        geometry.start_x, geometry.start_y = seg.start_vertex
+        angle = math.radians(seg.angle)
+        geometry.dir_x, geometry.dir_y = math.cos(angle), math.sin(angle)
+        geometry.normal_angle = seg.angle + 90
+        geometry.x_offset = seg.offset + side.x_offset
+        geometry.y_offset = side.y_offset
+
+        geometry.middle_texture = self.get_texture_handle(side.middle_texture)
+        geometry.upper_texture = self.get_texture_handle(side.upper_texture)
+        geometry.lower_texture = self.get_texture_handle(side.lower_texture)
+        geometry.dont_peg_top = bool(line.flags & self.LINEDEF_FLAGS['DONT_PEG_TOP'])
+        geometry.dont_peg_bottom = bool(line.flags & self.LINEDEF_FLAGS['DONT_PEG_BOTTOM'])
+
+        geometry.front_ceil_height = front_sector.ceil_height
+        geometry.is_ceil_sky = front_sector.ceil_texture == self.SKY_FLAT
+        geometry.is_solid = back_sector is None
+        if geometry.is_solid:
+            geometry.is_portal = False
+            geometry.is_ceil_changed = geometry.is_floor_changed = True
+            geometry.draw_upper_wall = geometry.draw_lower_wall = False
+            return geometry
+
+        same_light = front_sector.light_level == back_sector.light_level
+        same_ceil_texture = front_sector.ceil_texture == back_sector.ceil_texture
+        same_floor_texture = front_sector.floor_texture == back_sector.floor_texture
+        # a window, or a border between different lights / flats; otherwise an
+        # empty line used for triggers and special events
+        geometry.is_portal = (
+            front_sector.ceil_height != back_sector.ceil_height or
+            front_sector.floor_height != back_sector.floor_height or
+            not (same_ceil_texture and same_floor_texture and same_light and
+                 side.middle_texture == '-')
+        )
+        # sky hack: between two sky ceilings there is no upper wall
+        if geometry.is_ceil_sky and back_sector.ceil_texture == self.SKY_FLAT:
+            geometry.front_ceil_height = back_sector.ceil_height
+
+        geometry.is_ceil_changed = (
+            geometry.front_ceil_height != back_sector.ceil_height or
+            not same_light or not same_ceil_texture)
+        geometry.draw_upper_wall = (
+            geometry.is_ceil_changed and geometry.upper_texture != 0 and
+            back_sector.ceil_height < geometry.front_ceil_height)
+        geometry.is_floor_changed = (
+            front_sector.floor_height != back_sector.floor_height or
+            not same_floor_texture or not same_light)
+        geometry.draw_lower_wall = (
+            geometry.is_floor_changed and geometry.lower_texture != 0 and
+            back_sector.floor_height > front_sector.floor_height)
+        return geometry
+
+    @staticmethod
+    def get_miniseg_geometry(seg):
+        geometry = SegGeometry()
+        geometry.front_sector, geometry.back_sector, geometry.side = (
+            seg.front_sector, seg.back_sector, None)
+        geometry.is_solid = geometry.is_portal = False
+        return geometry
+
+    def get_texture_handle(self, tex_name):
+        if tex_name not in self.texture_handles:
+            self.texture_handles[tex_name] = len(self.texture_names)
+            self.texture_names.append(tex_name)
+        return self.texture_handles[tex_name]
 
     @staticmethod
     def print_attrs(obj):
@@ -116,17 +207,14 @@ class WADData:
         for attr in obj.__slots__:
             print(eval(f'obj.{attr}'), end=' ')
 
-    def get_lump_data(self, reader_func, lump_index, num_bytes, header_length=0):
+    def get_lump_data(self, reader_name, lump_index, num_bytes, header_length=0):
         lump_info = self.reader.directory[lump_index]
         count = lump_info['lump_size'] // num_bytes
-        data = []
-        for i in range(count):
-            offset = lump_info['lump_offset'] + i * num_bytes + header_length
-            data.append(reader_func(offset))
-        return data
-
-    def get_lump_index(self, lump_name):
-        for index, lump_info in enumerate(self.reader.directory):
-            if lump_name in lump_info.values():
-                return index
-        return False
+        offset = lump_info['lump_offset'] + header_length
+        # decode with the method of the reader of the file the lump comes from
+        lump_reader = self.reader.get_lump_reader(lump_index)
+        reader_func = getattr(lump_reader, reader_name)
+        return lump_reader.read_lump(reader_func, offset, count, num_bytes)
+
+    def get_lump_index(self, lump_name, namespace=None):
+        return self.reader.get_lump_index(lump_name, namespace)
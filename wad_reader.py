@@ -1,26 +1,111 @@
+import mmap
 import struct
 from pygame.math import Vector2 as vec2
 from data_types import *
 
 
 class WADReader:
+    # precompiled little-endian records
+    HEADER = struct.Struct('<4sii')
+    LUMP_INFO = struct.Struct('<ii8s')
+    TEXTURE_MAP = struct.Struct('<8sIHHIH')
+    PATCH_MAP = struct.Struct('<hhHHH')
+    PATCH_HEADER = struct.Struct('<HHhh')
+    PATCH_POST = struct.Struct('<BBB')
+    PALETTE = struct.Struct('<768B')
+    STRING = struct.Struct('<8s')
+    SECTOR = struct.Struct('<hh8s8sHHH')
+    SIDEDEF = struct.Struct('<hh8s8s8sH')
+    THING = struct.Struct('<hhHHH')
+    SEGMENT = struct.Struct('<6h')
+    SUB_SECTOR = struct.Struct('<2h')
+    NODE = struct.Struct('<12h2H')
+    LINEDEF = struct.Struct('<7H')
+    VERTEX = struct.Struct('<2h')
+
+    # namespace -> (start markers, end markers)
+    NAMESPACES = {
+        'sprites': (('S_START', 'SS_START'), ('S_END', 'SS_END')),
+        'flats': (('F_START', 'FF_START'), ('F_END', 'FF_END')),
+        'patches': (('P_START', 'PP_START'), ('P_END', 'PP_END')),
+    }
+
     def __init__(self, wad_path):
         self.wad_file = open(wad_path, 'rb')
+        self.buffer = mmap.mmap(self.wad_file.fileno(), 0, access=mmap.ACCESS_READ)
         self.header = self.read_header()
         self.directory = self.read_directory()
+        self.lump_index, self.namespaces = self.build_lump_index(self.directory)
+        # record layouts used to decode a whole lump in one pass
+        self.records = {
+            self.read_vertex: (self.VERTEX, self.make_vertex),
+            self.read_linedef: (self.LINEDEF, self.make_linedef),
+            self.read_node: (self.NODE, self.make_node),
+            self.read_sub_sector: (self.SUB_SECTOR, self.make_sub_sector),
+            self.read_segment: (self.SEGMENT, self.make_segment),
+            self.read_thing: (self.THING, self.make_thing),
+            self.read_sidedef: (self.SIDEDEF, self.make_sidedef),
+            self.read_sector: (self.SECTOR, self.make_sector),
+            self.read_palette: (self.PALETTE, self.make_palette),
+            self.read_string: (self.STRING, self.decode_string),
+        }
 
-    def read_texture_map(self, offset):
-        read_2_bytes = self.read_2_bytes
-        read_4_bytes = self.read_4_bytes
-        read_string = self.read_string
+    def build_lump_index(self, directory):
+        # lump name -> all matching directory indices, in directory order
+        lump_index = {}
+        # namespace -> {lump name: directory index}, later lumps replace earlier ones
+        namespaces = {namespace: {} for namespace in self.NAMESPACES}
+
+        markers = {}
+        for namespace, (start_markers, end_markers) in self.NAMESPACES.items():
+            markers |= {marker: namespace for marker in start_markers}
+            markers |= {marker: None for marker in end_markers}
+
+        current_namespace = None
+        for index, lump_info in enumerate(directory):
+            lump_name = lump_info['lump_name']
+            lump_index.setdefault(lump_name, []).append(index)
+
+            if lump_name in markers:
+                current_namespace = markers[lump_name]
+            # skip the zero-sized sub-markers (F1_START, P2_END, ...)
+            elif current_namespace and lump_info['lump_size']:
+                namespaces[current_namespace][lump_name] = index
+        return lump_index, namespaces
+
+    def get_lump_index(self, lump_name, namespace=None):
+        # the last lump with a given name wins, as in DOOM
+        if namespace:
+            return self.namespaces[namespace].get(lump_name)
+        if indices := self.lump_index.get(lump_name):
+            return indices[-1]
+        return None
+
+    def get_namespace(self, namespace):
+        # {lump name: directory index} of the lumps between the namespace markers
+        return self.namespaces[namespace]
+
+    def get_lump_view(self, lump_index):
+        # zero-copy view of the lump data, nothing is read until it is accessed;
+        # release it (or use it in a with block) once decoded, keep copies only
+        lump_info = self.directory[lump_index]
+        offset = lump_info['lump_offset']
+        return memoryview(self.buffer)[offset: offset + lump_info['lump_size']]
+
+    def read_lump(self, reader_func, offset, count, num_bytes):
+        # decode count records of num_bytes each with a single iter_unpack
+        record, make_record = self.records.get(reader_func, (None, None))
+        if record is None or record.size != num_bytes:
+            return [reader_func(offset + i * num_bytes) for i in range(count)]
+
+        data = self.buffer[offset: offset + count * num_bytes]
+        return [make_record(*values) for values in record.iter_unpack(data)]
 
+    def read_texture_map(self, offset):
         tex_map = TextureMap()
-        tex_map.name = read_string(offset + 0, num_bytes=8)
-        tex_map.flags = read_4_bytes(offset + 8, byte_format='I')
-        tex_map.width = read_2_bytes(offset + 12, byte_format='H')
-        tex_map.height = read_2_bytes(offset + 14, byte_format='H')
-        tex_map.column_dir = read_4_bytes(offset + 16, byte_format='I')  # unused
-        tex_map.patch_count = read_2_bytes(offset + 20, byte_format='H')
+        (name, tex_map.flags, tex_map.width, tex_map.height,
+         tex_map.column_dir, tex_map.patch_count) = self.TEXTURE_MAP.unpack_from(self.buffer, offset)
+        tex_map.name = self.decode_string(name)
 
         tex_map.patch_maps = []
         for i in range(tex_map.patch_count):
@@ -32,200 +117,197 @@ class WADReader:
 
     def read_patch_map(self, offset):
         # defining how the patch should be drawn inside the texture
-        read_2_bytes = self.read_2_bytes
-
         patch_map = PatchMap()
-        patch_map.x_offset = read_2_bytes(offset + 0, byte_format='h')
-        patch_map.y_offset = read_2_bytes(offset + 2, byte_format='h')
-        patch_map.p_name_index = read_2_bytes(offset + 4, byte_format='H')
-        patch_map.step_dir = read_2_bytes(offset + 6, byte_format='H')  # unused
-        patch_map.color_map = read_2_bytes(offset + 8, byte_format='H')  # unused
+        (patch_map.x_offset, patch_map.y_offset, patch_map.p_name_index,
+         patch_map.step_dir, patch_map.color_map) = self.PATCH_MAP.unpack_from(self.buffer, offset)
         return patch_map
 
     def read_texture_header(self, offset):
-        read_4_bytes = self.read_4_bytes
-
         tex_header = TextureHeader()
-        tex_header.texture_count = read_4_bytes(offset + 0, byte_format='I')
-        tex_header.texture_offset = read_4_bytes(offset + 4, byte_format='I')
+        tex_header.texture_count = self.read_4_bytes(offset + 0, byte_format='I')
+        tex_header.texture_offset = self.read_4_bytes(offset + 4, byte_format='I')
 
-        tex_header.texture_data_offset = []
-        for i in range(tex_header.texture_count):
-            tex_header.texture_data_offset.append(read_4_bytes(offset + 4 + i * 4,
-                                                               byte_format='I'))
+        tex_header.texture_data_offset = list(struct.unpack_from(
+            f'<{tex_header.texture_count}I', self.buffer, offset + 4))
         return tex_header
 
     def read_patch_column(self, offset):
-        read_1_byte = self.read_1_byte
-
         patch_column = PatchColumn()
-        patch_column.top_delta = read_1_byte(offset + 0)
+        patch_column.top_delta = self.buffer[offset]
 
         if patch_column.top_delta != 0xFF:
-            patch_column.length = read_1_byte(offset + 1)
-            patch_column.padding_pre = read_1_byte(offset + 2)  # unused
+            _, patch_column.length, patch_column.padding_pre = self.PATCH_POST.unpack_from(
+                self.buffer, offset)
 
-            patch_column.data = []
-            for i in range(patch_column.length):
-                patch_column.data.append(read_1_byte(offset + 3 + i))
-            patch_column.padding_post = read_1_byte(offset + 3 + patch_column.length)  # unused
+            data_start = offset + 3
+            patch_column.data = self.buffer[data_start: data_start + patch_column.length]
+            patch_column.padding_post = self.buffer[data_start + patch_column.length]  # unused
 
             return patch_column, offset + 4 + patch_column.length
 
         return patch_column, offset + 1
 
     def read_patch_header(self, offset):
-        read_2_bytes = self.read_2_bytes
-        read_4_bytes = self.read_4_bytes
-
         patch_header = PatchHeader()
-        patch_header.width = read_2_bytes(offset + 0, byte_format='H')
-        patch_header.height = read_2_bytes(offset + 2, byte_format='H')
-        patch_header.left_offset = read_2_bytes(offset + 4, byte_format='h')
-        patch_header.top_offset = read_2_bytes(offset + 6, byte_format='h')
-
-        patch_header.column_offset = []
-        for i in range(patch_header.width):
-            patch_header.column_offset.append(read_4_bytes(offset + 8 + 4 * i, byte_format='I'))
+        (patch_header.width, patch_header.height, patch_header.left_offset,
+         patch_header.top_offset) = self.PATCH_HEADER.unpack_from(self.buffer, offset)
+
+        patch_header.column_offset = list(struct.unpack_from(
+            f'<{patch_header.width}I', self.buffer, offset + 8))
         return patch_header
 
     def read_palette(self, offset):
-        # 3 bytes = B + B + B
-        read_1_byte = self.read_1_byte
-
-        palette = []
-        for i in range(256):
-            r = read_1_byte(offset + i * 3 + 0)
-            g = read_1_byte(offset + i * 3 + 1)
-            b = read_1_byte(offset + i * 3 + 2)
-            palette.append((r, g, b),)
-        return palette
+        # 256 x 3 bytes = B + B + B
+        return self.make_palette(*self.PALETTE.unpack_from(self.buffer, offset))
 
     def read_sector(self, offset):
         # 26 bytes = 2h + 2h + 8c + 8c + 2H x 3
-        read_2_bytes = self.read_2_bytes
-        read_string = self.read_string
-
-        sector = Sector()
-        sector.floor_height = read_2_bytes(offset, byte_format='h')
-        sector.ceil_height = read_2_bytes(offset + 2, byte_format='h')
-        sector.floor_texture = read_string(offset + 4, num_bytes=8)
-        sector.ceil_texture = read_string(offset + 12, num_bytes=8)
-        sector.light_level = read_2_bytes(offset + 20, byte_format='H') / 255.0
-        sector.type = read_2_bytes(offset + 22, byte_format='H')
-        sector.tag = read_2_bytes(offset + 24, byte_format='H')
-        return sector
+        return self.make_sector(*self.SECTOR.unpack_from(self.buffer, offset))
 
     def read_sidedef(self, offset):
         # 30 bytes = 2h + 2h + 8c + 8c + 8c + 2H
-        read_2_bytes = self.read_2_bytes
-        read_string = self.read_string
-
-        sidedef = Sidedef()
-        sidedef.x_offset = read_2_bytes(offset, byte_format='h')
-        sidedef.y_offset = read_2_bytes(offset + 2, byte_format='h')
-        sidedef.upper_texture = read_string(offset + 4, num_bytes=8)
-        sidedef.lower_texture = read_string(offset + 12, num_bytes=8)
-        sidedef.middle_texture = read_string(offset + 20, num_bytes=8)
-        sidedef.sector_id = read_2_bytes(offset + 28, byte_format='H')
-        return sidedef
+        return self.make_sidedef(*self.SIDEDEF.unpack_from(self.buffer, offset))
 
     def read_thing(self, offset):
         # 10 bytes = 2h + 2h + 2H x 3
-        read_2_bytes = self.read_2_bytes
+        return self.make_thing(*self.THING.unpack_from(self.buffer, offset))
+
+    def read_segment(self, offset):
+        # 12 bytes = 2h x 6
+        return self.make_segment(*self.SEGMENT.unpack_from(self.buffer, offset))
+
+    def read_sub_sector(self, offset):
+        # 4 bytes = 2h + 2h
+        return self.make_sub_sector(*self.SUB_SECTOR.unpack_from(self.buffer, offset))
+
+    def read_node(self, offset):
+        # 28 bytes = 2h x 12 + 2H x 2
+        return self.make_node(*self.NODE.unpack_from(self.buffer, offset))
+
+    def read_linedef(self, offset):
+        # 14 bytes = 2H x 7
+        return self.make_linedef(*self.LINEDEF.unpack_from(self.buffer, offset))
+
+    def read_vertex(self, offset):
+        # 4 bytes = 2h + 2h
+        return self.make_vertex(*self.VERTEX.unpack_from(self.buffer, offset))
+
+    def make_sector(self, floor_height, ceil_height, floor_texture, ceil_texture,
+                    light_level, sector_type, tag):
+        sector = Sector()
+        sector.floor_height = floor_height
+        sector.ceil_height = ceil_height
+        sector.floor_texture = self.decode_string(floor_texture)
+        sector.ceil_texture = self.decode_string(ceil_texture)
+        sector.light_level = light_level / 255.0
+        sector.type = sector_type
+        sector.tag = tag
+        return sector
 
+    def make_sidedef(self, x_offset, y_offset, upper_texture, lower_texture,
+                     middle_texture, sector_id):
+        sidedef = Sidedef()
+        sidedef.x_offset = x_offset
+        sidedef.y_offset = y_offset
+        sidedef.upper_texture = self.decode_string(upper_texture)
+        sidedef.lower_texture = self.decode_string(lower_texture)
+        sidedef.middle_texture = self.decode_string(middle_texture)
+        sidedef.sector_id = sector_id
+        return sidedef
+
+    @staticmethod
+    def make_thing(x, y, angle, thing_type, flags):
         thing = Thing()
-        x = read_2_bytes(offset, byte_format='h')
-        y = read_2_bytes(offset + 2, byte_format='h')
-        thing.angle = read_2_bytes(offset + 4, byte_format='H')
-        thing.type = read_2_bytes(offset + 6, byte_format='H')
-        thing.flags = read_2_bytes(offset + 8, byte_format='H')
+        thing.angle = angle
+        thing.type = thing_type
+        thing.flags = flags
         thing.pos = vec2(x, y)
         return thing
 
-    def read_segment(self, offset):
-        # 12 bytes = 2h x 6
-        read_2_bytes = self.read_2_bytes
-
+    @staticmethod
+    def make_segment(start_vertex_id, end_vertex_id, angle, linedef_id, direction, offset):
         seg = Seg()
-        seg.start_vertex_id = read_2_bytes(offset, byte_format='h')
-        seg.end_vertex_id = read_2_bytes(offset + 2, byte_format='h')
-        seg.angle = read_2_bytes(offset + 4, byte_format='h')
-        seg.linedef_id = read_2_bytes(offset + 6, byte_format='h')
-        seg.direction = read_2_bytes(offset + 8, byte_format='h')
-        seg.offset = read_2_bytes(offset + 10, byte_format='h')
+        seg.start_vertex_id = start_vertex_id
+        seg.end_vertex_id = end_vertex_id
+        seg.angle = angle
+        seg.linedef_id = linedef_id
+        seg.direction = direction
+        seg.offset = offset
         return seg
 
-    def read_sub_sector(self, offset):
-        # 4 bytes = 2h + 2h
-        read_2_bytes = self.read_2_bytes
-
+    @staticmethod
+    def make_sub_sector(seg_count, first_seg_id):
         sub_sector = SubSector()
-        sub_sector.seg_count = read_2_bytes(offset, byte_format='h')
-        sub_sector.first_seg_id = read_2_bytes(offset + 2, byte_format='h')
+        sub_sector.seg_count = seg_count
+        sub_sector.first_seg_id = first_seg_id
         return sub_sector
 
-    def read_node(self, offset):
-        # 28 bytes = 2h x 12 + 2H x 2
-        read_2_bytes = self.read_2_bytes
-
+    @staticmethod
+    def make_node(x_partition, y_partition, dx_partition, dy_partition,
+                  front_top, front_bottom, front_left, front_right,
+                  back_top, back_bottom, back_left, back_right,
+                  front_child_id, back_child_id):
         node = Node()
-        node.x_partition = read_2_bytes(offset, byte_format='h')
-        node.y_partition = read_2_bytes(offset + 2, byte_format='h')
-        node.dx_partition = read_2_bytes(offset + 4, byte_format='h')
-        node.dy_partition = read_2_bytes(offset + 6, byte_format='h')
-
-        node.bbox['front'].top = read_2_bytes(offset + 8, byte_format='h')
-        node.bbox['front'].bottom = read_2_bytes(offset + 10, byte_format='h')
-        node.bbox['front'].left = read_2_bytes(offset + 12, byte_format='h')
-        node.bbox['front'].right = read_2_bytes(offset + 14, byte_format='h')
-
-        node.bbox['back'].top = read_2_bytes(offset + 16, byte_format='h')
-        node.bbox['back'].bottom = read_2_bytes(offset + 18, byte_format='h')
-        node.bbox['back'].left = read_2_bytes(offset + 20, byte_format='h')
-        node.bbox['back'].right = read_2_bytes(offset + 22, byte_format='h')
-
-        node.front_child_id = read_2_bytes(offset + 24, byte_format='H')
-        node.back_child_id = read_2_bytes(offset + 26, byte_format='H')
+        node.x_partition = x_partition
+        node.y_partition = y_partition
+        node.dx_partition = dx_partition
+        node.dy_partition = dy_partition
+
+        node.bbox['front'].top = front_top
+        node.bbox['front'].bottom = front_bottom
+        node.bbox['front'].left = front_left
+        node.bbox['front'].right = front_right
+
+        node.bbox['back'].top = back_top
+        node.bbox['back'].bottom = back_bottom
+        node.bbox['back'].left = back_left
+        node.bbox['back'].right = back_right
+
+        node.front_child_id = front_child_id
+        node.back_child_id = back_child_id
         return node
 
-    def read_linedef(self, offset):
-        # 14 bytes = 2H x 7
-        read_2_bytes = self.read_2_bytes
-
+    @staticmethod
+    def make_linedef(start_vertex_id, end_vertex_id, flags, line_type, sector_tag,
+                     front_sidedef_id, back_sidedef_id):
         linedef = Linedef()
-        linedef.start_vertex_id = read_2_bytes(offset, byte_format='H')
-        linedef.end_vertex_id = read_2_bytes(offset + 2, byte_format='H')
-        linedef.flags = read_2_bytes(offset + 4, byte_format='H')
-        linedef.line_type = read_2_bytes(offset + 6, byte_format='H')
-        linedef.sector_tag = read_2_bytes(offset + 8, byte_format='H')
-        linedef.front_sidedef_id = read_2_bytes(offset + 10, byte_format='H')
-        linedef.back_sidedef_id = read_2_bytes(offset + 12, byte_format='H')
+        linedef.start_vertex_id = start_vertex_id
+        linedef.end_vertex_id = end_vertex_id
+        linedef.flags = flags
+        linedef.line_type = line_type
+        linedef.sector_tag = sector_tag
+        linedef.front_sidedef_id = front_sidedef_id
+        linedef.back_sidedef_id = back_sidedef_id
         return linedef
 
-    def read_vertex(self, offset):
-        # 4 bytes = 2h + 2h
-        x = self.read_2_bytes(offset, byte_format='h')
-        y = self.read_2_bytes(offset + 2, byte_format='h')
+    @staticmethod
+    def make_vertex(x, y):
         return vec2(x, y)
 
+    @staticmethod
+    def make_palette(*colors):
+        return list(zip(colors[0::3], colors[1::3], colors[2::3]))
+
     def read_directory(self):
+        offset = self.header['init_offset']
+        data = self.buffer[offset: offset + self.header['lump_count'] * self.LUMP_INFO.size]
+
         directory = []
-        for i in range(self.header['lump_count']):
-            offset = self.header['init_offset'] + i * 16
+        for lump_offset, lump_size, lump_name in self.LUMP_INFO.iter_unpack(data):
             lump_info = {
-                'lump_offset': self.read_4_bytes(offset),
-                'lump_size': self.read_4_bytes(offset + 4),
-                'lump_name': self.read_string(offset + 8, num_bytes=8)
+                'lump_offset': lump_offset,
+                'lump_size': lump_size,
+                'lump_name': self.decode_string(lump_name)
             }
             directory.append(lump_info)
         return directory
 
     def read_header(self):
+        wad_type, lump_count, init_offset = self.HEADER.unpack_from(self.buffer, 0)
         return {
-            'wad_type': self.read_string(offset=0, num_bytes=4),
-            'lump_count': self.read_4_bytes(offset=4),
-            'init_offset': self.read_4_bytes(offset=8)
+            'wad_type': self.decode_string(wad_type),
+            'lump_count': lump_count,
+            'init_offset': init_offset
         }
 
     def read_1_byte(self, offset, byte_format='B'):
@@ -242,14 +324,19 @@ class WADReader:
 
     def read_string(self, offset, num_bytes=8):
         # c - char
-        return ''.join(b.decode('ascii') for b in
-                       self.read_bytes(offset, num_bytes, byte_format='c' * num_bytes)
-                       if ord(b) != 0).upper()
+        return self.decode_string(self.buffer[offset: offset + num_bytes])
+
+    @staticmethod
+    def decode_string(raw):
+        return raw.replace(b'\x00', b'').decode('ascii').upper()
 
     def read_bytes(self, offset, num_bytes, byte_format):
-        self.wad_file.seek(offset)
-        buffer = self.wad_file.read(num_bytes)
-        return struct.unpack(byte_format, buffer)
+        return struct.unpack_from('<' + byte_format, self.buffer, offset)
 
     def close(self):
+        # a lump view still alive keeps the mapping, it is unmapped with the last one
+        try:
+            self.buffer.close()
+        except BufferError:
+            pass
         self.wad_file.close()
@@ -0,0 +1,37 @@
+from wad_reader import WADReader
+
+
+class WADStack:
+    # an IWAD followed by PWADs, read as one WAD: the directories are
+    # concatenated in load order, so a lump of a later file wins over
+    # every earlier lump with the same name
+    NAMESPACES = WADReader.NAMESPACES
+    build_lump_index = WADReader.build_lump_index
+    get_lump_index = WADReader.get_lump_index
+    get_namespace = WADReader.get_namespace
+
+    def __init__(self, wad_paths):
+        self.readers = [WADReader(wad_path) for wad_path in wad_paths]
+        self.directory = [
+            lump_info | {'wad_id': wad_id}
+            for wad_id, reader in enumerate(self.readers) for lump_info in reader.directory
+        ]
+        self.lump_index, self.namespaces = self.build_lump_index(self.directory)
+
+    def get_lump_reader(self, lump_index):
+        # reader of the file the lump comes from, its offsets are relative to that file
+        return self.readers[self.directory[lump_index]['wad_id']]
+
+    def get_lump_indices(self, lump_name):
+        # every lump with that name, in load order
+        return self.lump_index.get(lump_name, [])
+
+    def get_lump_view(self, lump_index):
+        lump_info = self.directory[lump_index]
+        offset = lump_info['lump_offset']
+        buffer = self.get_lump_reader(lump_index).buffer
+        return memoryview(buffer)[offset: offset + lump_info['lump_size']]
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()